@@ -1,16 +1,25 @@
 import os
 import logging
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, session, flash, jsonify, send_file
 from config import validate_environment_variables
-from database import get_conn, setup_database, insert_database
-from log_parser import parse_log
-from scheduler import update_job, run_scheduler
-from auth import authenticate, login_required
+from database import get_conn, setup_database, detect_schema, request_import, load_import_status, configure_pool, pool_status, report_filters, report_order, report_seek, report_cursor, report_count, dashboard_totals, REPORT_COLUMNS, REPORT_CURSOR_RE, EXPORT_COLUMNS, EXPORT_HEADER
+from scheduler import start_import, import_status, run_scheduler, run_maintenance
+from report_cache import configure_cache, ingest_generation, generation_tag, cache_get, cache_put
+from live_feed import subscribe, unsubscribe, run_live_feed, LIVE_HEARTBEAT_SECONDS
+from auth import authenticate, login_required, api_login_required
 from datetime import datetime, timedelta
 import pytz
 import threading
+import hashlib
 import csv
 import io
+import json
+import queue
+import re
+import time
+import zlib
+import uuid
+import tempfile
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
@@ -32,6 +41,17 @@ try:
     TZ = env_vars['TZ']
     SCHEDULE_TYPE = env_vars['SCHEDULE_TYPE']
     DB_PORT = env_vars['DB_PORT']
+    IMPORT_BATCH_SIZE = env_vars['IMPORT_BATCH_SIZE']
+    IMPORT_WORKERS = env_vars['IMPORT_WORKERS']
+    SEARCH_MODE = env_vars['SEARCH_MODE']
+    DB_PARTITIONING = env_vars['DB_PARTITIONING']
+    RETENTION_MONTHS = env_vars['RETENTION_MONTHS']
+    RETENTION_MODE = env_vars['RETENTION_MODE']
+    STORAGE_MODE = env_vars['STORAGE_MODE']
+    PRINT_MAX_ROWS = env_vars['PRINT_MAX_ROWS']
+    INGEST_MODE = env_vars['INGEST_MODE']
+    configure_pool(env_vars['DB_POOL_SIZE'], env_vars['DB_POOL_TIMEOUT'], env_vars['DB_POOL_RECYCLE'])
+    configure_cache(env_vars['REPORT_CACHE'], env_vars['REPORT_CACHE_SIZE'], env_vars['REPORT_CACHE_PATH'])
     if AUTH_MODE == 'AD':
         LDAP_HOST = env_vars['LDAP_HOST']
         LDAP_DOMAIN = env_vars['LDAP_DOMAIN']
@@ -50,12 +70,34 @@ try:
         serializer = URLSafeTimedSerializer(app.secret_key)
     if SCHEDULE_TYPE == 'minutes':
         SCHEDULE_INTERVAL_MINUTES = env_vars['SCHEDULE_INTERVAL_MINUTES']
+    elif SCHEDULE_TYPE == 'follow':
+        FOLLOW_MAX_LATENCY_SECONDS = env_vars['FOLLOW_MAX_LATENCY_SECONDS']
+        FOLLOW_MIN_BATCH_BYTES = env_vars['FOLLOW_MIN_BATCH_BYTES']
     else:
         SCHEDULE_TIME = env_vars['SCHEDULE_TIME']
 except EnvironmentError as e:
     logging.error(str(e))
     exit(1)
 
+# Linhas por página do relatório e, na consulta por since_id de /api/report, padrão e máximo por resposta
+REPORT_PAGE_SIZE = 50
+API_DELTA_LIMIT = 500
+API_DELTA_MAX = 5000
+
+# Exportação CSV em streaming: linhas lidas do banco por bloco e tempo máximo (s) que o servidor
+# MySQL espera o download avançar antes de abortar a consulta
+EXPORT_FETCH_ROWS = 1000
+EXPORT_NET_WRITE_TIMEOUT = 3600
+
+# Relatório para impressão gerado em segundo plano (sem o limite PRINT_MAX_ROWS): arquivos e jobs
+# concluídos são descartados após PRINT_JOBS_TTL_SECONDS. Cada job tem, ao lado do HTML, um JSON
+# com a situação, para que qualquer processo da web (gunicorn com vários workers) o encontre.
+PRINT_JOBS_DIR = os.path.join(tempfile.gettempdir(), 'smtp_print_jobs')
+PRINT_JOBS_TTL_SECONDS = 24 * 3600
+PRINT_JOB_PROGRESS_SECONDS = 2  # intervalo mínimo entre gravações do progresso no JSON
+PRINT_JOB_STALE_SECONDS = 600   # job 'running' sem progresso há mais que isso foi interrompido (ex.: reinício)
+PRINT_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
 @app.after_request
 def add_no_cache_headers(response):
     if request.path == '/':
@@ -174,102 +216,196 @@ def logout():
     flash('Logout realizado com sucesso.')
     return redirect(url_for('login'))
 
-@app.route('/')
-@login_required
-def index():
-    page = request.args.get('page', 1, type=int)
-    per_page = 50
-    start_date = request.args.get('start_date', datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d'))
-    end_date = request.args.get('end_date', datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d'))
+def report_args():
+    """
+    Filtros do relatório lidos da query string, os mesmos para a página e para /api/report.
+    Sem start_date/end_date o filtro é o dia de hoje. ValueError se a data ou a hora for inválida.
+    """
+    today = datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d')
+    start_date = request.args.get('start_date', today)
+    end_date = request.args.get('end_date', today)
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
-    search_email = request.args.get('search_email')
-    search_subject = request.args.get('search_subject')
-    status_filter = request.args.get('status_filter', 'all')
-    sort_by = request.args.get('sort_by', 'date')
-    sort_order = request.args.get('sort_order', 'desc')
-    auto_refresh = request.args.get('auto_refresh', 'false') == 'true'
 
-    use_date_filter = start_date and end_date
-    use_time_filter = start_time and end_time
-
-    if use_date_filter:
+    if start_date and end_date:
         try:
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         except ValueError:
-            flash('Formato de data inválido.')
-            return redirect(url_for('index'))
+            raise ValueError('Formato de data inválido.')
+    else:
+        start_date = end_date = None
 
-    if use_time_filter:
+    if start_time and end_time:
         try:
             start_time = datetime.strptime(start_time, '%H:%M').time()
             end_time = datetime.strptime(end_time, '%H:%M').time()
         except ValueError:
-            flash('Formato de hora inválido.')
-            return redirect(url_for('index'))
+            raise ValueError('Formato de hora inválido.')
+    else:
+        start_time = end_time = None
 
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'start_time': start_time,
+        'end_time': end_time,
+        'search_email': request.args.get('search_email'),
+        'search_subject': request.args.get('search_subject'),
+        'status_filter': request.args.get('status_filter', 'all'),
+        'search_mode': 'substring' if request.args.get('search_mode') == 'substring' else SEARCH_MODE,
+        'sort_by': request.args.get('sort_by', 'date'),
+        'sort_order': request.args.get('sort_order', 'desc'),
+    }
+
+def report_where(filters):
+    """WHERE do relatório para `filters` (de report_args): (where, params, intervalo para as somas diárias)."""
+    where, params = report_filters(filters['start_date'], filters['end_date'], filters['start_time'], filters['end_time'],
+                                   filters['search_email'], filters['search_subject'], filters['status_filter'],
+                                   filters['search_mode'])
+    only_dates = (filters['start_date'] and not filters['start_time']
+                  and not filters['search_email'] and not filters['search_subject'])
+    return where, params, (filters['start_date'], filters['end_date']) if only_dates else None
+
+def cache_key(kind, *parts):
+    return f"{kind}:" + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def latest_id(conn):
+    """Maior id de email_logs (leitura O(1) pelo índice): o ponto de partida das consultas por since_id."""
+    cur = conn.cursor()
     try:
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM email_logs")
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+
+def report_page(filters, page=1, cursor=None, direction='next'):
+    """
+    Uma página do relatório para `filters` (de report_args), paginada por chave a partir de `cursor`.
+    Contagem e linhas vêm do cache enquanto nada for importado (ex.: auto refresh), sem ir ao MySQL.
+    Retorna dict com logs, page, total_pages, total, count_capped, next_cursor, prev_cursor e
+    latest_id (maior id gravado quando a página foi lida).
+    """
+    per_page = REPORT_PAGE_SIZE
+    if not REPORT_CURSOR_RE.match(cursor or ''):
+        page = 1
+    sort_by = filters['sort_by']
+    where, params, rollup_range = report_where(filters)
+    # Paginação por chave: lê a partir do cursor (uma linha a mais indica se há outra página)
+    seek_where, seek_params, order_by, reverse = report_seek(where, params, sort_by, filters['sort_order'], cursor, direction)
+
+    # A contagem não reconta email_logs: somas diárias se o filtro é só de data/status, senão
+    # limitada a COUNT_CAP.
+    generation = ingest_generation()
+    count_key = cache_key('count', where, [str(p) for p in params], rollup_range, filters['status_filter'])
+    page_key = cache_key('page', seek_where, [str(p) for p in seek_params], order_by, per_page)
+    counted = cache_get(count_key, generation)
+    cached_page = cache_get(page_key, generation)
+    if counted is None or cached_page is None:
         conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-        cur = conn.cursor(dictionary=True)
-        count_query = "SELECT COUNT(*) as total FROM email_logs"
-        params = []
-        where = []
-        if use_date_filter:
-            where.append("log_date BETWEEN %s AND %s")
-            params.extend([start_date, end_date])
-        if use_time_filter:
-            where.append("log_time BETWEEN %s AND %s")
-            params.extend([start_time, end_time])
-        if search_email:
-            where.append("to_email LIKE %s")
-            params.append(f"%{search_email}%")
-        if search_subject:
-            where.append("subject LIKE %s")
-            params.append(f"%{search_subject}%")
-        if status_filter == 'failed':
-            where.append("status != 'sent'")
-        if where:
-            count_query += " WHERE " + " AND ".join(where)
-        cur.execute(count_query, params)
-        total = cur.fetchone()['total']
-        total_pages = (total + per_page - 1) // per_page
-
-        query = "SELECT id, message_id, log_date, log_time, from_email, to_email, subject, status, origin_host, origin_ip FROM email_logs"
-        if where:
-            query += " WHERE " + " AND ".join(where)
-
-        order_direction = "ASC" if sort_order == 'asc' else "DESC"
-        if sort_by == 'date':
-            query += f" ORDER BY log_date {order_direction}, id {order_direction}"
-        elif sort_by == 'time':
-            query += f" ORDER BY log_time {order_direction}, id {order_direction}"
-        else:
-            query += f" ORDER BY log_date DESC, id DESC"
+        try:
+            if counted is None:
+                counted = report_count(conn, where, params, rollup_range, filters['status_filter'])
+                cache_put(count_key, counted, generation)
+            if cached_page is None:
+                # O maior id é lido antes da página: uma linha gravada entre as duas leituras volta
+                # repetida na consulta por since_id, em vez de se perder
+                newest = latest_id(conn)
+                cur = conn.cursor(dictionary=True)
+                cur.execute(f"SELECT {REPORT_COLUMNS} FROM email_logs" + seek_where + order_by + " LIMIT %s",
+                            seek_params + [per_page + 1])
+                cached_page = (newest, cur.fetchall())
+                cur.close()
+                cache_put(page_key, cached_page, generation)
+        finally:
+            conn.close()
+    total, count_capped = counted
+    newest, logs = cached_page
 
-        query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
+    has_more = len(logs) > per_page
+    logs = logs[:per_page]
+    if reverse:
+        logs = logs[::-1]
+    if not logs or (reverse and not has_more):
+        page = 1
+    # Indo para trás, a página seguinte sempre existe (é a de onde se veio)
+    has_next = has_more if not reverse else True
+    has_prev = page > 1 and (has_more if reverse else True)
+    return {
+        'logs': logs,
+        'page': page,
+        'total_pages': (total + per_page - 1) // per_page,
+        'total': total,
+        'count_capped': count_capped,
+        'next_cursor': report_cursor(logs[-1], sort_by) if logs and has_next else None,
+        'prev_cursor': report_cursor(logs[0], sort_by) if logs and has_prev else None,
+        'latest_id': newest,
+    }
 
-        cur.execute(query, params)
-        logs = cur.fetchall()
-        cur.close()
-        conn.close()
+def report_delta(filters, since_id, limit):
+    """
+    Linhas de `filters` gravadas depois de `since_id`, em ordem de id (até limit + 1: a última só
+    indica que há mais). Como a importação só insere, o id crescente basta para achar as novas.
+    """
+    where, params, _ = report_where(filters)
+    generation = ingest_generation()
+    key = cache_key('delta', where, [str(p) for p in params], since_id, limit)
+    rows = cache_get(key, generation)
+    if rows is None:
+        conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(f"SELECT {REPORT_COLUMNS} FROM email_logs" + (where + " AND" if where else " WHERE")
+                        + " id > %s ORDER BY id LIMIT %s", params + [since_id, limit + 1])
+            rows = cur.fetchall()
+            cur.close()
+        finally:
+            conn.close()
+        cache_put(key, rows, generation)
+    return rows
+
+def api_row(row):
+    """Linha do relatório com tipos do JSON: data ISO (AAAA-MM-DD) e hora HH:MM:SS."""
+    seconds = int(row['log_time'].total_seconds())
+    return dict(row, log_date=row['log_date'].isoformat(),
+                log_time=f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}")
+
+@app.route('/')
+@login_required
+def index():
+    try:
+        filters = report_args()
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('index'))
+    auto_refresh = request.args.get('auto_refresh', 'false') == 'true'
+    today = datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d')
 
+    try:
+        result = report_page(filters, max(request.args.get('page', 1, type=int), 1),
+                             request.args.get('cursor'), request.args.get('direction', 'next'))
+        total, count_capped = result['total'], result['count_capped']
         now = datetime.now(pytz.timezone(TZ)).strftime('%d/%m/%Y %H:%M:%S')
 
         return render_template('report.html',
-                               logs=logs,
-                               page=page,
-                               total_pages=total_pages,
-                               start_date=start_date.strftime('%Y-%m-%d') if use_date_filter else datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d'),
-                               end_date=end_date.strftime('%Y-%m-%d') if use_date_filter else datetime.now(pytz.timezone(TZ)).strftime('%Y-%m-%d'),
-                               start_time=start_time.strftime('%H:%M') if use_time_filter else '',
-                               end_time=end_time.strftime('%H:%M') if use_time_filter else '',
-                               search_email=search_email or '',
-                               search_subject=search_subject or '',
-                               status_filter=status_filter,
-                               sort_by=sort_by,
-                               sort_order=sort_order,
+                               logs=result['logs'],
+                               page=result['page'],
+                               total_pages=result['total_pages'],
+                               total_records=f"mais de {total:,}".replace(',', '.') if count_capped else total,
+                               count_capped=count_capped,
+                               next_cursor=result['next_cursor'],
+                               prev_cursor=result['prev_cursor'],
+                               latest_id=result['latest_id'],
+                               start_date=filters['start_date'].strftime('%Y-%m-%d') if filters['start_date'] else today,
+                               end_date=filters['end_date'].strftime('%Y-%m-%d') if filters['end_date'] else today,
+                               start_time=filters['start_time'].strftime('%H:%M') if filters['start_time'] else '',
+                               end_time=filters['end_time'].strftime('%H:%M') if filters['end_time'] else '',
+                               search_email=filters['search_email'] or '',
+                               search_subject=filters['search_subject'] or '',
+                               status_filter=filters['status_filter'],
+                               search_mode=filters['search_mode'],
+                               sort_by=filters['sort_by'],
+                               sort_order=filters['sort_order'],
                                auto_refresh=auto_refresh,
                                auth_mode=AUTH_MODE,
                                now=now)
@@ -277,16 +413,192 @@ def index():
         flash(f'Erro ao consultar o banco de dados: {e}')
         return redirect(url_for('index'))
 
+@app.route('/api/report')
+@api_login_required
+def api_report():
+    """
+    O relatório em JSON, com os mesmos filtros da página. Sem since_id devolve uma página (page,
+    cursor, direction, como em index); com since_id, só as linhas gravadas depois daquele id (até
+    limit), para quem acompanha o relatório. A ETag muda a cada importação: com If-None-Match
+    igual, a resposta é 304 sem consultar o banco.
+    """
+    try:
+        filters = report_args()
+        since_id = request.args.get('since_id', type=int)
+        limit = min(max(request.args.get('limit', API_DELTA_LIMIT, type=int), 1), API_DELTA_MAX)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Os filtros já resolvidos entram na ETag: sem datas, "hoje" muda à meia-noite sem importação
+    etag = hashlib.sha1(repr((generation_tag(), sorted((k, str(v)) for k, v in filters.items()),
+                              request.args.get('page'), request.args.get('cursor'), request.args.get('direction'),
+                              since_id, limit)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        try:
+            if since_id is not None:
+                rows = report_delta(filters, since_id, limit)
+                data = {
+                    'rows': [api_row(row) for row in rows[:limit]],
+                    'last_id': rows[:limit][-1]['id'] if rows else since_id,
+                    'has_more': len(rows) > limit,
+                }
+            else:
+                result = report_page(filters, max(request.args.get('page', 1, type=int), 1),
+                                     request.args.get('cursor'), request.args.get('direction', 'next'))
+                data = {key: value for key, value in result.items() if key != 'logs'}
+                data['rows'] = [api_row(row) for row in result['logs']]
+        except Exception as e:
+            logging.error(f"Erro em api_report: {e}")
+            return jsonify({'error': 'Erro ao consultar o banco de dados.'}), 500
+        response = jsonify(data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/report/stream')
+@api_login_required
+def api_report_stream():
+    """
+    Linhas novas do relatório, com os mesmos filtros da página, enviadas por server-sent events à
+    medida que a importação as grava (live_feed). Começa pelas gravadas depois de since_id (ou do
+    Last-Event-ID, quando o navegador reconecta). Eventos: 'rows' (JSON como em /api/report com
+    since_id) e 'reload' (mais linhas do que cabe enviar: recarregue o relatório).
+    """
+    try:
+        filters = report_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    since_id = request.headers.get('Last-Event-ID', type=int)
+    if since_id is None:
+        since_id = request.args.get('since_id', type=int)
+    # Inscreve antes da consulta inicial: o que for gravado depois dela chega pela fila
+    subscriber = subscribe(filters)
+    if subscriber is None:
+        return jsonify({'error': 'Limite de relatórios ao vivo atingido.'}), 503
+    return app.response_class(
+        stream_live_rows(subscriber, filters, since_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def sse_event(event, data, event_id=None):
+    """Um evento no formato text/event-stream."""
+    lines = [f"event: {event}"] + ([f"id: {event_id}"] if event_id is not None else [])
+    return "\n".join(lines + [f"data: {json.dumps(data)}"]) + "\n\n"
+
+def stream_live_rows(subscriber, filters, since_id):
+    """Gera os eventos de um assinante até o cliente desconectar; então o remove de live_feed."""
+    try:
+        sent_id = since_id or 0
+        if since_id is not None:
+            rows = report_delta(filters, since_id, API_DELTA_LIMIT)
+            if len(rows) > API_DELTA_LIMIT:
+                yield sse_event('reload', {})
+                return
+            if rows:
+                sent_id = rows[-1]['id']
+                yield sse_event('rows', {'rows': [api_row(row) for row in rows], 'last_id': sent_id}, sent_id)
+        while True:
+            try:
+                kind, rows = subscriber['queue'].get(timeout=LIVE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                kind, rows = None, None
+            if kind == 'reload' or subscriber['stale']:
+                yield sse_event('reload', {})
+                return
+            # Linhas que a consulta inicial já enviou podem vir de novo pela fila
+            rows = [row for row in rows or [] if row['id'] > sent_id]
+            if rows:
+                sent_id = rows[-1]['id']
+                yield sse_event('rows', {'rows': [api_row(row) for row in rows], 'last_id': sent_id}, sent_id)
+            elif kind is None:
+                # Comentário a cada LIVE_HEARTBEAT_SECONDS: mantém proxies abertos e detecta o cliente que saiu
+                yield ": ping\n\n"
+    finally:
+        unsubscribe(subscriber)
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    # Totais por dia, domínio do remetente e host de origem, lidos das tabelas de totais (sem varrer email_logs)
+    today = datetime.now(pytz.timezone(TZ)).date()
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date, end_date = today - timedelta(days=29), today
+    conn = None
+    try:
+        conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+        totals = dashboard_totals(conn, start_date, end_date)
+    except Exception as e:
+        flash(f'Erro ao consultar o banco de dados: {e}')
+        return redirect(url_for('index'))
+    finally:
+        if conn:
+            conn.close()
+    sent = sum(int(day['sent']) for day in totals['days'])
+    failed = sum(int(day['failed']) for day in totals['days'])
+    return render_template('dashboard.html', start_date=start_date.strftime('%Y-%m-%d'),
+                           end_date=end_date.strftime('%Y-%m-%d'), sent=sent, failed=failed,
+                           auth_mode=AUTH_MODE, **totals)
+
 @app.route('/import_emails', methods=['GET'])
 @login_required
 def import_emails():
-    rowcount = update_job(LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-    if rowcount is not False:
-        flash(f'{rowcount} novos logs importados com sucesso.')
+    # Só dispara a importação (ou acompanha a que já está rodando); o progresso fica em /import_status.
+    # Com INGEST_MODE=separate quem importa é o worker.py: aqui só fica registrado o pedido
+    if INGEST_MODE == 'separate':
+        conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+        try:
+            request_import(conn)
+        finally:
+            conn.close()
+        started = True
+        message = 'Importação solicitada ao worker de importação.'
     else:
-        flash('Nenhum novo log encontrado ou erro na importação.')
+        job, started = start_import(LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT, IMPORT_BATCH_SIZE,
+                                    IMPORT_WORKERS, trigger='manual')
+        message = 'Importação iniciada em segundo plano.'
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(current_import_status(), started=started)), 202
+    flash(message if started else 'Já há uma importação em andamento; acompanhe o progresso dela.')
     return redirect(url_for('index'))
 
+def current_import_status():
+    """import_status() deste processo ou, com INGEST_MODE=separate, o publicado pelo worker em import_control."""
+    if INGEST_MODE != 'separate':
+        return import_status() or {'running': False, 'phase': None}
+    conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+    try:
+        status, requested = load_import_status(conn)
+    finally:
+        conn.close()
+    # 'null' (publicado antes da primeira importação) conta como nenhuma importação
+    status = (json.loads(status) if status else None) or {'running': False, 'phase': None}
+    if requested and not status['running']:
+        # Pedido ainda não visto pelo worker (ele verifica a cada poucos segundos)
+        status = {'running': True, 'phase': 'aguardando o worker', 'file': None, 'messages': 0, 'inserted': 0}
+    return status
+
+@app.route('/import_status', methods=['GET'])
+@api_login_required
+def import_status_view():
+    # Fase, arquivo, mensagens lidas e registros gravados da importação atual (ou da última)
+    try:
+        return jsonify(current_import_status())
+    except Exception as e:
+        logging.error(f"Erro em import_status: {e}")
+        return jsonify({'error': 'Erro ao consultar a importação.'}), 500
+
+@app.route('/db_pool_status', methods=['GET'])
+@login_required
+def db_pool_status():
+    # Conexões em uso/ociosas e tempo de espera por conexão livre, para monitoração
+    return jsonify(pool_status())
+
 @app.route('/manage', methods=['GET'])
 @login_required
 def manage():
@@ -459,6 +771,7 @@ def print_report():
     search_email = request.args.get('search_email')
     search_subject = request.args.get('search_subject')
     status_filter = request.args.get('status_filter', 'all')
+    search_mode = 'substring' if request.args.get('search_mode') == 'substring' else SEARCH_MODE
     sort_by = request.args.get('sort_by', 'date')
     sort_order = request.args.get('sort_order', 'desc')
 
@@ -481,46 +794,158 @@ def print_report():
             flash('Formato de hora inválido.')
             return redirect(url_for('index'))
 
+    where, params = report_filters(start_date if use_date_filter else None, end_date if use_date_filter else None,
+                                   start_time if use_time_filter else None, end_time if use_time_filter else None,
+                                   search_email, search_subject, status_filter, search_mode)
+    query = f"SELECT {REPORT_COLUMNS} FROM email_logs" + where + report_order(sort_by, sort_order)
+    logo_url = url_for('static', filename='logo.png')
+
+    # Relatório completo, sem limite de linhas, gerado em segundo plano num arquivo
+    if request.args.get('offline') == '1':
+        job_id = start_print_job(query, params, session['username'], logo_url)
+        return redirect(url_for('print_job', job_id=job_id))
+
+    conn = None
     try:
         conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-        cur = conn.cursor(dictionary=True)
+        cur = conn.cursor(dictionary=True, buffered=False)
+        # Uma linha além do limite indica que o relatório foi cortado
+        cur.execute(query + " LIMIT %s", params + [PRINT_MAX_ROWS + 1])
+    except Exception as e:
+        if conn:
+            conn.discard()
+        return f"Erro ao consultar o banco de dados: {e}"
 
-        query = "SELECT id, message_id, log_date, log_time, from_email, to_email, subject, status, origin_host, origin_ip FROM email_logs"
-        params = []
-        where = []
-        if use_date_filter:
-            where.append("log_date BETWEEN %s AND %s")
-            params.extend([start_date, end_date])
-        if use_time_filter:
-            where.append("log_time BETWEEN %s AND %s")
-            params.extend([start_time, end_time])
-        if search_email:
-            where.append("to_email LIKE %s")
-            params.append(f"%{search_email}%")
-        if search_subject:
-            where.append("subject LIKE %s")
-            params.append(f"%{search_subject}%")
-        if status_filter == 'failed':
-            where.append("status != 'sent'")
-        if where:
-            query += " WHERE " + " AND ".join(where)
-
-        order_direction = "ASC" if sort_order == 'asc' else "DESC"
-        if sort_by == 'date':
-            query += f" ORDER BY log_date {order_direction}, id {order_direction}"
-        elif sort_by == 'time':
-            query += f" ORDER BY log_time {order_direction}, id {order_direction}"
+    # O template é gerado em streaming, à medida que as linhas saem do cursor
+    state = {'truncated': False}
+    offline_args = request.args.to_dict()
+    offline_args['offline'] = '1'
+    return app.response_class(stream_template(
+        'print_report.html', logs=stream_rows(conn, cur, PRINT_MAX_ROWS, state), state=state,
+        max_rows=PRINT_MAX_ROWS, offline_url=url_for('print_report', **offline_args),
+        logo_url=logo_url, signed_by=session['username']
+    ))
+
+def stream_rows(conn, cur, limit=None, state=None):
+    """
+    Gera as linhas do cursor lidas em blocos de EXPORT_FETCH_ROWS, no máximo `limit`; se houver mais,
+    marca state['truncated']. Devolve a conexão ao pool ao final, ou a fecha se a leitura for interrompida.
+    """
+    sent = 0
+    finished = False
+    try:
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                if limit is not None and sent >= limit:
+                    state['truncated'] = True
+                    continue
+                sent += 1
+                yield row
+        finished = True
+    finally:
+        if finished:
+            cur.close()
+            conn.close()
         else:
-            query += f" ORDER BY log_date DESC, id DESC"
+            conn.discard()
+
+def save_print_job(job):
+    """Grava a situação do job no JSON ao lado do HTML (substituição atômica: leitores nunca veem meio arquivo)."""
+    job['updated'] = time.time()
+    path = os.path.join(PRINT_JOBS_DIR, f"{job['id']}.json")
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
 
+def load_print_job(job_id):
+    """Situação do job `job_id` gravada por save_print_job, ou None se não existe."""
+    if not PRINT_JOB_ID_RE.match(job_id):
+        return None
+    try:
+        with open(os.path.join(PRINT_JOBS_DIR, f"{job_id}.json"), encoding='utf-8') as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job['status'] == 'running' and time.time() - job['updated'] > PRINT_JOB_STALE_SECONDS:
+        job['status'] = 'error'
+        job['error'] = 'geração interrompida (o servidor foi reiniciado?); gere o relatório de novo.'
+    return job
+
+def remove_expired_print_jobs(now):
+    """Apaga HTML e JSON de jobs com mais de PRINT_JOBS_TTL_SECONDS (de qualquer processo)."""
+    for name in os.listdir(PRINT_JOBS_DIR):
+        job_id, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        job = load_print_job(job_id)
+        if job and job['status'] != 'running' and now - job['started'] > PRINT_JOBS_TTL_SECONDS:
+            for path in (job['path'], os.path.join(PRINT_JOBS_DIR, name)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def start_print_job(query, params, username, logo_url):
+    """Inicia a geração do relatório para impressão em segundo plano; retorna o id do job."""
+    os.makedirs(PRINT_JOBS_DIR, exist_ok=True)
+    now = time.time()
+    remove_expired_print_jobs(now)
+    job_id = uuid.uuid4().hex
+    job = {'id': job_id, 'status': 'running', 'path': os.path.join(PRINT_JOBS_DIR, f"{job_id}.html"),
+           'user': username, 'rows': 0, 'error': None, 'started': now}
+    save_print_job(job)
+    threading.Thread(target=run_print_job, args=(job, query, params, logo_url), daemon=True).start()
+    logging.info(f"Relatório para impressão {job_id} iniciado em segundo plano por {username}.")
+    return job_id
+
+def run_print_job(job, query, params, logo_url):
+    """Renderiza print_report.html com todas as linhas num arquivo, em streaming (memória constante)."""
+    conn = None
+    try:
+        conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+        cur = conn.cursor(dictionary=True, buffered=False)
         cur.execute(query, params)
-        logs = cur.fetchall()
-        cur.close()
-        conn.close()
 
-        return render_template('print_report.html', logs=logs)
+        def rows():
+            for row in stream_rows(conn, cur):
+                job['rows'] += 1
+                if time.time() - job['updated'] >= PRINT_JOB_PROGRESS_SECONDS:
+                    save_print_job(job)
+                yield row
+
+        partial = job['path'] + '.tmp'
+        with app.app_context(), open(partial, 'w', encoding='utf-8') as f:
+            template = app.jinja_env.get_template('print_report.html')
+            for piece in template.generate(logs=rows(), state={'truncated': False}, logo_url=logo_url,
+                                           signed_by=job['user']):
+                f.write(piece)
+        os.replace(partial, job['path'])
+        job['status'] = 'done'
+        save_print_job(job)
+        logging.info(f"Relatório para impressão concluído: {job['rows']} linhas em {time.time() - job['started']:.0f}s.")
     except Exception as e:
-        return f"Erro ao consultar o banco de dados: {e}"
+        job['status'] = 'error'
+        job['error'] = str(e)
+        logging.error(f"Erro ao gerar o relatório para impressão: {e}")
+        try:
+            save_print_job(job)
+        except OSError as save_error:
+            logging.error(f"Erro ao gravar a situação do relatório para impressão: {save_error}")
+        if conn:
+            conn.discard()
+
+@app.route('/print-report/jobs/<job_id>')
+@login_required
+def print_job(job_id):
+    job = load_print_job(job_id)
+    if not job or job['user'] != session['username']:
+        return "Relatório não encontrado.", 404
+    if job['status'] == 'done':
+        return send_file(job['path'], mimetype='text/html')
+    return render_template('print_job.html', job=job)
 
 @app.route('/export-csv')
 @login_required
@@ -532,6 +957,7 @@ def export_csv():
     search_email = request.args.get('search_email')
     search_subject = request.args.get('search_subject')
     status_filter = request.args.get('status_filter', 'all')
+    search_mode = 'substring' if request.args.get('search_mode') == 'substring' else SEARCH_MODE
     sort_by = request.args.get('sort_by', 'date')
     sort_order = request.args.get('sort_order', 'desc')
 
@@ -552,97 +978,115 @@ def export_csv():
         except ValueError:
             return "Formato de hora inválido."
 
+    conn = None
     try:
         conn = get_conn(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-        cur = conn.cursor(dictionary=True)
-
-        query = "SELECT id, message_id, log_date, log_time, from_email, to_email, subject, status, origin_host, origin_ip FROM email_logs"
-        params = []
-        where = []
-        if use_date_filter:
-            where.append("log_date BETWEEN %s AND %s")
-            params.extend([start_date, end_date])
-        if use_time_filter:
-            where.append("log_time BETWEEN %s AND %s")
-            params.extend([start_time, end_time])
-        if search_email:
-            where.append("to_email LIKE %s")
-            params.append(f"%{search_email}%")
-        if search_subject:
-            where.append("subject LIKE %s")
-            params.append(f"%{search_subject}%")
-        if status_filter == 'failed':
-            where.append("status != 'sent'")
-        if where:
-            query += " WHERE " + " AND ".join(where)
-
-        order_direction = "ASC" if sort_order == 'asc' else "DESC"
-        if sort_by == 'date':
-            query += f" ORDER BY log_date {order_direction}, id {order_direction}"
-        elif sort_by == 'time':
-            query += f" ORDER BY log_time {order_direction}, id {order_direction}"
-        else:
-            query += f" ORDER BY log_date DESC, id DESC"
+        # Cursor sem buffer: as linhas chegam do servidor à medida que são lidas, sem carregar o resultado
+        # inteiro. O servidor aguarda o cliente HTTP entre um bloco e outro; net_write_timeout cobre downloads lentos.
+        cur = conn.cursor(buffered=False)
+        cur.execute(f"SET SESSION net_write_timeout = {EXPORT_NET_WRITE_TIMEOUT}")
 
+        where, params = report_filters(start_date if use_date_filter else None, end_date if use_date_filter else None,
+                                       start_time if use_time_filter else None, end_time if use_time_filter else None,
+                                       search_email, search_subject, status_filter, search_mode)
+        query = f"SELECT {EXPORT_COLUMNS} FROM email_logs" + where + report_order(sort_by, sort_order)
         cur.execute(query, params)
-        logs = cur.fetchall()
-
-        # Gerar CSV
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-        writer.writerow(['ID', 'Data', 'Hora', 'De', 'Para', 'Host Origem', 'IP Origem', 'Assunto', 'Status'])
-
-        for log in logs:
-            # Converter status 'sent' para 'Enviado'
-            status = 'Enviado' if log['status'] == 'sent' else log['status']
-            # Converter formato da data de YYYY-MM-DD para DD/MM/YYYY
-            log_date = datetime.strptime(str(log['log_date']), '%Y-%m-%d').strftime('%d/%m/%Y')
-            writer.writerow([
-                log['id'],
-                log_date,
-                log['log_time'],
-                log['from_email'],
-                log['to_email'],
-                log['origin_host'],
-                log['origin_ip'],
-                log['subject'],
-                status
-            ])
-
-        response = app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=relatorio_emails.csv'}
-        )
-        return response
-
     except Exception as e:
+        if conn:
+            conn.discard()
         return f"Erro ao consultar o banco de dados: {e}"
+
+    # gzip sob demanda (Accept-Encoding): o navegador descompacta e salva o CSV normalmente
+    compress = 'gzip' in request.accept_encodings
+    response = app.response_class(
+        stream_csv(conn, cur, compress),
+        mimetype='text/csv',
+        # X-Accel-Buffering: proxies nginx repassam os blocos na hora em vez de acumular a resposta
+        headers={'Content-Disposition': 'attachment; filename=relatorio_emails.csv', 'Vary': 'Accept-Encoding',
+                 'X-Accel-Buffering': 'no'}
+    )
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def stream_csv(conn, cur, compress):
+    """
+    Gera o CSV da exportação em blocos de EXPORT_FETCH_ROWS linhas lidas do cursor, com memória
+    constante, e devolve a conexão ao pool ao final. Se o download for interrompido (ou der erro no
+    meio), a conexão é fechada em vez de devolvida, sem ler o restante do resultado.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: formato gzip
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
+    started = time.monotonic()
+    exported = 0
+    finished = False
+
+    def chunk(flush=False):
+        data = output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate()
+        if not compressor:
+            return data
+        # Sem flush o zlib acumula até ter o que comprimir; o cabeçalho sai na hora
+        return compressor.compress(data) + (compressor.flush(zlib.Z_SYNC_FLUSH) if flush else b'')
+
+    try:
+        writer.writerow(EXPORT_HEADER)
+        yield chunk(flush=True)
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            writer.writerows(rows)
+            exported += len(rows)
+            yield chunk()
+        if compressor:
+            yield compressor.flush()
+        finished = True
+        logging.info(f"Exportação CSV: {exported} linhas em {time.monotonic() - started:.1f}s.")
+    except Exception as e:
+        logging.error(f"Erro na exportação CSV após {exported} linhas: {e}")
     finally:
-        try:
+        if finished:
             cur.close()
             conn.close()
-        except:
-            pass
+        else:
+            conn.discard()
 
 if __name__ == '__main__':
     from database import wait_for_db
     wait_for_db(DB_HOST, DB_USER, DB_PASSWORD, DB_PORT)
-    setup_database(AUTH_MODE, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-    # Execução inicial
-    recs, pend, imp = parse_log(LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-    insert_database(recs, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
-    # Scheduler
-    try:
-        scheduler_thread = threading.Thread(
-            target=run_scheduler, 
-            args=(SCHEDULE_TYPE, SCHEDULE_INTERVAL_MINUTES if SCHEDULE_TYPE == 'minutes' else None, 
-                  SCHEDULE_TIME if SCHEDULE_TYPE == 'time' else None, LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT),
-            daemon=True
-        )
-        scheduler_thread.start()
-        logging.info("Thread do agendador iniciada com sucesso.")
-    except Exception as e:
-        logging.error(f"Erro ao iniciar a thread do agendador: {e}")
-        raise
+    if INGEST_MODE == 'separate':
+        # Banco, manutenção, importação e agendador ficam com o worker.py
+        logging.info("INGEST_MODE=separate: este processo só atende a web; a importação roda no worker.py.")
+        detect_schema(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+    else:
+        setup_database(AUTH_MODE, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT, DB_PARTITIONING, STORAGE_MODE)
+        # Manutenção das partições (meses futuros e retenção) antes da primeira importação
+        if DB_PARTITIONING:
+            threading.Thread(
+                target=run_maintenance,
+                args=(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT, RETENTION_MONTHS, RETENTION_MODE == 'archive'),
+                daemon=True
+            ).start()
+        # Execução inicial, em segundo plano: o servidor web já atende enquanto ela roda
+        start_import(LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT, IMPORT_BATCH_SIZE, IMPORT_WORKERS,
+                     trigger='inicial')
+        # Scheduler
+        try:
+            scheduler_thread = threading.Thread(
+                target=run_scheduler, 
+                args=(SCHEDULE_TYPE, SCHEDULE_INTERVAL_MINUTES if SCHEDULE_TYPE == 'minutes' else None, 
+                      SCHEDULE_TIME if SCHEDULE_TYPE == 'time' else None, LOG_DIR, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT, IMPORT_BATCH_SIZE, IMPORT_WORKERS,
+                      FOLLOW_MAX_LATENCY_SECONDS if SCHEDULE_TYPE == 'follow' else 5, FOLLOW_MIN_BATCH_BYTES if SCHEDULE_TYPE == 'follow' else 65536),
+                daemon=True
+            )
+            scheduler_thread.start()
+            logging.info("Thread do agendador iniciada com sucesso.")
+        except Exception as e:
+            logging.error(f"Erro ao iniciar a thread do agendador: {e}")
+            raise
+    # Envio ao vivo das linhas importadas aos relatórios abertos (/api/report/stream)
+    threading.Thread(target=run_live_feed, args=(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT), daemon=True).start()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -67,4 +67,14 @@ def login_required(f):
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     wrap.__name__ = f.__name__
+    return wrap
+
+def api_login_required(f):
+    """Como login_required, mas responde 401 em JSON em vez de redirecionar para o login."""
+    def wrap(*args, **kwargs):
+        from flask import session, jsonify
+        if 'logged_in' not in session:
+            return jsonify({'error': 'Login necessário.'}), 401
+        return f(*args, **kwargs)
+    wrap.__name__ = f.__name__
     return wrap
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Carga histórica em massa dos logs arquivados (ex.: um ano de rotacionados ao implantar um relay).
+
+Uso, no container da aplicação (mesmas variáveis de ambiente do app.py):
+    python backfill.py /var/log/exim4/arquivo --workers 8
+
+Cada full_subjects.log rotacionado forma uma unidade com o mail.log rotacionado de mesmo sufixo e o
+seguinte (mensagens recebidas perto da rotação terminam no arquivo seguinte). As unidades são
+parseadas em paralelo, `--workers` processos por vez, e gravadas em arquivos CSV de até --chunk-rows
+registros. Cada CSV é carregado com LOAD DATA LOCAL INFILE em email_logs_staging e mesclado em
+email_logs descartando IDs já existentes, com os totais diários recalculados na mesma transação.
+
+Retomável por arquivo: ao fim de cada unidade, os checkpoints dos arquivos são gravados como lidos
+por completo em log_checkpoints, e tanto uma nova execução do backfill quanto a importação normal
+os ignoram. Uma unidade interrompida é refeita inteira, sem duplicar registros. Os logs ativos
+(mail.log e full_subjects.log) ficam para a importação normal; mensagens da unidade mais recente
+ainda sem resultado são gravadas como pendentes, para que ela as conclua.
+
+Enquanto roda, o backfill mantém a trava de importação (GET_LOCK): a importação normal é ignorada
+('ocupada') até ele terminar, e ele não começa se houver uma importação em andamento.
+
+Requer local_infile=ON no servidor MySQL (ex.: --local-infile=1 no container smtp-relay-db).
+"""
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from config import validate_environment_variables
+from database import (configure_pool, setup_database, load_checkpoints, save_import_state, run_transaction,
+                      get_bulk_conn, prepare_staging, load_staging, merge_staging, acquire_import_lock,
+                      release_import_lock)
+from report_cache import configure_cache, bump_generation
+from log_parser import list_log_files, open_log, scan_mail_log, parse_full_subjects, merge_flags, resolve_message
+
+COMPRESSED_SUFFIXES = ('.gz', '.bz2')
+
+def _rotation_key(path, base_name):
+    """Sufixo de rotação do arquivo sem a extensão de compactação (ex.: '.2', '-20251017')."""
+    suffix = os.path.basename(path)[len(base_name):]
+    for ext in COMPRESSED_SUFFIXES:
+        if suffix.endswith(ext):
+            return suffix[:-len(ext)]
+    return suffix
+
+def plan_units(archive_dir, checkpoints):
+    """
+    Lista as unidades a carregar, da mais antiga para a mais recente: (full_subjects, [(mail, ativo)]).
+    Rotacionados já lidos por completo (pelo backfill ou pela importação normal) são ignorados.
+    """
+    mail_logs = list_log_files(archive_dir, 'mail.log')
+    mail_keys = [_rotation_key(path, 'mail.log') for path in mail_logs]
+    active_mail = os.path.join(archive_dir, 'mail.log')
+    units = []
+    for full_path in list_log_files(archive_dir, 'full_subjects.log'):
+        key = _rotation_key(full_path, 'full_subjects.log')
+        if not key:
+            continue  # log ativo: fica para a importação normal
+        if key not in mail_keys:
+            logging.warning(f"{full_path}: sem mail.log{key} correspondente; ignorando.")
+            continue
+        opened = open_log(full_path, checkpoints)
+        if opened is None:
+            continue
+        opened[0].close()
+        index = mail_keys.index(key)
+        mails = [(path, path == active_mail) for path in mail_logs[index:index + 2]]
+        units.append((full_path, mails))
+    return units
+
+def parse_unit(args):
+    """
+    Worker: parseia uma unidade e grava os registros em CSVs de até `chunk_rows` linhas em `work_dir`.
+    Retorna dict com 'chunks', 'checkpoints', 'pending_upserts' e os totais 'messages' e 'records'.
+    """
+    full_path, mails, work_dir, chunk_rows = args
+    groups = {}
+    checkpoints = []
+    for mail_path, active in mails:
+        mail_groups, cp = scan_mail_log(mail_path, active=active)
+        merge_flags(groups, mail_groups)
+        # Só o mail.log da própria unidade fica lido; o seguinte é relido pela próxima unidade
+        if cp and mail_path == mails[0][0]:
+            checkpoints.append(cp)
+
+    state = {'pending_upserts': [], 'pending_deletes': [], 'imported': 0, 'pending': 0}
+    chunks = []
+    messages_total = 0
+    chunk_left = 0
+    writer = None
+    out = None
+    prefix = os.path.join(work_dir, os.path.basename(full_path))
+    messages, cp = parse_full_subjects(full_path, active=False)
+    try:
+        for msg_id, details in messages:
+            messages_total += 1
+            record = resolve_message(msg_id, details, None, groups, state, None)
+            if not record:
+                continue
+            if not chunk_left:
+                if out:
+                    out.close()
+                chunks.append(f"{prefix}.{len(chunks):05d}.csv")
+                out = open(chunks[-1], 'w', encoding='utf-8', newline='')
+                writer = csv.writer(out, quoting=csv.QUOTE_ALL, lineterminator='\n')
+                chunk_left = chunk_rows
+            writer.writerow(record)
+            chunk_left -= 1
+    finally:
+        if out:
+            out.close()
+    if cp:
+        checkpoints.append(cp)
+    return {'full_path': full_path, 'chunks': chunks, 'checkpoints': checkpoints,
+            'pending_upserts': state['pending_upserts'], 'messages': messages_total, 'records': state['imported']}
+
+def run_backfill(archive_dir, db_host, db_user, db_password, db_name, db_port=3306, workers=1,
+                 chunk_rows=100000, work_dir=None):
+    """
+    Carrega as unidades de `archive_dir`; retorna o número de registros inseridos, ou None se outra
+    importação tem a trava. A trava de importação fica com o backfill do começo ao fim: ele grava
+    checkpoints, pendências e totais diários, e a importação normal (que então termina como
+    'ocupada') leria os mesmos rotacionados ao mesmo tempo.
+    """
+    lock_conn = acquire_import_lock(db_host, db_user, db_password, db_name, db_port)
+    if lock_conn is None:
+        logging.error("Uma importação está em andamento (trava no banco); rode o backfill quando ela terminar.")
+        return None
+    try:
+        return _run_backfill(archive_dir, db_host, db_user, db_password, db_name, db_port, workers, chunk_rows,
+                             work_dir)
+    finally:
+        release_import_lock(lock_conn)
+
+def _run_backfill(archive_dir, db_host, db_user, db_password, db_name, db_port, workers, chunk_rows, work_dir):
+    units = plan_units(archive_dir, load_checkpoints(db_host, db_user, db_password, db_name, db_port))
+    if not units:
+        logging.info(f"Nenhum log arquivado pendente de carga em {archive_dir}.")
+        return 0
+    logging.info(f"{len(units)} arquivos full_subjects.log a carregar, {workers} processos.")
+    run_dir = tempfile.mkdtemp(prefix='smtp_backfill_', dir=work_dir)
+    conn = get_bulk_conn(db_host, db_user, db_password, db_name, db_port)
+    cursor = conn.cursor()
+    started = time.monotonic()
+    loaded = 0
+    inserted = 0
+    try:
+        prepare_staging(cursor)
+        conn.commit()
+        tasks = [(full_path, mails, run_dir, chunk_rows) for full_path, mails in units]
+        # spawn: mesmo critério da leitura paralela da importação normal
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            for number, unit in enumerate(pool.imap(parse_unit, tasks), 1):
+                unit_started = time.monotonic()
+                unit_inserted = 0
+                for csv_path in unit['chunks']:
+                    def load_chunk():
+                        load_staging(cursor, csv_path)
+                        return merge_staging(cursor)
+                    unit_inserted += run_transaction(conn, load_chunk, f"Carga de {os.path.basename(csv_path)}")
+                    os.remove(csv_path)
+                # Pendências só da unidade mais recente: nas demais, o mail.log seguinte já foi lido
+                pending = unit['pending_upserts'] if number == len(units) else []
+                run_transaction(conn, lambda: save_import_state(
+                    cursor, {'checkpoints': unit['checkpoints'], 'pending_upserts': pending}), "Estado do backfill")
+                if unit_inserted:
+                    bump_generation()
+                loaded += unit['records']
+                inserted += unit_inserted
+                elapsed = time.monotonic() - started
+                unit_elapsed = time.monotonic() - unit_started
+                logging.info(
+                    f"[{number}/{len(units)}] {os.path.basename(unit['full_path'])}: {unit['messages']} mensagens, "
+                    f"{unit_inserted}/{unit['records']} registros inseridos em {unit_elapsed:.1f}s; "
+                    f"total {inserted} em {elapsed:.0f}s ({loaded / elapsed if elapsed else 0:.0f} registros/s)."
+                )
+    finally:
+        cursor.close()
+        conn.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
+    logging.info(f"Backfill concluído: {inserted} registros inseridos ({loaded} lidos) em {time.monotonic() - started:.0f}s.")
+    return inserted
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    env = validate_environment_variables()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive_dir', nargs='?', default=env['LOG_DIR'],
+                        help='diretório com os logs rotacionados (padrão: LOG_DIR)')
+    parser.add_argument('--workers', type=int, default=max(env['IMPORT_WORKERS'], os.cpu_count() or 1),
+                        help='processos de parse em paralelo (padrão: núcleos da máquina)')
+    parser.add_argument('--chunk-rows', type=int, default=100000, help='registros por arquivo CSV carregado')
+    parser.add_argument('--work-dir', default=None, help='diretório dos CSVs temporários (padrão: o temporário do sistema)')
+    args = parser.parse_args()
+
+    configure_pool(env['DB_POOL_SIZE'], env['DB_POOL_TIMEOUT'], env['DB_POOL_RECYCLE'])
+    configure_cache(env['REPORT_CACHE'], env['REPORT_CACHE_SIZE'], env['REPORT_CACHE_PATH'])
+    setup_database(env['AUTH_MODE'], env['DB_HOST'], env['DB_USER'], env['DB_PASSWORD'], env['DB_NAME'],
+                   env['DB_PORT'], env['DB_PARTITIONING'], env['STORAGE_MODE'])
+    inserted = run_backfill(args.archive_dir, env['DB_HOST'], env['DB_USER'], env['DB_PASSWORD'], env['DB_NAME'],
+                            env['DB_PORT'], args.workers, args.chunk_rows, args.work_dir)
+    if inserted is None:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
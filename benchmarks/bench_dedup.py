@@ -0,0 +1,84 @@
+"""
+Benchmark da verificação de existência (database.filter_existing) conforme email_logs cresce.
+
+Uso, contra um MySQL local (ex.: o container smtp-relay-db):
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=root BENCH_DB_PASSWORD=xxx \
+        python benchmarks/bench_dedup.py --sizes 10000 100000 1000000
+
+Usa um banco próprio (BENCH_DB_NAME, padrão smtp_bench), recriado a cada execução. Para cada
+tamanho de tabela mede o tempo de filter_existing em lotes de --batch IDs, metade já existentes;
+o custo por lote deve se manter estável entre os tamanhos.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from database import setup_database, get_conn, filter_existing
+
+def message_id(n):
+    """ID no formato do Exim (6-6-2) derivado de um inteiro."""
+    return f"1t{n % 0xFFFF:04x}-{n:06d}-{n % 97:02d}"
+
+def grow_table(conn, current, target, chunk=10000):
+    cur = conn.cursor()
+    for start in range(current, target, chunk):
+        rows = [
+            (message_id(n), date(2025, 1, 1), '10:00:00', 'a@example.com', f'u{n}@example.com', 'sent',
+             'host.example.com', '10.0.0.1', f'Assunto {n}')
+            for n in range(start, min(start + chunk, target))
+        ]
+        cur.executemany("""
+            INSERT INTO email_logs
+            (message_id, log_date, log_time, from_email, to_email, status, origin_host, origin_ip, subject)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, rows)
+        conn.commit()
+    cur.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    host = os.environ.get('BENCH_DB_HOST', '127.0.0.1')
+    user = os.environ.get('BENCH_DB_USER', 'root')
+    password = os.environ.get('BENCH_DB_PASSWORD', '')
+    db_name = os.environ.get('BENCH_DB_NAME', 'smtp_bench')
+    port = int(os.environ.get('BENCH_DB_PORT', '3306'))
+
+    admin = mysql.connector.connect(host=host, user=user, password=password, port=port)
+    admin.cursor().execute(f"DROP DATABASE IF EXISTS {db_name}")
+    admin.close()
+    setup_database('AD', host, user, password, db_name, port)
+
+    conn = get_conn(host, user, password, db_name, port)
+    rows = 0
+    print(f"{'linhas':>12} {'ms/lote':>10} {'IDs/s':>12}")
+    for size in sorted(args.sizes):
+        grow_table(conn, rows, size)
+        rows = size
+        cur = conn.cursor()
+        elapsed = 0.0
+        for _ in range(args.repeat):
+            half = args.batch // 2
+            ids = [message_id(random.randrange(rows)) for _ in range(half)]
+            ids += [message_id(rows + random.randrange(10 * rows)) for _ in range(args.batch - half)]
+            batch = [(msg_id, date(2025, 1, 1)) for msg_id in ids]
+            started = time.perf_counter()
+            filter_existing(cur, batch)
+            elapsed += time.perf_counter() - started
+        cur.close()
+        per_batch = elapsed / args.repeat
+        print(f"{rows:>12} {per_batch * 1000:>10.2f} {args.batch / per_batch:>12.0f}")
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Benchmark da importação completa: gera um par mail.log + full_subjects.log (benchmarks/corpus.py)
+e mede, para cada fase, tempo de parede, linhas (ou registros) por segundo e pico de RSS.
+
+Uso, com o banco embutido em memória (mede só o lado Python de insert_database):
+    python benchmarks/bench_import.py --messages 100000
+
+Contra um MySQL local (ex.: o container smtp-relay-db), num banco próprio recriado a cada execução:
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=root BENCH_DB_PASSWORD=xxx \
+        python benchmarks/bench_import.py --messages 1000000 --db mysql
+
+Fases, cada uma num processo novo para que o pico de RSS seja só dela (vale a mais rápida de
+--repeat execuções; no MySQL o banco é recriado antes de cada import):
+    full_subjects  parse_full_subjects sobre o full_subjects.log
+    mail_log       scan_mail_log sobre o mail.log
+    import         parse_log + insert_database (o mesmo caminho do update_job)
+    insert         parte do import gasta dentro do banco (cursor e commit), em registros/s
+
+Os resultados são comparados com benchmarks/baseline.json (mesmo tamanho, banco e processos);
+quedas de vazão ou aumentos de RSS acima de --tolerance são marcados e o script sai com código 1.
+Use --save-baseline para gravar a execução atual como referência. O baseline só é comparável
+na mesma máquina: regrave-o ao trocar de ambiente.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import write_corpus
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+class MemoryDatabase:
+    """Substituto embutido do MySQL: guarda só os message_id de email_logs e ignora o resto."""
+    def __init__(self):
+        self.message_ids = set()
+
+    def cursor(self, dictionary=False):
+        return MemoryCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class MemoryCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        if 'FROM email_logs WHERE message_id IN' in sql:
+            self.rows = [(msg_id,) for msg_id in params if msg_id in self.db.message_ids]
+        else:
+            self.rows = []
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        self.rowcount = len(rows)
+        if 'INTO email_logs' in sql:
+            before = len(self.db.message_ids)
+            self.db.message_ids.update(row[0] for row in rows)
+            self.rowcount = len(self.db.message_ids) - before
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+class TimedConnection:
+    """Envolve uma conexão somando em `seconds` o tempo gasto em chamadas ao banco."""
+    seconds = 0.0
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    def timed(cls, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            cls.seconds += time.perf_counter() - started
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self.conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        return self.timed(self.conn.commit)
+
+    def rollback(self):
+        return self.timed(self.conn.rollback)
+
+    def close(self):
+        return self.conn.close()
+
+class TimedCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, *args):
+        return TimedConnection.timed(self.cursor.execute, *args)
+
+    def executemany(self, *args):
+        return TimedConnection.timed(self.cursor.executemany, *args)
+
+    def fetchall(self):
+        return TimedConnection.timed(self.cursor.fetchall)
+
+    def fetchone(self):
+        return TimedConnection.timed(self.cursor.fetchone)
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        return self.cursor.close()
+
+def db_settings():
+    return (os.environ.get('BENCH_DB_HOST', '127.0.0.1'), os.environ.get('BENCH_DB_USER', 'root'),
+            os.environ.get('BENCH_DB_PASSWORD', ''), os.environ.get('BENCH_DB_NAME', 'smtp_bench'),
+            int(os.environ.get('BENCH_DB_PORT', '3306')))
+
+def reset_mysql():
+    import mysql.connector
+    from database import setup_database
+    host, user, password, db_name, port = db_settings()
+    admin = mysql.connector.connect(host=host, user=user, password=password, port=port)
+    admin.cursor().execute(f"DROP DATABASE IF EXISTS {db_name}")
+    admin.close()
+    setup_database('AD', host, user, password, db_name, port)
+
+def peak_rss_mb():
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_phase(phase, log_dir, backend, workers, batch_size):
+    """Executa uma fase num processo novo; retorna {'items', 'seconds', 'rss_mb'} (e 'db_*' no import)."""
+    logging.basicConfig(level=logging.ERROR)
+    import database
+    import log_parser
+
+    started = time.perf_counter()
+    if phase == 'full_subjects':
+        messages, _ = log_parser.parse_full_subjects(os.path.join(log_dir, 'full_subjects.log'), workers=workers)
+        items = sum(1 for _ in messages)
+        return {'items': items, 'seconds': time.perf_counter() - started, 'rss_mb': peak_rss_mb()}
+    if phase == 'mail_log':
+        log_parser.scan_mail_log(os.path.join(log_dir, 'mail.log'), workers=workers)
+        return {'items': None, 'seconds': time.perf_counter() - started, 'rss_mb': peak_rss_mb()}
+
+    if backend == 'memory':
+        memory = MemoryDatabase()
+        database.get_conn = lambda *args, **kwargs: TimedConnection(memory)
+    else:
+        connect = database.get_conn
+        database.get_conn = lambda *args, **kwargs: TimedConnection(connect(*args, **kwargs))
+    settings = db_settings()
+    state = {}
+    started = time.perf_counter()
+    records = log_parser.parse_log(log_dir, *settings, state=state, workers=workers)
+    database.insert_database(records, *settings, state=state, batch_size=batch_size)
+    return {'items': None, 'seconds': time.perf_counter() - started, 'rss_mb': peak_rss_mb(),
+            'db_items': state.get('imported', 0), 'db_seconds': TimedConnection.seconds}
+
+def measure(phase, log_dir, backend, workers, batch_size, repeat):
+    """Melhor de `repeat` execuções da fase, cada uma num processo novo (ru_maxrss é o pico do processo inteiro)."""
+    best = None
+    for _ in range(repeat):
+        if backend == 'mysql' and phase == 'import':
+            reset_mysql()
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(run_phase, (phase, log_dir, backend, workers, batch_size))
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def compare(current, baseline, tolerance):
+    """Retorna a lista de textos de regressão de `current` em relação a `baseline`."""
+    regressions = []
+    for phase, result in current.items():
+        ref = baseline.get(phase)
+        if not ref:
+            continue
+        # Fases muito curtas (ex.: insert no banco em memória) são só ruído de medição
+        if ref['rate'] and ref['seconds'] >= 0.5 and result['rate'] < ref['rate'] * (1 - tolerance):
+            regressions.append(f"{phase}: {result['rate']:.0f}/s contra {ref['rate']:.0f}/s no baseline")
+        if ref['rss_mb'] and result['rss_mb'] > ref['rss_mb'] * (1 + tolerance):
+            regressions.append(f"{phase}: RSS {result['rss_mb']:.0f} MiB contra {ref['rss_mb']:.0f} MiB no baseline")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000, help='mensagens no corpus (1000 a 10000000)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', choices=('memory', 'mysql'), default='memory')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3, help='execuções por fase; vale a mais rápida')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='variação aceita em relação ao baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix='smtp_bench_')
+    try:
+        started = time.perf_counter()
+        mail_lines, subject_lines = write_corpus(log_dir, args.messages, args.seed)
+        print(f"Corpus: {args.messages} mensagens, {mail_lines} linhas no mail.log, {subject_lines} no "
+              f"full_subjects.log (gerado em {time.perf_counter() - started:.1f}s)")
+
+        results = {}
+        for phase in ('full_subjects', 'mail_log', 'import'):
+            result = measure(phase, log_dir, args.db, args.workers, args.batch_size, args.repeat)
+            lines = {'full_subjects': subject_lines, 'mail_log': mail_lines}.get(phase, mail_lines + subject_lines)
+            results[phase] = {'items': lines, 'seconds': result['seconds'], 'rss_mb': result['rss_mb'],
+                              'rate': lines / result['seconds'] if result['seconds'] else 0}
+            if phase == 'import':
+                db_seconds = result['db_seconds']
+                results['insert'] = {'items': result['db_items'], 'seconds': db_seconds, 'rss_mb': result['rss_mb'],
+                                     'rate': result['db_items'] / db_seconds if db_seconds else 0}
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    print(f"{'fase':<14} {'itens':>10} {'tempo':>9} {'itens/s':>11} {'RSS pico':>10}")
+    for phase, result in results.items():
+        print(f"{phase:<14} {result['items']:>10} {result['seconds']:>8.2f}s {result['rate']:>11.0f} "
+              f"{result['rss_mb']:>7.0f} MiB")
+
+    key = f"{args.messages}/{args.db}/{args.workers}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[key] = results
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline '{key}' gravado em {args.baseline}.")
+        return
+    if key not in baselines:
+        print(f"Sem baseline para '{key}'; use --save-baseline para gravar esta execução.")
+        return
+    regressions = compare(results, baselines[key], args.tolerance)
+    for text in regressions:
+        print(f"REGRESSÃO: {text}")
+    if regressions:
+        sys.exit(1)
+    print(f"Sem regressões em relação ao baseline '{key}' (tolerância {args.tolerance:.0%}).")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark da leitura paralela do mail.log e do full_subjects.log (IMPORT_WORKERS).
+
+Uso:
+    python benchmarks/bench_parallel.py --lines 2000000 --workers 1 2 4 8
+
+Gera os dois logs sintéticos num diretório temporário, lê ambos com scan_mail_log e
+parse_full_subjects para cada número de processos, com um só SharedPool para os dois arquivos
+(como parse_log), confere que o resultado é idêntico ao da leitura em série e imprime tempo e
+ganho em relação a 1 processo. O número de processos efetivo é limitado às CPUs disponíveis
+(usable_workers) e aparece na coluna "efetivos": numa máquina com 1 CPU todas as linhas leem em série.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_parser
+from corpus import mail_log_lines, full_subjects_lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=2000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--shard-mb', type=int, default=log_parser.SHARD_BYTES // (1024 * 1024))
+    args = parser.parse_args()
+    log_parser.SHARD_BYTES = args.shard_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mail_path = os.path.join(tmp, 'mail.log')
+        full_path = os.path.join(tmp, 'full_subjects.log')
+        with open(mail_path, 'w', encoding='utf-8') as f:
+            f.writelines(mail_log_lines(args.lines))
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.writelines(full_subjects_lines(args.lines // 4))
+        print(f"mail.log: {os.path.getsize(mail_path) / 2 ** 20:.0f} MiB, "
+              f"full_subjects.log: {os.path.getsize(full_path) / 2 ** 20:.0f} MiB")
+
+        baseline = None
+        reference = None
+        print(f"{'processos':>9} {'efetivos':>8} {'mail.log':>10} {'subjects':>10} {'total':>8} {'ganho':>7}")
+        for workers in args.workers:
+            pool = log_parser.SharedPool(log_parser.usable_workers(workers))
+            try:
+                started = time.perf_counter()
+                groups, _ = log_parser.scan_mail_log(mail_path, workers=workers, pool=pool)
+                mail_elapsed = time.perf_counter() - started
+                started = time.perf_counter()
+                messages, _ = log_parser.parse_full_subjects(full_path, workers=workers, pool=pool)
+                messages = list(messages)
+                subjects_elapsed = time.perf_counter() - started
+            finally:
+                pool.close()
+            total = mail_elapsed + subjects_elapsed
+            if reference is None:
+                reference, baseline = (groups, messages), total
+            elif (groups, messages) != reference:
+                print(f"ERRO: resultado com {workers} processos difere do primeiro")
+                sys.exit(1)
+            print(f"{workers:>9} {pool.workers:>8} {mail_elapsed:>9.2f}s {subjects_elapsed:>9.2f}s {total:>7.2f}s {baseline / total:>6.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Verificação diferencial e benchmark do classificador de linhas do mail.log.
+
+Uso:
+    python benchmarks/bench_scanner.py --lines 500000
+
+Gera um corpus sintético (benchmarks/corpus.py), confere que log_parser.classify_mail_line
+(bytes, por posição) produz exatamente a mesma classificação que classify_mail_line_regex
+(caminho por regex sobre a linha decodificada) e mede o tempo de cada um. Sai com código 1
+se houver qualquer divergência.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_parser import classify_mail_line, classify_mail_line_regex
+from corpus import mail_log_lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=500000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    raw_lines = [line.encode('utf-8') for line in mail_log_lines(args.lines, args.seed)]
+
+    started = time.perf_counter()
+    reference = [classify_mail_line_regex(raw.decode('utf-8', errors='replace')) for raw in raw_lines]
+    regex_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = [classify_mail_line(raw) for raw in raw_lines]
+    fast_elapsed = time.perf_counter() - started
+
+    mismatches = [(raw, ref, got) for raw, ref, got in zip(raw_lines, reference, fast) if ref != got]
+    for raw, ref, got in mismatches[:20]:
+        print(f"DIVERGÊNCIA: {raw!r}: regex={ref} rápido={got}")
+
+    print(f"linhas: {len(raw_lines)}, classificadas: {sum(1 for r in reference if r)}, divergências: {len(mismatches)}")
+    print(f"regex:  {regex_elapsed:.3f}s ({len(raw_lines) / regex_elapsed:,.0f} linhas/s)")
+    print(f"rápido: {fast_elapsed:.3f}s ({len(raw_lines) / fast_elapsed:,.0f} linhas/s, {regex_elapsed / fast_elapsed:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
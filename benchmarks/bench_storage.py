@@ -0,0 +1,51 @@
+"""
+Mede o tamanho de email_logs (dados e índices) no armazenamento comum e no compacto
+(STORAGE_MODE=compact) para o mesmo conjunto de registros.
+
+Uso, contra um MySQL local (ex.: o container smtp-relay-db):
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=root BENCH_DB_PASSWORD=xxx \
+        python benchmarks/bench_storage.py --rows 1000000
+
+Recria o banco BENCH_DB_NAME (padrão smtp_bench), grava --rows registros com a distribuição de
+check_query_plans.py (poucos remetentes e hosts, alguns milhares de destinatários), converte com
+compact_storage.migrate e mostra os tamanhos antes e depois, como reportados pelo InnoDB.
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from database import setup_database, get_conn
+from compact_storage import migrate, print_sizes
+from check_query_plans import seed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    host = os.environ.get('BENCH_DB_HOST', '127.0.0.1')
+    user = os.environ.get('BENCH_DB_USER', 'root')
+    password = os.environ.get('BENCH_DB_PASSWORD', '')
+    db_name = os.environ.get('BENCH_DB_NAME', 'smtp_bench')
+    port = int(os.environ.get('BENCH_DB_PORT', '3306'))
+
+    admin = mysql.connector.connect(host=host, user=user, password=password, port=port)
+    admin.cursor().execute(f"DROP DATABASE IF EXISTS {db_name}")
+    admin.close()
+    setup_database('AD', host, user, password, db_name, port)
+
+    conn = get_conn(host, user, password, db_name, port)
+    seed(conn, args.rows, date.today())
+    conn.close()
+
+    before, after = migrate(host, user, password, db_name, port)
+    total_before = print_sizes("Armazenamento comum:", before)
+    total_after = print_sizes("Armazenamento compacto:", after)
+    print(f"Redução: {total_before / total_after:.1f}x ({args.rows} registros).")
+
+if __name__ == '__main__':
+    main()
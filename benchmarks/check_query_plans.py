@@ -0,0 +1,151 @@
+"""
+Verifica, com EXPLAIN, que as consultas canônicas dos relatórios (index, print_report, export_csv)
+usam os índices de email_logs em vez de varrer a tabela inteira.
+
+Uso, contra um MySQL local (ex.: o container smtp-relay-db):
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=root BENCH_DB_PASSWORD=xxx \
+        python benchmarks/check_query_plans.py --rows 200000
+
+Por padrão recria um banco próprio (BENCH_DB_NAME, padrão smtp_bench) com --rows registros
+espalhados por um ano, já que numa tabela quase vazia o otimizador prefere a varredura completa.
+Com --existing usa o banco informado como está (ex.: uma cópia de produção), sem apagar nada.
+As consultas são montadas por database.report_filters/report_seek/report_order/report_count_query,
+as mesmas usadas pelas páginas (paginação por chave, contagem por somas diárias ou limitada),
+incluindo as buscas indexadas (SEARCH_MODE=indexed). Sai com código 1 se alguma fizer varredura
+completa (type ALL ou index) de email_logs ou email_daily_counts.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from database import (setup_database, get_conn, report_filters, report_order, report_seek, report_count_query,
+                      REPORT_COLUMNS, EXPORT_COLUMNS)
+
+# Linhas por página do relatório (app.REPORT_PAGE_SIZE) e id do cursor das páginas seguintes
+PAGE_SIZE = 50
+CURSOR_ID = 10**9
+# Tabelas cujo plano é verificado (a tabela derivada da contagem limitada é lida por inteiro por definição)
+CHECKED_TABLES = ('email_logs', 'email_daily_counts')
+
+def seed(conn, rows, last_day, chunk=10000):
+    rng = random.Random(1)
+    cur = conn.cursor()
+    for start in range(0, rows, chunk):
+        batch = []
+        for n in range(start, min(start + chunk, rows)):
+            status = 'sent' if rng.random() < 0.85 else 'rejected'
+            batch.append((f"bench-{n:09d}", last_day - timedelta(days=rng.randrange(365)),
+                          time(rng.randrange(24), rng.randrange(60), rng.randrange(60)), 'a@example.com',
+                          f"user{rng.randrange(5000)}@example{rng.randrange(50)}.com", status,
+                          'host.example.com', '10.0.0.1', f"Assunto {n}"))
+        cur.executemany("""
+            INSERT INTO email_logs
+            (message_id, log_date, log_time, from_email, to_email, status, origin_host, origin_ip, subject)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, batch)
+        conn.commit()
+    # insert_database mantém email_daily_counts; aqui os registros entram direto em email_logs
+    cur.execute("""
+        INSERT INTO email_daily_counts (log_date, status, total)
+        SELECT log_date, status, COUNT(*) FROM email_logs GROUP BY log_date, status
+        ON DUPLICATE KEY UPDATE total = VALUES(total)
+    """)
+    conn.commit()
+    for table in ('email_logs', 'email_daily_counts'):
+        cur.execute(f"ANALYZE TABLE {table}")
+        cur.fetchall()
+    cur.close()
+
+def canonical_queries(last_day):
+    """
+    (descrição, sql, params) das formas de consulta dos relatórios, montadas como em app.report_page
+    e export_csv: páginas por report_seek (primeira, seguinte e anterior a um cursor), exportação e
+    contagens de report_count_query (somas de email_daily_counts ou contagem limitada a COUNT_CAP).
+    """
+    queries = []
+    for days in (1, 7):
+        start_day = last_day - timedelta(days=days - 1)
+        for times in (None, (time(8, 0), time(18, 0))):
+            for status_filter in ('all', 'failed'):
+                where, params = report_filters(start_day, last_day, *(times or (None, None)),
+                                               status_filter=status_filter)
+                label = f"{days}d hora={'sim' if times else 'não'} status={status_filter}"
+                for sort_by in ('date', 'time'):
+                    # Cursor no meio do intervalo, como o de uma página qualquer
+                    middle = f"{last_day - timedelta(days=days // 2)}" if sort_by == 'date' else "12:00:00"
+                    for page, cursor, direction in (('primeira', None, 'next'),
+                                                    ('seguinte', f"{middle}_{CURSOR_ID}", 'next'),
+                                                    ('anterior', f"{middle}_{CURSOR_ID}", 'prev')):
+                        seek_where, seek_params, order_by, _ = report_seek(where, params, sort_by, 'desc', cursor,
+                                                                           direction)
+                        queries.append((f"página {page} {label} ordem={sort_by}",
+                                        f"SELECT {REPORT_COLUMNS} FROM email_logs" + seek_where + order_by
+                                        + " LIMIT %s", seek_params + [PAGE_SIZE + 1]))
+                    queries.append((f"exportação {label} ordem={sort_by}",
+                                    f"SELECT {EXPORT_COLUMNS} FROM email_logs" + where + report_order(sort_by, 'desc'),
+                                    params))
+                # Só data/status: somas diárias (como app.report_where); com hora, contagem limitada
+                rollup_range = None if times else (start_day, last_day)
+                queries.append((f"contagem {label}", *report_count_query(where, params, rollup_range, status_filter)))
+    # Buscas indexadas (sem filtro de data, como quando o usuário pesquisa em todo o histórico)
+    for label, search in (('destinatário @domínio', {'search_email': '@example7.com'}),
+                          ('destinatário início', {'search_email': 'user12'}),
+                          ('assunto', {'search_subject': 'Assunto 123'})):
+        where, params = report_filters(**search)
+        seek_where, seek_params, order_by, _ = report_seek(where, params, 'date', 'desc')
+        queries.append((f"busca {label}", f"SELECT {REPORT_COLUMNS} FROM email_logs" + seek_where + order_by
+                        + " LIMIT %s", seek_params + [PAGE_SIZE + 1]))
+        queries.append((f"contagem busca {label}", *report_count_query(where, params)))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--existing', action='store_true', help='usa o banco como está, sem recriar')
+    args = parser.parse_args()
+
+    host = os.environ.get('BENCH_DB_HOST', '127.0.0.1')
+    user = os.environ.get('BENCH_DB_USER', 'root')
+    password = os.environ.get('BENCH_DB_PASSWORD', '')
+    db_name = os.environ.get('BENCH_DB_NAME', 'smtp_bench')
+    port = int(os.environ.get('BENCH_DB_PORT', '3306'))
+
+    if not args.existing:
+        admin = mysql.connector.connect(host=host, user=user, password=password, port=port)
+        admin.cursor().execute(f"DROP DATABASE IF EXISTS {db_name}")
+        admin.close()
+    setup_database('AD', host, user, password, db_name, port)
+
+    conn = get_conn(host, user, password, db_name, port)
+    last_day = date.today()
+    if not args.existing:
+        seed(conn, args.rows, last_day)
+    else:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(log_date) FROM email_logs")
+        last_day = cur.fetchone()[0] or last_day
+        cur.close()
+
+    cur = conn.cursor(dictionary=True)
+    failures = 0
+    for label, sql, params in canonical_queries(last_day):
+        cur.execute("EXPLAIN " + sql, params)
+        plan = [row for row in cur.fetchall() if row['table'] in CHECKED_TABLES]
+        full_scan = any(row['type'] in ('ALL', 'index') for row in plan)
+        failures += full_scan
+        summary = ', '.join(f"{row['type']}/{row['key'] or '-'}" + (' filesort' if 'filesort' in (row['Extra'] or '') else '')
+                            for row in plan)
+        print(f"{'FALHA' if full_scan else 'ok':<6} {label:<60} {summary}")
+    cur.close()
+    conn.close()
+    if failures:
+        print(f"{failures} consultas com varredura completa de {' ou '.join(CHECKED_TABLES)}.")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
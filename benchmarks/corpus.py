@@ -0,0 +1,149 @@
+"""
+Gerador de corpus sintético no formato do mainlog do Exim, para benchmarks e verificações
+diferenciais do parser. Determinístico para uma mesma semente.
+
+Também gera pares mail.log + full_subjects.log casados por Message-ID (write_corpus), em
+streaming, de 1 mil a 10 milhões de mensagens:
+    python benchmarks/corpus.py --messages 1000000 --out /tmp/corpus
+"""
+import argparse
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+ALNUM = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+def exim_id(rng, new_format=False):
+    """ID de mensagem do Exim: 6-6-2 (clássico) ou 6-11-4 (Exim 4.97+)."""
+    sizes = (6, 11, 4) if new_format else (6, 6, 2)
+    return '-'.join(''.join(rng.choice(ALNUM) for _ in range(n)) for n in sizes)
+
+def mail_log_lines(count, seed=1, start=datetime(2025, 10, 17)):
+    """
+    Gera `count` linhas variadas de mail.log: recebimentos, entregas (=> e ->), rejeições (**),
+    adiamentos (==), Completed, linhas sem ID e linhas fora do layout usual (pid, fuso horário,
+    'Completed' no meio do texto), para exercitar tanto o caminho rápido quanto o de regex.
+    """
+    rng = random.Random(seed)
+    now = start
+    lines = []
+    while len(lines) < count:
+        now += timedelta(seconds=rng.randint(0, 2))
+        ts = now.strftime('%Y-%m-%d %H:%M:%S')
+        msg_id = exim_id(rng, new_format=rng.random() < 0.2)
+        rcpt = f"user{rng.randint(1, 5000)}@example{rng.randint(1, 50)}.com"
+        lines.append(f"{ts} {msg_id} <= sender{rng.randint(1, 200)}@origin.example H=(client) [10.0.0.{rng.randint(1, 254)}] P=esmtp S={rng.randint(500, 90000)}")
+        roll = rng.random()
+        if roll < 0.75:
+            lines.append(f"{ts} {msg_id} => {rcpt} R=dnslookup T=remote_smtp H=mx.example.com [192.0.2.1] C=\"250 OK\"")
+            if rng.random() < 0.1:
+                lines.append(f"{ts} {msg_id} -> cc{rng.randint(1, 99)}@example.com R=dnslookup T=remote_smtp")
+        elif roll < 0.9:
+            lines.append(f"{ts} {msg_id} ** {rcpt} R=dnslookup T=remote_smtp: 550 5.1.1 User unknown")
+        else:
+            lines.append(f"{ts} {msg_id} == {rcpt} R=dnslookup T=remote_smtp defer (-44): retry time not reached")
+        if roll < 0.95:
+            lines.append(f"{ts} {msg_id} Completed")
+        odd = rng.random()
+        if odd < 0.02:
+            lines.append(f"{ts} [{rng.randint(100, 99999)}] {msg_id} => {rcpt} R=dnslookup T=remote_smtp")
+        elif odd < 0.04:
+            lines.append(f"{ts} -0300 {msg_id} Completed")
+        elif odd < 0.06:
+            lines.append(f"{ts} H=(client) [10.0.0.9] F=<x@y.com> rejected RCPT <{rcpt}>: relay not permitted")
+        elif odd < 0.07:
+            lines.append(f"{ts} {msg_id} <= a@b.com H=(c) [10.0.0.1] P=esmtp T=\"Job Completed => ok\"")
+        elif odd < 0.08:
+            lines.append(f"{ts} Start queue run: pid={rng.randint(100, 99999)}")
+        elif odd < 0.085:
+            lines.append(f"{ts} {msg_id} XCompleted")
+        elif odd < 0.088:
+            lines.append(f"{ts} {msg_id} <= a@b.com H=(c) [10.0.0.1] P=esmtp T=\"Relatório éCompleted\"")
+        elif odd < 0.09:
+            lines.append("")
+    return [line + '\n' for line in lines[:count]]
+
+def write_mail_log(path, count, seed=1):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(mail_log_lines(count, seed))
+
+def subject_line(rng, msg_id, when, to_email=None):
+    """Linha do full_subjects.log para `msg_id`, com origem completa."""
+    date = when.strftime('%a, %d %b %Y %H:%M:%S -0300')
+    to_email = to_email or f"user{rng.randint(1, 5000)}@example{rng.randint(1, 50)}.com"
+    return (f"Message-ID: {msg_id} | Date: {date} | From: Remetente <sender{rng.randint(1, 200)}@origin.example> | "
+            f"To: {to_email} | Origin-Host: app{rng.randint(1, 20)}.origin.example | "
+            f"Origin-IP: 10.0.0.{rng.randint(1, 254)} | Subject: Boletim {rng.randint(1, 10 ** 6)} | pedido #{rng.randint(1, 999)}\n")
+
+def full_subjects_lines(count, seed=1, start=datetime(2025, 10, 17)):
+    """Gera `count` linhas de full_subjects.log com IDs aleatórios."""
+    rng = random.Random(seed)
+    return [subject_line(rng, exim_id(rng), start + timedelta(seconds=i)) for i in range(count)]
+
+def corpus_messages(count, seed=1, start=datetime(2025, 10, 17)):
+    """
+    Gera `count` mensagens como (linhas do mail.log, linha do full_subjects.log ou None), casadas por
+    Message-ID. Proporções aproximadas: 75% entregues, 15% rejeitadas, 10% só adiadas (sem
+    resultado); 5% sem linha Completed; 3% com origem incompleta no full_subjects.log; 1% com data
+    fora do formato; 1% sem linha no full_subjects.log. Linhas sem ID e de fila são intercaladas.
+    """
+    rng = random.Random(seed)
+    now = start
+    for _ in range(count):
+        now += timedelta(seconds=rng.randint(0, 2))
+        ts = now.strftime('%Y-%m-%d %H:%M:%S')
+        msg_id = exim_id(rng, new_format=rng.random() < 0.2)
+        rcpt = f"user{rng.randint(1, 5000)}@example{rng.randint(1, 50)}.com"
+        mail = [f"{ts} {msg_id} <= sender{rng.randint(1, 200)}@origin.example H=(client) [10.0.0.{rng.randint(1, 254)}] P=esmtp S={rng.randint(500, 90000)}\n"]
+        roll = rng.random()
+        if roll < 0.75:
+            mail.append(f"{ts} {msg_id} => {rcpt} R=dnslookup T=remote_smtp H=mx.example.com [192.0.2.1] C=\"250 OK\"\n")
+        elif roll < 0.9:
+            mail.append(f"{ts} {msg_id} ** {rcpt} R=dnslookup T=remote_smtp: 550 5.1.1 User unknown\n")
+        else:
+            mail.append(f"{ts} {msg_id} == {rcpt} R=dnslookup T=remote_smtp defer (-44): retry time not reached\n")
+        if rng.random() >= 0.05:
+            mail.append(f"{ts} {msg_id} Completed\n")
+        odd = rng.random()
+        if odd < 0.02:
+            mail.append(f"{ts} H=(client) [10.0.0.9] F=<x@y.com> rejected RCPT <{rcpt}>: relay not permitted\n")
+        elif odd < 0.03:
+            mail.append(f"{ts} Start queue run: pid={rng.randint(100, 99999)}\n")
+
+        kind = rng.random()
+        if kind < 0.01:
+            subject = None
+        else:
+            subject = subject_line(rng, msg_id, now, rcpt)
+            if kind < 0.04:
+                subject = re.sub(r'Origin-IP: [0-9.]+', 'Origin-IP: ', subject, count=1)
+            elif kind < 0.05:
+                subject = subject.replace(f"Date: {now.strftime('%a, %d %b %Y')}", f"Date: {now.strftime('%Y-%m-%d')}", 1)
+        yield mail, subject
+
+def write_corpus(log_dir, count, seed=1, start=datetime(2025, 10, 17)):
+    """Grava mail.log e full_subjects.log em `log_dir`; retorna (linhas do mail.log, linhas do full_subjects.log)."""
+    os.makedirs(log_dir, exist_ok=True)
+    mail_lines = subject_lines = 0
+    with open(os.path.join(log_dir, 'mail.log'), 'w', encoding='utf-8') as mail_f, \
+            open(os.path.join(log_dir, 'full_subjects.log'), 'w', encoding='utf-8') as full_f:
+        for mail, subject in corpus_messages(count, seed, start):
+            mail_f.writelines(mail)
+            mail_lines += len(mail)
+            if subject:
+                full_f.write(subject)
+                subject_lines += 1
+    return mail_lines, subject_lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+    mail_lines, subject_lines = write_corpus(args.out, args.messages, args.seed)
+    print(f"{args.out}: mail.log com {mail_lines} linhas, full_subjects.log com {subject_lines} linhas")
+
+if __name__ == '__main__':
+    main()
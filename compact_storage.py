@@ -0,0 +1,158 @@
+"""
+Conversão de email_logs para o armazenamento compacto (STORAGE_MODE=compact) e medição de tamanhos.
+
+Uso, no container da aplicação (mesmas variáveis de ambiente do app.py), com a importação parada
+(ex.: `docker compose stop app` e `docker compose run --rm app python compact_storage.py migrate`):
+    python compact_storage.py migrate [--chunk-rows 50000] [--drop-legacy] [--null-invalid-ips]
+    python compact_storage.py sizes
+
+migrate copia email_logs, em blocos de --chunk-rows ids com commit próprio, para email_logs_compact
+e os dicionários email_addresses/email_hosts, mantendo os ids. Interrompida, retoma do último id
+copiado. Ao fim renomeia a tabela original para email_logs_legacy, cria a view email_logs com as
+mesmas colunas e mostra tamanhos de dados e índices antes e depois. email_logs_legacy fica para
+conferência ou volta atrás (DROP VIEW email_logs; RENAME TABLE email_logs_legacy TO email_logs),
+a menos que se use --drop-legacy. Registros com origin_ip que não é um IP válido abortam a conversão
+(o armazenamento compacto guarda o IP em binário); --null-invalid-ips os converte sem IP. Tabelas
+particionadas (DB_PARTITIONING) não são convertidas.
+Depois da conversão, defina STORAGE_MODE=compact e inicie a aplicação.
+"""
+import argparse
+import logging
+import time
+
+from config import validate_environment_variables
+from report_cache import configure_cache, bump_generation
+from database import (get_conn, run_transaction, list_partitions, setup_compact_storage, create_compact_view,
+                      copy_to_compact, table_sizes, COMPACT_STATUSES)
+
+COMPACT_TABLES = ('email_logs_compact', 'email_addresses', 'email_hosts')
+STANDARD_TABLES = ('email_logs', 'email_logs_legacy')
+
+def print_sizes(title, sizes):
+    print(title)
+    print(f"  {'tabela':<20} {'linhas':>12} {'dados MiB':>10} {'índices MiB':>12}")
+    for table, rows, data, index in sizes:
+        print(f"  {table:<20} {rows:>12} {data / 2**20:>10.1f} {index / 2**20:>12.1f}")
+    total = sum(data + index for _, _, data, index in sizes)
+    print(f"  {'total':<20} {'':>12} {total / 2**20:>23.1f}")
+    return total
+
+def migrate(host, user, password, database, db_port=3306, chunk_rows=50000, drop_legacy=False,
+            null_invalid_ips=False):
+    """
+    Converte email_logs para o armazenamento compacto. Registros com origin_ip que não é IP abortam a
+    conversão, a menos que `null_invalid_ips` (ficam sem IP na view). Retorna (tamanhos antes, tamanhos depois)
+    no formato de table_sizes, ou None se não há o que converter.
+    """
+    conn = get_conn(host, user, password, database, db_port)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT TABLE_TYPE FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'email_logs'")
+        row = cur.fetchone()
+        if not row or row[0] != 'BASE TABLE':
+            logging.info("email_logs não é uma tabela comum (inexistente ou já compacta); nada a converter.")
+            return None
+        if list_partitions(cur):
+            logging.error("email_logs é particionada; o armazenamento compacto não suporta partições.")
+            return None
+        placeholders = ','.join(['%s'] * len(COMPACT_STATUSES))
+        cur.execute(f"SELECT DISTINCT status FROM email_logs WHERE status NOT IN ({placeholders})", COMPACT_STATUSES)
+        unknown = [status for status, in cur.fetchall()]
+        if unknown:
+            logging.error(f"Status fora de {COMPACT_STATUSES} em email_logs: {unknown}; conversão abortada.")
+            return None
+        # origin_ip é gravado com INET6_ATON: o que não é IP viraria NULL na tabela compacta
+        cur.execute("SELECT COUNT(*) FROM email_logs WHERE origin_ip <> '' AND INET6_ATON(origin_ip) IS NULL")
+        invalid_ips = cur.fetchone()[0]
+        if invalid_ips:
+            cur.execute("SELECT DISTINCT origin_ip FROM email_logs "
+                        "WHERE origin_ip <> '' AND INET6_ATON(origin_ip) IS NULL LIMIT 5")
+            examples = [ip for ip, in cur.fetchall()]
+            if not null_invalid_ips:
+                logging.error(f"{invalid_ips} registros com origin_ip inválido em email_logs (ex.: {examples}); "
+                              "conversão abortada. Use --null-invalid-ips para gravá-los sem IP.")
+                return None
+            logging.warning(f"{invalid_ips} registros com origin_ip inválido (ex.: {examples}) serão gravados sem IP.")
+
+        cur.execute("ANALYZE TABLE email_logs")
+        cur.fetchall()
+        before = table_sizes(cur, STANDARD_TABLES)
+        setup_compact_storage(cur)
+        conn.commit()
+
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM email_logs")
+        last_id = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM email_logs_compact")
+        first_id = cur.fetchone()[0]
+        if first_id:
+            logging.info(f"Retomando a conversão após o id {first_id}.")
+        started = time.monotonic()
+        copied = 0
+        while first_id < last_id:
+            chunk_end = min(first_id + chunk_rows, last_id)
+            copied += run_transaction(conn, lambda: copy_to_compact(cur, first_id, chunk_end),
+                                      f"Cópia dos ids {first_id + 1}-{chunk_end}")
+            first_id = chunk_end
+            elapsed = time.monotonic() - started
+            logging.info(f"{copied} registros copiados (id {first_id}/{last_id}, "
+                         f"{copied / elapsed if elapsed else 0:.0f} registros/s).")
+
+        cur.execute("SELECT COUNT(*) FROM email_logs")
+        standard_rows = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM email_logs_compact")
+        compact_rows = cur.fetchone()[0]
+        if compact_rows != standard_rows:
+            # Ex.: endereços que só diferem em maiúsculas, mesmo ID e status (a collation os une)
+            logging.warning(f"email_logs_compact tem {compact_rows} registros e email_logs {standard_rows}.")
+
+        cur.execute("RENAME TABLE email_logs TO email_logs_legacy")
+        create_compact_view(cur)
+        conn.commit()
+        bump_generation()
+        logging.info("email_logs convertida: a tabela original está em email_logs_legacy.")
+        for table in COMPACT_TABLES:
+            cur.execute(f"ANALYZE TABLE {table}")
+            cur.fetchall()
+        after = table_sizes(cur, COMPACT_TABLES)
+        if drop_legacy:
+            cur.execute("DROP TABLE email_logs_legacy")
+            logging.info("email_logs_legacy removida.")
+        return before, after
+    finally:
+        cur.close()
+        conn.close()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    env = validate_environment_variables()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('migrate', 'sizes'))
+    parser.add_argument('--chunk-rows', type=int, default=50000, help='ids copiados por transação')
+    parser.add_argument('--drop-legacy', action='store_true', help='remove email_logs_legacy ao fim')
+    parser.add_argument('--null-invalid-ips', action='store_true', help='grava sem IP os origin_ip inválidos')
+    args = parser.parse_args()
+    configure_cache(env['REPORT_CACHE'], env['REPORT_CACHE_SIZE'], env['REPORT_CACHE_PATH'])
+    settings = (env['DB_HOST'], env['DB_USER'], env['DB_PASSWORD'], env['DB_NAME'], env['DB_PORT'])
+
+    if args.command == 'sizes':
+        conn = get_conn(*settings)
+        cur = conn.cursor()
+        try:
+            print_sizes("Tamanhos atuais:", table_sizes(cur, STANDARD_TABLES + COMPACT_TABLES))
+        finally:
+            cur.close()
+            conn.close()
+        return
+
+    result = migrate(*settings, chunk_rows=args.chunk_rows, drop_legacy=args.drop_legacy,
+                     null_invalid_ips=args.null_invalid_ips)
+    if result:
+        before, after = result
+        total_before = print_sizes("Antes (armazenamento comum):", before)
+        total_after = print_sizes("Depois (armazenamento compacto):", after)
+        if total_after:
+            print(f"Redução: {total_before / total_after:.1f}x ({(total_before - total_after) / 2**20:.1f} MiB).")
+
+if __name__ == '__main__':
+    main()
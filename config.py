@@ -15,7 +15,7 @@ def validate_environment_variables():
         'DB_NAME': 'Nome do banco de dados',
         'LOG_DIR': 'Diretório de logs',
         'TZ': 'Fuso horário',
-        'SCHEDULE_TYPE': 'Tipo de agendamento (minutes ou time)',
+        'SCHEDULE_TYPE': 'Tipo de agendamento (minutes, time ou follow)',
     }
 
     required_ldap = {
@@ -54,8 +54,8 @@ def validate_environment_variables():
             missing.append(f"Fuso horário inválido: {tz_value}")
 
     st = os.environ.get('SCHEDULE_TYPE')
-    if st not in ['minutes', 'time']:
-        missing.append(f"Tipo de agendamento inválido: {st} (deve ser 'minutes' ou 'time')")
+    if st not in ['minutes', 'time', 'follow']:
+        missing.append(f"Tipo de agendamento inválido: {st} (deve ser 'minutes', 'time' ou 'follow')")
 
     if st == 'minutes':
         iv = os.environ.get('SCHEDULE_INTERVAL_MINUTES')
@@ -74,6 +74,16 @@ def validate_environment_variables():
         else:
             if not re.compile(r'^([01]\d|2[0-3]):([0-5]\d)$').match(tm):
                 missing.append(f"Horário específico inválido: {tm} (formato HH:MM)")
+    elif st == 'follow':
+        # Latência máxima em segundos (default 5) e lote mínimo em bytes novos nos logs (default 64 KiB)
+        for var, default, desc in (('FOLLOW_MAX_LATENCY_SECONDS', '5', 'Latência máxima do modo follow'),
+                                   ('FOLLOW_MIN_BATCH_BYTES', '65536', 'Lote mínimo do modo follow')):
+            value = os.environ.get(var, default)
+            try:
+                if int(value) <= 0:
+                    missing.append(f"{desc} ({var}) deve ser inteiro positivo: {value}")
+            except ValueError:
+                missing.append(f"{desc} ({var}) deve ser um inteiro: {value}")
 
     # Validação para DB_PORT (opcional, default 3306)
     db_port = os.environ.get('DB_PORT', '3306')
@@ -84,6 +94,90 @@ def validate_environment_variables():
     except ValueError:
         missing.append(f"Porta do banco de dados (DB_PORT) deve ser um inteiro: {db_port}")
 
+    # Tamanho do lote de inserção na importação (opcional, default 1000)
+    batch_size = os.environ.get('IMPORT_BATCH_SIZE', '1000')
+    try:
+        if int(batch_size) <= 0:
+            missing.append(f"Tamanho de lote (IMPORT_BATCH_SIZE) deve ser inteiro positivo: {batch_size}")
+    except ValueError:
+        missing.append(f"Tamanho de lote (IMPORT_BATCH_SIZE) deve ser um inteiro: {batch_size}")
+
+    # Processos para leitura paralela de grandes volumes de log (opcional, default 1 = em série)
+    workers = os.environ.get('IMPORT_WORKERS', '1')
+    try:
+        if int(workers) <= 0:
+            missing.append(f"Número de processos (IMPORT_WORKERS) deve ser inteiro positivo: {workers}")
+    except ValueError:
+        missing.append(f"Número de processos (IMPORT_WORKERS) deve ser um inteiro: {workers}")
+
+    # Modo das buscas por destinatário/assunto (opcional): indexed (padrão) ou substring (LIKE '%termo%')
+    search_mode = os.environ.get('SEARCH_MODE', 'indexed')
+    if search_mode not in ['indexed', 'substring']:
+        missing.append(f"Modo de busca (SEARCH_MODE) inválido: {search_mode} (deve ser 'indexed' ou 'substring')")
+
+    # Pool de conexões MySQL (opcional): tamanho, espera máxima por conexão livre e reciclagem, em segundos
+    pool_settings = {}
+    for var, default, desc in (('DB_POOL_SIZE', '10', 'Tamanho do pool de conexões'),
+                               ('DB_POOL_TIMEOUT', '30', 'Espera máxima por conexão do pool'),
+                               ('DB_POOL_RECYCLE', '3600', 'Tempo de vida das conexões do pool')):
+        value = os.environ.get(var, default)
+        try:
+            pool_settings[var] = int(value)
+            if pool_settings[var] <= 0:
+                missing.append(f"{desc} ({var}) deve ser inteiro positivo: {value}")
+        except ValueError:
+            missing.append(f"{desc} ({var}) deve ser um inteiro: {value}")
+
+    # Cache de resultados do relatório (opcional): memory (padrão, por processo), shared (arquivo SQLite
+    # local, compartilhado entre processos) ou off; tamanho em entradas e caminho do arquivo compartilhado
+    report_cache = os.environ.get('REPORT_CACHE', 'memory')
+    if report_cache not in ['memory', 'shared', 'off']:
+        missing.append(f"Cache de relatórios (REPORT_CACHE) inválido: {report_cache} (deve ser 'memory', 'shared' ou 'off')")
+    report_cache_size = os.environ.get('REPORT_CACHE_SIZE', '256')
+    try:
+        if int(report_cache_size) <= 0:
+            missing.append(f"Tamanho do cache de relatórios (REPORT_CACHE_SIZE) deve ser inteiro positivo: {report_cache_size}")
+    except ValueError:
+        missing.append(f"Tamanho do cache de relatórios (REPORT_CACHE_SIZE) deve ser um inteiro: {report_cache_size}")
+
+    # Máximo de linhas do relatório para impressão gerado na hora (opcional, default 5000)
+    print_max_rows = os.environ.get('PRINT_MAX_ROWS', '5000')
+    try:
+        if int(print_max_rows) <= 0:
+            missing.append(f"Limite do relatório para impressão (PRINT_MAX_ROWS) deve ser inteiro positivo: {print_max_rows}")
+    except ValueError:
+        missing.append(f"Limite do relatório para impressão (PRINT_MAX_ROWS) deve ser um inteiro: {print_max_rows}")
+
+    # Partições mensais de email_logs (opcional) e retenção em meses (0 = guarda tudo), que exige partições
+    partitioning = os.environ.get('DB_PARTITIONING', 'False') == 'True'
+    retention_months = os.environ.get('RETENTION_MONTHS', '0')
+    try:
+        if int(retention_months) < 0:
+            missing.append(f"Retenção (RETENTION_MONTHS) deve ser inteiro não negativo: {retention_months}")
+        elif int(retention_months) > 0 and not partitioning:
+            missing.append("Retenção (RETENTION_MONTHS) exige DB_PARTITIONING=True")
+    except ValueError:
+        missing.append(f"Retenção (RETENTION_MONTHS) deve ser um inteiro: {retention_months}")
+    retention_mode = os.environ.get('RETENTION_MODE', 'drop')
+    if retention_mode not in ['drop', 'archive']:
+        missing.append(f"Modo de retenção (RETENTION_MODE) inválido: {retention_mode} (deve ser 'drop' ou 'archive')")
+
+    # Formato de armazenamento de email_logs (opcional): standard (padrão) ou compact (dicionários)
+    storage_mode = os.environ.get('STORAGE_MODE', 'standard')
+    if storage_mode not in ['standard', 'compact']:
+        missing.append(f"Armazenamento (STORAGE_MODE) inválido: {storage_mode} (deve ser 'standard' ou 'compact')")
+    elif storage_mode == 'compact' and partitioning:
+        missing.append("Armazenamento compacto (STORAGE_MODE=compact) não suporta DB_PARTITIONING=True")
+
+    # Onde roda a importação (opcional): embedded (padrão, no próprio app.py) ou separate (só no worker.py,
+    # com a web sem importação, ex.: wsgi.py com vários workers). separate exige o cache compartilhado,
+    # pelo qual a web fica sabendo das importações feitas pelo worker
+    ingest_mode = os.environ.get('INGEST_MODE', 'embedded')
+    if ingest_mode not in ['embedded', 'separate']:
+        missing.append(f"Modo de importação (INGEST_MODE) inválido: {ingest_mode} (deve ser 'embedded' ou 'separate')")
+    elif ingest_mode == 'separate' and report_cache != 'shared':
+        missing.append("Importação separada (INGEST_MODE=separate) exige REPORT_CACHE=shared")
+
     if auth_mode == 'DB':
         smtp_port = os.environ.get('SMTP_PORT')
         if not smtp_port or smtp_port.strip() == '':
@@ -111,6 +205,19 @@ def validate_environment_variables():
         'TZ': os.environ['TZ'],
         'SCHEDULE_TYPE': os.environ['SCHEDULE_TYPE'],
         'DB_PORT': int(db_port),  # Usa o valor validado
+        'IMPORT_BATCH_SIZE': int(batch_size),
+        'IMPORT_WORKERS': int(workers),
+        'SEARCH_MODE': search_mode,
+        **pool_settings,
+        'DB_PARTITIONING': partitioning,
+        'RETENTION_MONTHS': int(retention_months),
+        'RETENTION_MODE': retention_mode,
+        'STORAGE_MODE': storage_mode,
+        'PRINT_MAX_ROWS': int(print_max_rows),
+        'REPORT_CACHE': report_cache,
+        'REPORT_CACHE_SIZE': int(report_cache_size),
+        'REPORT_CACHE_PATH': os.environ.get('REPORT_CACHE_PATH', ''),
+        'INGEST_MODE': ingest_mode,
     }
     if auth_mode == 'AD':
         env.update({
@@ -136,6 +243,9 @@ def validate_environment_variables():
             })
     if env['SCHEDULE_TYPE'] == 'minutes':
         env['SCHEDULE_INTERVAL_MINUTES'] = int(os.environ['SCHEDULE_INTERVAL_MINUTES'])
+    elif env['SCHEDULE_TYPE'] == 'follow':
+        env['FOLLOW_MAX_LATENCY_SECONDS'] = int(os.environ.get('FOLLOW_MAX_LATENCY_SECONDS', '5'))
+        env['FOLLOW_MIN_BATCH_BYTES'] = int(os.environ.get('FOLLOW_MIN_BATCH_BYTES', '65536'))
     else:
         env['SCHEDULE_TIME'] = os.environ['SCHEDULE_TIME']
     return env
\ No newline at end of file
@@ -1,7 +1,14 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import PoolError
+import ipaddress
 import logging
+import re
+from datetime import date
+import threading
+import time
 from werkzeug.security import generate_password_hash
+from report_cache import bump_generation
 
 def wait_for_db(host, user, password, port=3306, timeout=300, interval=5):
     """Aguarda até que o servidor de banco de dados esteja disponível."""
@@ -19,11 +26,691 @@ def wait_for_db(host, user, password, port=3306, timeout=300, interval=5):
         if time.time() - start_time > timeout:
             raise TimeoutError("Tempo esgotado ao aguardar o banco de dados ficar disponível.")
 
+# Pool de conexões do processo, compartilhado por páginas, autenticação e importação.
+# Ajustado por configure_pool (DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE) antes do primeiro uso.
+POOL_SIZE = 10        # conexões abertas no máximo, por banco
+POOL_TIMEOUT = 30     # segundos de espera por uma conexão livre antes de PoolError
+POOL_RECYCLE = 3600   # segundos de vida de uma conexão antes de ser reaberta
+
+class ConnectionPool:
+    """
+    Pool de conexões MySQL com limite de tamanho, espera limitada, verificação (ping) na retirada e
+    reciclagem por idade. Conexões devolvidas têm a sessão reiniciada (COM_RESET_CONNECTION), para que
+    a próxima retirada não herde transação, locks, snapshot de leitura nem variáveis de sessão (ex.:
+    SET SESSION net_write_timeout da exportação) da anterior.
+    """
+    def __init__(self, params, size, timeout, recycle):
+        self.params = params
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle = []  # (conexão, criada_em), a mais recente no fim
+        self.in_use = 0
+        self.cond = threading.Condition()
+        self.stats = {'checkouts': 0, 'waits': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0,
+                      'created': 0, 'recycled': 0, 'failed_checks': 0, 'timeouts': 0}
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.params)
+        with self.cond:
+            self.stats['created'] += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        started = time.monotonic()
+        with self.cond:
+            while not self.idle and self.in_use >= self.size:
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolError(f"Nenhuma conexão livre no pool após {self.timeout}s ({self.size} em uso).")
+                self.cond.wait(remaining)
+            entry = self.idle.pop() if self.idle else None
+            self.in_use += 1
+            waited = time.monotonic() - started
+            self.stats['checkouts'] += 1
+            if waited > 0.001:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds_total'] += waited
+                self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        try:
+            if entry:
+                raw, created = entry
+                if time.monotonic() - created > self.recycle:
+                    self._discard(raw)
+                    with self.cond:
+                        self.stats['recycled'] += 1
+                    entry = None
+                else:
+                    try:
+                        raw.ping(reconnect=False)
+                    except Error as e:
+                        logging.warning(f"Conexão do pool inválida ({e}); abrindo outra.")
+                        self._discard(raw)
+                        with self.cond:
+                            self.stats['failed_checks'] += 1
+                        entry = None
+            if entry is None:
+                entry = self._connect()
+        except Exception:
+            with self.cond:
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        return PooledConnection(self, *entry)
+
+    def release(self, raw, created, keep=True):
+        keep = keep and time.monotonic() - created <= self.recycle
+        if keep:
+            try:
+                # Resultados não lidos impedem o reset; descarta-os antes
+                if raw.unread_result:
+                    raw.consume_results()
+                # Desfaz a transação e volta as variáveis de sessão ao padrão; o conector reaplica
+                # autocommit, charset e sql_mode da conexão em seguida
+                raw.reset_session()
+            except Exception as e:
+                logging.warning(f"Não foi possível reiniciar a sessão da conexão devolvida ({e}); descartando-a.")
+                keep = False
+        if not keep:
+            self._discard(raw)
+        with self.cond:
+            self.in_use -= 1
+            if keep:
+                self.idle.append((raw, created))
+            self.cond.notify()
+
+    def status(self):
+        with self.cond:
+            return {'size': self.size, 'in_use': self.in_use, 'idle': len(self.idle), **self.stats}
+
+class PooledConnection:
+    """Conexão retirada do pool; close() (ou a coleta do objeto) a devolve em vez de fechá-la."""
+    def __init__(self, pool, raw, created):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise PoolError("Conexão já devolvida ao pool.")
+        return getattr(self._raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, self._created)
+
+    def discard(self):
+        """Fecha a conexão e libera sua vaga no pool (ex.: leitura em streaming interrompida, com
+        resultados pendentes que levariam tempo para serem descartados)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, self._created, keep=False)
+
+    def __del__(self):
+        # Rede de segurança para caminhos que não fecham a conexão em caso de erro
+        try:
+            self.close()
+        except Exception:
+            pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def configure_pool(size=POOL_SIZE, timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE):
+    """Define tamanho, espera máxima e reciclagem dos pools criados a partir daqui."""
+    global POOL_SIZE, POOL_TIMEOUT, POOL_RECYCLE
+    POOL_SIZE, POOL_TIMEOUT, POOL_RECYCLE = size, timeout, recycle
+
 def get_conn(host, user, password, database, port=3306):
-    return mysql.connector.connect(host=host, user=user, password=password, database=database, port=port)
+    """Retira uma conexão do pool do banco informado; close() devolve-a ao pool."""
+    key = (host, user, password, database, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            params = {'host': host, 'user': user, 'password': password, 'database': database, 'port': port}
+            pool = _pools[key] = ConnectionPool(params, POOL_SIZE, POOL_TIMEOUT, POOL_RECYCLE)
+    return pool.acquire()
+
+def pool_status():
+    """Indicadores dos pools do processo (em uso, ociosas, esperas), somados entre bancos."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    total = {}
+    for pool in pools:
+        for key, value in pool.status().items():
+            total[key] = max(total.get(key, 0), value) if key == 'wait_seconds_max' else total.get(key, 0) + value
+    if total.get('waits'):
+        total['wait_seconds_avg'] = total['wait_seconds_total'] / total['waits']
+    return total
+
+# Índices de email_logs para os filtros e ordenações dos relatórios (index, print_report, export_csv).
+# O InnoDB acrescenta o id (chave primária) ao fim de cada índice, então:
+#   idx_log_date     log_date BETWEEN ... ORDER BY log_date, id (ordem padrão) sem filesort
+#   idx_date_time    log_date BETWEEN + log_time BETWEEN, e ORDER BY log_time, id num único dia
+#   idx_status_date  status != 'sent' (falhas são minoria) com o intervalo de datas
+#   idx_to_email     busca por início do endereço (joao@, joao.silva)
+#   idx_to_email_rev busca por fim do endereço (@gmail.com, gmail.com), via to_email_rev
+REPORT_INDEXES = (
+    ('idx_log_date', 'log_date'),
+    ('idx_date_time', 'log_date, log_time'),
+    ('idx_status_date', 'status, log_date'),
+    ('idx_to_email', 'to_email'),
+    ('idx_to_email_rev', 'to_email_rev'),
+)
+
+# Tamanho dos tokens do parser ngram (ngram_token_size do MySQL); termos menores usam LIKE
+NGRAM_TOKEN_SIZE = 2
+# Se email_logs tem o índice ft_subject (definido por read_schema; não há com partições)
+SUBJECT_FULLTEXT = True
+# Se email_logs é a view do armazenamento compacto (definido por read_schema)
+COMPACT_STORAGE = False
+
+def _like_prefix(term):
+    """Escapa curingas do LIKE para buscar `term` como prefixo literal."""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+REPORT_COLUMNS = "id, message_id, log_date, log_time, from_email, to_email, subject, status, origin_host, origin_ip"
+# Colunas da exportação CSV, na ordem do arquivo, já formatadas pelo MySQL (sem conversão por linha no Python)
+EXPORT_HEADER = ['ID', 'Data', 'Hora', 'De', 'Para', 'Host Origem', 'IP Origem', 'Assunto', 'Status']
+# (o mysql.connector só substitui %s, então o '%' do DATE_FORMAT vai como está)
+EXPORT_COLUMNS = ("id, DATE_FORMAT(log_date, '%d/%m/%Y'), log_time, from_email, to_email, origin_host, origin_ip, "
+                  "subject, IF(status = 'sent', 'Enviado', status)")
+
+def report_filters(start_date=None, end_date=None, start_time=None, end_time=None,
+                   search_email=None, search_subject=None, status_filter='all', search_mode='indexed'):
+    """
+    Monta o WHERE das consultas de relatório; retorna (sql, params), com sql vazio sem filtros.
+    Com search_mode='indexed' as buscas usam índices: destinatário por início do endereço ou por
+    domínio (termo com '@' no início, ou sem '@', casa o fim do endereço) e assunto pelo FULLTEXT
+    ngram, confirmado com LIKE. Com 'substring', ambas são LIKE '%termo%' (varrem a tabela).
+    """
+    where = []
+    params = []
+    if start_date and end_date:
+        where.append("log_date BETWEEN %s AND %s")
+        params.extend([start_date, end_date])
+    if start_time and end_time:
+        where.append("log_time BETWEEN %s AND %s")
+        params.extend([start_time, end_time])
+    if search_email and search_mode == 'indexed':
+        term = search_email.strip()
+        if term.startswith('@'):
+            where.append("to_email_rev LIKE %s")
+            params.append(_like_prefix(term[::-1]))
+        elif '@' in term:
+            where.append("to_email LIKE %s")
+            params.append(_like_prefix(term))
+        else:
+            where.append("(to_email LIKE %s OR to_email_rev LIKE %s)")
+            params.extend([_like_prefix(term), _like_prefix(term[::-1])])
+    elif search_email:
+        where.append("to_email LIKE %s")
+        params.append(f"%{search_email}%")
+    phrase = (search_subject or '').replace('"', '').strip()
+    if search_subject and search_mode == 'indexed' and SUBJECT_FULLTEXT and len(phrase) >= NGRAM_TOKEN_SIZE:
+        # Frase do FULLTEXT encontra as linhas candidatas pelo índice; o LIKE mantém o resultado exato
+        where.append("MATCH(subject) AGAINST (%s IN BOOLEAN MODE) AND subject LIKE %s")
+        params.extend([f'"{phrase}"', f"%{search_subject}%"])
+    elif search_subject:
+        where.append("subject LIKE %s")
+        params.append(f"%{search_subject}%")
+    if status_filter == 'failed':
+        where.append("status != 'sent'")
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+def report_order(sort_by='date', sort_order='desc'):
+    """ORDER BY das consultas de relatório (data ou hora, com id para desempate)."""
+    order_direction = "ASC" if sort_order == 'asc' else "DESC"
+    if sort_by == 'date':
+        return f" ORDER BY log_date {order_direction}, id {order_direction}"
+    elif sort_by == 'time':
+        return f" ORDER BY log_time {order_direction}, id {order_direction}"
+    return " ORDER BY log_date DESC, id DESC"
+
+# Cursor da paginação por chave: valor da coluna de ordenação e id da linha de referência
+REPORT_CURSOR_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}|\d{1,2}:\d{2}:\d{2})_(\d+)$')
+
+def report_cursor(row, sort_by='date'):
+    """Cursor (texto para a URL) que aponta para `row` na ordenação informada."""
+    column = 'log_time' if sort_by == 'time' else 'log_date'
+    return f"{row[column]}_{row['id']}"
+
+def report_seek(where, params, sort_by='date', sort_order='desc', cursor=None, direction='next'):
+    """
+    Paginação por chave (keyset): acrescenta a `where` a condição "depois do cursor" na ordem de
+    report_order (ou "antes", com direction='prev') e retorna (where, params, order_by, reverse).
+    Com reverse=True as linhas vêm na ordem inversa e devem ser invertidas após a leitura.
+    Cada página custa o mesmo que a primeira, pois o MySQL começa a leitura do índice no cursor,
+    e linhas importadas durante a navegação não deslocam as páginas seguintes.
+    """
+    column = 'log_time' if sort_by == 'time' else 'log_date'
+    descending = sort_order != 'asc' or sort_by not in ('date', 'time')
+    match = REPORT_CURSOR_RE.match(cursor or '')
+    # Sem cursor válido, primeira página
+    reverse = bool(match) and direction == 'prev'
+    if reverse:
+        descending = not descending
+    direction_sql = "DESC" if descending else "ASC"
+    order_by = f" ORDER BY {column} {direction_sql}, id {direction_sql}"
+    if not match:
+        return where, params, order_by, reverse
+    value, row_id = match.group(1), int(match.group(2))
+    op = '<' if descending else '>'
+    seek = f"({column} {op} %s OR ({column} = %s AND id {op} %s))"
+    where = where + (" AND " if where else " WHERE ") + seek
+    return where, params + [value, value, row_id], order_by, reverse
+
+# Acima disso, filtros de texto/hora mostram "mais de COUNT_CAP" em vez de contar tudo
+COUNT_CAP = 10000
+
+def report_count_query(where, params, rollup_range=None, status_filter='all'):
+    """(sql, params) da contagem de report_count: soma de email_daily_counts ou contagem limitada."""
+    if rollup_range:
+        sql = "SELECT COALESCE(SUM(total), 0) FROM email_daily_counts WHERE log_date BETWEEN %s AND %s"
+        if status_filter == 'failed':
+            sql += " AND status != 'sent'"
+        return sql, list(rollup_range)
+    return f"SELECT COUNT(*) FROM (SELECT 1 FROM email_logs{where} LIMIT %s) AS capped", params + [COUNT_CAP + 1]
+
+def report_count(conn, where, params, rollup_range=None, status_filter='all'):
+    """
+    Total de linhas de um relatório sem recontar email_logs quando possível; retorna (total, limitado).
+    Com `rollup_range` (relatório filtrado só por data e status) soma email_daily_counts, exato.
+    Nos demais filtros conta no máximo COUNT_CAP + 1 linhas; acima disso devolve (COUNT_CAP, True).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(*report_count_query(where, params, rollup_range, status_filter))
+        total = int(cur.fetchone()[0])
+        if rollup_range:
+            return total, False
+        return min(total, COUNT_CAP), total > COUNT_CAP
+    finally:
+        cur.close()
+
+DASHBOARD_TOP = 20
+
+def dashboard_totals(conn, start_date, end_date):
+    """
+    Totais do painel entre as datas, lidos só das tabelas de totais (custo proporcional aos dias):
+    'days' (enviados/falhados por dia), 'domains' e 'hosts' (os DASHBOARD_TOP maiores no período).
+    """
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("""
+            SELECT log_date, SUM(IF(status = 'sent', total, 0)) AS sent, SUM(IF(status = 'sent', 0, total)) AS failed
+            FROM email_daily_counts WHERE log_date BETWEEN %s AND %s
+            GROUP BY log_date ORDER BY log_date
+        """, (start_date, end_date))
+        days = cur.fetchall()
+        top = {}
+        for name, column in (('domains', 'sender_domain'), ('hosts', 'origin_host')):
+            cur.execute(f"""
+                SELECT {column} AS name, SUM(IF(status = 'sent', total, 0)) AS sent,
+                       SUM(IF(status = 'sent', 0, total)) AS failed, SUM(total) AS total
+                FROM email_daily_rollup WHERE log_date BETWEEN %s AND %s
+                GROUP BY {column} ORDER BY total DESC LIMIT %s
+            """, (start_date, end_date, DASHBOARD_TOP))
+            top[name] = cur.fetchall()
+        return {'days': days, **top}
+    finally:
+        cur.close()
+
+# Partições mensais de email_logs: meses futuros criados com antecedência (o resto cai em pmax)
+PARTITION_AHEAD_MONTHS = 2
+
+def _add_months(month, n):
+    """Primeiro dia do mês `n` meses depois de `month`."""
+    years, index = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, index + 1, 1)
+
+def _partition_name(month):
+    return f"p{month:%Y%m}"
+
+def _partition_month(name):
+    """Mês de uma partição pAAAAMM, ou None para pmax."""
+    match = re.match(r'^p(\d{4})(\d{2})$', name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def _partition_defs(first_month, last_month):
+    defs = []
+    month = first_month
+    while month <= last_month:
+        defs.append(f"PARTITION {_partition_name(month)} VALUES LESS THAN ('{_add_months(month, 1)}')")
+        month = _add_months(month, 1)
+    return defs
+
+def list_partitions(cursor):
+    """Nomes das partições de email_logs, em ordem (lista vazia se a tabela não é particionada)."""
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'email_logs' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def partition_email_logs(conn, cur):
+    """
+    Converte email_logs para partições mensais (RANGE COLUMNS em log_date). Toda chave única precisa
+    conter a coluna de particionamento, então a chave primária passa a (id, log_date) e uq_email_log
+    ganha log_date, o que não muda a unicidade (o log_date de um ID é fixo). Reconstrói a tabela
+    inteira com escritas bloqueadas: em tabelas grandes, faça numa janela de manutenção.
+    """
+    logging.warning("Convertendo email_logs para partições mensais; a tabela é reconstruída e as escritas aguardam.")
+    cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='ft_subject'")
+    if cur.fetchall():
+        cur.execute("ALTER TABLE email_logs DROP INDEX ft_subject")
+    cur.execute("UPDATE email_logs SET log_date = DATE(inserted_at) WHERE log_date IS NULL")
+    conn.commit()
+    cur.execute("SELECT MIN(log_date) FROM email_logs")
+    this_month = date.today().replace(day=1)
+    first_month = min((cur.fetchone()[0] or this_month).replace(day=1), this_month)
+    defs = _partition_defs(first_month, _add_months(this_month, PARTITION_AHEAD_MONTHS))
+    defs.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    cur.execute(f"""
+        ALTER TABLE email_logs
+            MODIFY log_date DATE NOT NULL,
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, log_date),
+            DROP INDEX uq_email_log, ADD UNIQUE KEY uq_email_log (message_id, to_email, status, log_date)
+        PARTITION BY RANGE COLUMNS(log_date) ({', '.join(defs)})
+    """)
+    conn.commit()
+    logging.info(f"email_logs particionada por mês a partir de {first_month:%m/%Y}.")
 
-def setup_database(auth_mode, db_host, db_user, db_password, db_name, db_port=3306):
-    """Cria/ajusta tabelas e semeia admin (modo DB)."""
+def maintain_partitions(host, user, password, database, db_port=3306, retention_months=0, archive=False):
+    """
+    Cria as partições dos próximos PARTITION_AHEAD_MONTHS meses (dividindo pmax) e, com
+    `retention_months`, remove as partições de meses anteriores à janela de retenção em O(1):
+    DROP PARTITION ou, com `archive`, EXCHANGE PARTITION para a tabela email_logs_archive_AAAAMM
+    (troca de metadados, sem copiar linhas) seguido do DROP da partição já vazia. Os totais
+    (email_daily_counts, email_daily_rollup) desses meses são apagados junto, para seguirem
+    consistentes com email_logs. Idempotente; não faz nada se email_logs não for particionada.
+    """
+    conn = None
+    cur = None
+    try:
+        conn = get_conn(host, user, password, database, db_port)
+        cur = conn.cursor()
+        names = list_partitions(cur)
+        if not names:
+            return
+        months = [month for month in map(_partition_month, names) if month]
+        this_month = date.today().replace(day=1)
+        last_wanted = _add_months(this_month, PARTITION_AHEAD_MONTHS)
+        if 'pmax' in names and (not months or months[-1] < last_wanted):
+            first_new = _add_months(months[-1], 1) if months else this_month
+            defs = _partition_defs(first_new, last_wanted)
+            defs.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+            cur.execute(f"ALTER TABLE email_logs REORGANIZE PARTITION pmax INTO ({', '.join(defs)})")
+            logging.info(f"Partições de email_logs criadas até {last_wanted:%m/%Y}.")
+
+        if not retention_months:
+            return
+        cutoff = _add_months(this_month, -retention_months)
+        # Mantém ao menos uma partição mensal (uma tabela particionada não pode ficar sem partições)
+        expired = [month for month in months if month < cutoff][:max(len(months) - 1, 0)]
+        for month in expired:
+            name = _partition_name(month)
+            if archive:
+                archive_table = f"email_logs_archive_{month:%Y%m}"
+                cur.execute("SHOW TABLES LIKE %s", (archive_table,))
+                if not cur.fetchone():
+                    cur.execute(f"CREATE TABLE {archive_table} LIKE email_logs")
+                    cur.execute(f"ALTER TABLE {archive_table} REMOVE PARTITIONING")
+                cur.execute(f"SELECT 1 FROM {archive_table} LIMIT 1")
+                archived = cur.fetchone()
+                cur.execute(f"SELECT 1 FROM email_logs PARTITION ({name}) LIMIT 1")
+                pending = cur.fetchone()
+                if pending and archived:
+                    # Arquivo já preenchido por outra execução e partição ainda com linhas: não arrisca trocar
+                    logging.error(f"Partição {name} e tabela {archive_table} têm linhas; retenção desse mês ignorada.")
+                    continue
+                if pending:
+                    cur.execute(f"ALTER TABLE email_logs EXCHANGE PARTITION {name} WITH TABLE {archive_table}")
+            cur.execute(f"ALTER TABLE email_logs DROP PARTITION {name}")
+            logging.info(f"Partição {name} de email_logs {'arquivada em ' + archive_table if archive else 'removida'}.")
+        if expired:
+            # A primeira partição restante também guarda datas anteriores a ela; os totais seguem o mesmo limite
+            limit = _add_months(expired[-1], 1)
+            cur.execute("DELETE FROM email_daily_counts WHERE log_date < %s", (limit,))
+            cur.execute("DELETE FROM email_daily_rollup WHERE log_date < %s", (limit,))
+            conn.commit()
+            bump_generation()
+    except Error as e:
+        logging.error(f"Erro na manutenção das partições de email_logs: {e}")
+    finally:
+        try:
+            cur.close()
+            conn.close()
+        except:
+            pass
+
+# Armazenamento compacto: endereços e hosts ficam uma vez só em tabelas de dicionário e
+# email_logs_compact guarda os ids (4 bytes), o IP em binário (VARBINARY(16), IPv4 ou IPv6), o status
+# como ENUM e o message_id em ASCII binário. A view email_logs devolve as mesmas colunas da tabela
+# comum, então as consultas de relatório e de totais não mudam; só as escritas conhecem o formato.
+COMPACT_STATUSES = ('sent', 'rejected')
+
+def email_logs_table():
+    """Tabela física dos registros: email_logs_compact no armazenamento compacto, senão email_logs."""
+    return 'email_logs_compact' if COMPACT_STORAGE else 'email_logs'
+
+def setup_compact_storage(cur):
+    """Cria (se ausentes) as tabelas do armazenamento compacto, com os mesmos índices de relatório."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_addresses (
+            id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            address VARCHAR(255) NOT NULL,
+            address_rev VARCHAR(255) AS (REVERSE(address)) VIRTUAL,
+            UNIQUE KEY uq_address (address),
+            KEY idx_address_rev (address_rev)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_hosts (
+            id INT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            host VARCHAR(255) NOT NULL,
+            UNIQUE KEY uq_host (host)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    # Mesma regra de stopwords do ft_subject da tabela comum
+    cur.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS email_logs_compact (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            message_id VARCHAR(64) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+            log_date DATE,
+            log_time TIME,
+            from_id INT UNSIGNED,
+            to_id INT UNSIGNED,
+            status ENUM({', '.join(f"'{status}'" for status in COMPACT_STATUSES)}),
+            host_id INT UNSIGNED,
+            origin_ip VARBINARY(16),
+            subject VARCHAR(255),
+            inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_email_log (message_id, to_id, status),
+            KEY idx_log_date (log_date),
+            KEY idx_date_time (log_date, log_time),
+            KEY idx_status_date (status, log_date),
+            KEY idx_to_id (to_id),
+            FULLTEXT KEY ft_subject (subject) WITH PARSER ngram
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+def create_compact_view(cur):
+    """(Re)cria a view email_logs sobre email_logs_compact, com as colunas da tabela comum."""
+    cur.execute("""
+        CREATE OR REPLACE ALGORITHM=MERGE VIEW email_logs AS
+        SELECT c.id, c.message_id, c.log_date, c.log_time, f.address AS from_email, t.address AS to_email,
+               c.status, h.host AS origin_host, INET6_NTOA(c.origin_ip) AS origin_ip, c.subject, c.inserted_at,
+               t.address_rev AS to_email_rev
+        FROM email_logs_compact c
+        LEFT JOIN email_addresses f ON f.id = c.from_id
+        LEFT JOIN email_addresses t ON t.id = c.to_id
+        LEFT JOIN email_hosts h ON h.id = c.host_id
+    """)
+
+# Cache dos dicionários (valor -> id) usado na importação; esvaziado ao passar do limite
+LOOKUP_CACHE_SIZE = 100000
+_lookup_cache = {'email_addresses': {}, 'email_hosts': {}}
+
+def lookup_ids(conn, cursor, table, column, values):
+    """
+    Retorna dict valor -> id de `table` para `values`, criando as entradas ausentes. Só valores fora
+    do cache vão ao banco. As entradas novas são confirmadas (commit) antes de entrarem no cache, para
+    que um id em cache sempre exista mesmo que a transação do lote seja desfeita depois. Valores que
+    a collation da coluna considera iguais (ex.: só maiúsculas diferentes) compartilham a entrada.
+    """
+    cache = _lookup_cache[table]
+    missing = sorted({value for value in values if value is not None and value not in cache})
+    if not missing:
+        return cache
+    if len(cache) + len(missing) > LOOKUP_CACHE_SIZE:
+        # Esvaziado o cache, todos os valores do lote voltam a ser buscados, não só os que faltavam
+        cache.clear()
+        missing = sorted({value for value in values if value is not None})
+    cursor.executemany(f"INSERT IGNORE INTO {table} ({column}) VALUES (%s)", [(value,) for value in missing])
+    conn.commit()
+    for i in range(0, len(missing), DEDUP_CHUNK_SIZE):
+        chunk = missing[i:i + DEDUP_CHUNK_SIZE]
+        placeholders = ','.join(['%s'] * len(chunk))
+        cursor.execute(f"SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})", chunk)
+        found = dict(cursor.fetchall())
+        for value in chunk:
+            if value not in found:
+                cursor.execute(f"SELECT id FROM {table} WHERE {column} = %s", (value,))
+                found[value] = cursor.fetchone()[0]
+            cache[value] = found[value]
+    return cache
+
+def pack_ip(ip):
+    """IP em binário, como INET6_ATON; None se vazio ou inválido."""
+    try:
+        return ipaddress.ip_address(ip).packed
+    except ValueError:
+        return None
+
+INSERT_COMPACT_LOGS = """
+    INSERT IGNORE INTO email_logs_compact
+    (message_id, log_date, log_time, from_id, to_id, status, host_id, origin_ip, subject)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+
+def encode_compact(conn, cursor, records):
+    """Converte registros (tuplas na ordem de email_logs) em linhas de INSERT_COMPACT_LOGS."""
+    addresses = lookup_ids(conn, cursor, 'email_addresses', 'address',
+                           [record[3] for record in records] + [record[4] for record in records])
+    hosts = lookup_ids(conn, cursor, 'email_hosts', 'host', [record[6] for record in records])
+    rows = [
+        (msg_id, log_date, log_time, addresses.get(from_email), addresses.get(to_email), status,
+         hosts.get(host), pack_ip(ip), subject)
+        for msg_id, log_date, log_time, from_email, to_email, status, host, ip, subject in records
+    ]
+    # origin_ip é binário no armazenamento compacto: o que não é IP vira NULL, e a view deixa de
+    # mostrar o texto original
+    invalid = [record[7] for record, row in zip(records, rows) if record[7] and row[7] is None]
+    if invalid:
+        logging.warning(f"{len(invalid)} registros com origin_ip inválido gravados sem IP (ex.: {invalid[:5]}).")
+    return rows
+
+def copy_to_compact(cur, first_id, last_id):
+    """
+    Copia os registros de email_logs (tabela comum) com id em (first_id, last_id] para
+    email_logs_compact, mantendo os ids, sem commit (transação do chamador). Retorna as linhas copiadas.
+    """
+    cur.execute("""
+        INSERT IGNORE INTO email_addresses (address)
+        SELECT from_email FROM email_logs WHERE id > %s AND id <= %s AND from_email IS NOT NULL
+        UNION
+        SELECT to_email FROM email_logs WHERE id > %s AND id <= %s AND to_email IS NOT NULL
+    """, (first_id, last_id, first_id, last_id))
+    cur.execute("""
+        INSERT IGNORE INTO email_hosts (host)
+        SELECT DISTINCT origin_host FROM email_logs WHERE id > %s AND id <= %s AND origin_host IS NOT NULL
+    """, (first_id, last_id))
+    cur.execute("""
+        INSERT IGNORE INTO email_logs_compact
+        (id, message_id, log_date, log_time, from_id, to_id, status, host_id, origin_ip, subject, inserted_at)
+        SELECT l.id, l.message_id, l.log_date, l.log_time, f.id, t.id, l.status, h.id,
+               INET6_ATON(NULLIF(l.origin_ip, '')), l.subject, l.inserted_at
+        FROM email_logs l
+        LEFT JOIN email_addresses f ON f.address = l.from_email
+        LEFT JOIN email_addresses t ON t.address = l.to_email
+        LEFT JOIN email_hosts h ON h.host = l.origin_host
+        WHERE l.id > %s AND l.id <= %s
+    """, (first_id, last_id))
+    return cur.rowcount
+
+def table_sizes(cur, tables):
+    """Lista (tabela, linhas estimadas, bytes de dados, bytes de índices) das tabelas existentes em `tables`."""
+    # Sem isso o information_schema devolve estatísticas em cache (até 24h no MySQL 8)
+    cur.execute("SET SESSION information_schema_stats_expiry = 0")
+    placeholders = ','.join(['%s'] * len(tables))
+    cur.execute(f"""
+        SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE' AND TABLE_NAME IN ({placeholders})
+    """, list(tables))
+    sizes = {row[0]: row for row in cur.fetchall()}
+    return [sizes[table] for table in tables if table in sizes]
+
+def read_schema(cur):
+    """
+    Ajusta COMPACT_STORAGE e SUBJECT_FULLTEXT ao esquema atual de email_logs, sem alterá-lo.
+    Retorna False (e mantém os valores) se email_logs ainda não existe.
+    """
+    global SUBJECT_FULLTEXT, COMPACT_STORAGE
+    cur.execute("SELECT TABLE_TYPE FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'email_logs'")
+    row = cur.fetchone()
+    if not row:
+        return False
+    COMPACT_STORAGE = row[0] == 'VIEW'
+    cur.execute(f"SHOW INDEX FROM {email_logs_table()} WHERE Key_name='ft_subject'")
+    SUBJECT_FULLTEXT = bool(cur.fetchall())
+    return True
+
+def detect_schema(db_host, db_user, db_password, db_name, db_port=3306, timeout=300, interval=5):
+    """
+    Para processos que não rodam setup_database (web com INGEST_MODE=separate): lê o esquema criado
+    pelo worker.py (read_schema), aguardando até `timeout` segundos que email_logs exista.
+    """
+    start_time = time.time()
+    while True:
+        conn = None
+        try:
+            conn = get_conn(db_host, db_user, db_password, db_name, db_port)
+            cur = conn.cursor()
+            found = read_schema(cur)
+            cur.close()
+            if found:
+                logging.info(f"Esquema de email_logs: armazenamento {'compacto' if COMPACT_STORAGE else 'comum'}, "
+                             f"busca de assunto {'FULLTEXT' if SUBJECT_FULLTEXT else 'LIKE'}.")
+                return
+            logging.info(f"email_logs ainda não existe; aguardando o worker.py criá-la ({interval} s).")
+        except Error as e:
+            logging.warning(f"Erro ao ler o esquema de email_logs: {e}. Tentando novamente em {interval} segundos...")
+        finally:
+            if conn:
+                conn.close()
+        if time.time() - start_time > timeout:
+            raise TimeoutError("Tempo esgotado ao aguardar a tabela email_logs.")
+        time.sleep(interval)
+
+def setup_database(auth_mode, db_host, db_user, db_password, db_name, db_port=3306, partitioning=False,
+                   storage='standard'):
+    """
+    Cria/ajusta tabelas e semeia admin (modo DB). Com `partitioning`, particiona email_logs por mês;
+    com `storage='compact'`, cria email_logs no armazenamento compacto se ainda não existir.
+    """
+    global COMPACT_STORAGE
     try:
         # Garante DB
         conn = mysql.connector.connect(host=db_host, user=db_user, password=db_password, port=db_port)
@@ -36,42 +723,218 @@ def setup_database(auth_mode, db_host, db_user, db_password, db_name, db_port=33
         conn = get_conn(db_host, db_user, db_password, db_name, db_port)
         cur = conn.cursor()
 
-        # email_logs com message_id e índice único por message_id+to_email+status
+        # Armazenamento compacto (STORAGE_MODE=compact): email_logs passa a ser uma view sobre
+        # email_logs_compact e os dicionários de endereços e hosts. Uma instalação nova já nasce assim;
+        # uma tabela email_logs existente é convertida por compact_storage.py. O modo efetivo segue o esquema.
+        cur.execute("SELECT TABLE_TYPE FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'email_logs'")
+        row = cur.fetchone()
+        email_logs_type = row[0] if row else None
+        if storage == 'compact' and email_logs_type is None:
+            setup_compact_storage(cur)
+            create_compact_view(cur)
+            conn.commit()
+            email_logs_type = 'VIEW'
+        elif storage == 'compact' and email_logs_type != 'VIEW':
+            logging.warning("STORAGE_MODE=compact, mas email_logs ainda é uma tabela comum; converta-a com "
+                            "'python compact_storage.py migrate' (com a importação parada).")
+        elif storage != 'compact' and email_logs_type == 'VIEW':
+            logging.warning("email_logs está no armazenamento compacto; STORAGE_MODE=standard ignorado.")
+        COMPACT_STORAGE = email_logs_type == 'VIEW'
+
+        if COMPACT_STORAGE:
+            setup_compact_storage(cur)
+            conn.commit()
+        else:
+            # email_logs com message_id e índice único por message_id+to_email+status
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS email_logs (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    message_id VARCHAR(64) NOT NULL,
+                    log_date DATE,
+                    log_time TIME,
+                    from_email VARCHAR(255),
+                    to_email VARCHAR(255),
+                    status VARCHAR(50),
+                    origin_host VARCHAR(255),
+                    origin_ip VARCHAR(45),
+                    subject VARCHAR(255),
+                    inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE KEY uq_email_log (message_id, to_email, status)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            conn.commit()
+
+            # Migração leve (caso já existisse)
+            try:
+                cur.execute("SHOW COLUMNS FROM email_logs LIKE 'message_id'")
+                has_msgid = cur.fetchone()
+                if not has_msgid:
+                    cur.execute("ALTER TABLE email_logs ADD COLUMN message_id VARCHAR(64) NOT NULL DEFAULT ''")
+                    conn.commit()
+                cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='unique_email_log'")
+                if cur.fetchall():
+                    cur.execute("ALTER TABLE email_logs DROP INDEX unique_email_log")
+                    conn.commit()
+                cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='uq_email_log'")
+                if not cur.fetchall():
+                    cur.execute("ALTER TABLE email_logs ADD UNIQUE KEY uq_email_log (message_id, to_email, status)")
+                    conn.commit()
+            except Error as e:
+                logging.info(f"Ajuste de esquema (migr.) ok/ignorado: {e}")
+
+            # E-mail do destinatário invertido, para que buscas por sufixo (@dominio) sejam faixas de índice.
+            # Coluna virtual: criada sem reescrever a tabela e mantida pelo MySQL, sem mudar os INSERTs.
+            try:
+                cur.execute("SHOW COLUMNS FROM email_logs LIKE 'to_email_rev'")
+                if not cur.fetchone():
+                    cur.execute("ALTER TABLE email_logs ADD COLUMN to_email_rev VARCHAR(255) AS (REVERSE(to_email)) VIRTUAL, "
+                                "ALGORITHM=INPLACE, LOCK=NONE")
+                    conn.commit()
+            except Error as e:
+                logging.warning(f"Não foi possível criar a coluna to_email_rev em email_logs: {e}")
+
+            # Índices das consultas de relatório, criados online e só se ausentes (tabelas grandes já existentes)
+            for name, columns in REPORT_INDEXES:
+                try:
+                    cur.execute("SHOW INDEX FROM email_logs WHERE Key_name=%s", (name,))
+                    if not cur.fetchall():
+                        logging.info(f"Criando índice {name} ({columns}) em email_logs; pode demorar em tabelas grandes.")
+                        cur.execute(f"ALTER TABLE email_logs ADD INDEX {name} ({columns}), ALGORITHM=INPLACE, LOCK=NONE")
+                        conn.commit()
+                except Error as e:
+                    logging.warning(f"Não foi possível criar o índice {name} em email_logs: {e}")
+
+            # Partições mensais por log_date (DB_PARTITIONING). Tabelas particionadas não aceitam FULLTEXT:
+            # nesse caso a busca por assunto usa LIKE, restrita às partições do intervalo de datas.
+            if partitioning:
+                try:
+                    if not list_partitions(cur):
+                        partition_email_logs(conn, cur)
+                except Error as e:
+                    logging.error(f"Não foi possível particionar email_logs: {e}")
+
+            # Índice FULLTEXT (ngram) do assunto. Sem stopwords: com o ngram, qualquer token que contenha uma
+            # stopword (ex.: 'a') ficaria fora do índice. O primeiro FULLTEXT reconstrói a tabela e bloqueia
+            # escritas (LOCK=SHARED) enquanto isso; a importação aguarda e segue depois.
+            try:
+                cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='ft_subject'")
+                if not cur.fetchall() and not list_partitions(cur):
+                    logging.info("Criando índice FULLTEXT ft_subject em email_logs; escritas aguardam até o fim.")
+                    cur.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+                    cur.execute("ALTER TABLE email_logs ADD FULLTEXT INDEX ft_subject (subject) WITH PARSER ngram, "
+                                "ALGORITHM=INPLACE, LOCK=SHARED")
+                    conn.commit()
+            except Error as e:
+                logging.warning(f"Não foi possível criar o índice ft_subject em email_logs: {e}")
+        read_schema(cur)
+
+        # Checkpoints da leitura incremental dos logs, identificados pelo fingerprint dos primeiros
+        # bytes para acompanhar o arquivo após rotação/compactação pelo logrotate
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS email_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                message_id VARCHAR(64) NOT NULL,
+            CREATE TABLE IF NOT EXISTS log_checkpoints (
+                fingerprint CHAR(40) NOT NULL PRIMARY KEY,
+                fingerprint_len INT NOT NULL,
+                log_file VARCHAR(255) NOT NULL,
+                inode BIGINT UNSIGNED NOT NULL,
+                byte_offset BIGINT UNSIGNED NOT NULL,
+                complete TINYINT(1) NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        conn.commit()
+
+        # Migração da versão anterior (chave por log_file, sem coluna complete)
+        try:
+            cur.execute("SHOW COLUMNS FROM log_checkpoints LIKE 'complete'")
+            if not cur.fetchone():
+                cur.execute("DELETE FROM log_checkpoints WHERE fingerprint_len = 0")
+                cur.execute("""
+                    ALTER TABLE log_checkpoints
+                        ADD COLUMN complete TINYINT(1) NOT NULL DEFAULT 0,
+                        DROP PRIMARY KEY,
+                        ADD PRIMARY KEY (fingerprint)
+                """)
+                conn.commit()
+        except Error as e:
+            logging.info(f"Ajuste de esquema em log_checkpoints ok/ignorado: {e}")
+
+        # Mensagens já vistas no full_subjects.log mas ainda sem resultado no mail.log
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pending_messages (
+                message_id VARCHAR(64) NOT NULL PRIMARY KEY,
                 log_date DATE,
                 log_time TIME,
                 from_email VARCHAR(255),
                 to_email VARCHAR(255),
-                status VARCHAR(50),
                 origin_host VARCHAR(255),
                 origin_ip VARCHAR(45),
                 subject VARCHAR(255),
-                inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY uq_email_log (message_id, to_email, status)
+                flags TINYINT UNSIGNED NOT NULL DEFAULT 0,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         """)
         conn.commit()
 
-        # Migração leve (caso já existisse)
-        try:
-            cur.execute("SHOW COLUMNS FROM email_logs LIKE 'message_id'")
-            has_msgid = cur.fetchone()
-            if not has_msgid:
-                cur.execute("ALTER TABLE email_logs ADD COLUMN message_id VARCHAR(64) NOT NULL DEFAULT ''")
-                conn.commit()
-            cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='unique_email_log'")
-            if cur.fetchall():
-                cur.execute("ALTER TABLE email_logs DROP INDEX unique_email_log")
-                conn.commit()
-            cur.execute("SHOW INDEX FROM email_logs WHERE Key_name='uq_email_log'")
-            if not cur.fetchall():
-                cur.execute("ALTER TABLE email_logs ADD UNIQUE KEY uq_email_log (message_id, to_email, status)")
-                conn.commit()
-        except Error as e:
-            logging.info(f"Ajuste de esquema (migr.) ok/ignorado: {e}")
+        # Comunicação com o worker de importação separado (INGEST_MODE=separate): pedidos de importação
+        # manual feitos pela web e a situação da importação publicada pelo worker, numa linha só
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS import_control (
+                id TINYINT UNSIGNED NOT NULL PRIMARY KEY,
+                requested_at DATETIME NULL,
+                status TEXT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        cur.execute("INSERT IGNORE INTO import_control (id) VALUES (1)")
+        conn.commit()
+
+        # Totais por dia e status de email_logs, mantidos por insert_database, para contar relatórios
+        # filtrados só por data/status sem recontar a tabela. Preenchida a partir de email_logs na criação.
+        cur.execute("SHOW TABLES LIKE 'email_daily_counts'")
+        daily_counts_exists = cur.fetchone()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS email_daily_counts (
+                log_date DATE NOT NULL,
+                status VARCHAR(50) NOT NULL,
+                total INT UNSIGNED NOT NULL DEFAULT 0,
+                PRIMARY KEY (log_date, status)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        if not daily_counts_exists:
+            logging.info("Preenchendo email_daily_counts a partir de email_logs.")
+            cur.execute("""
+                INSERT INTO email_daily_counts (log_date, status, total)
+                SELECT log_date, status, COUNT(*) FROM email_logs
+                WHERE log_date IS NOT NULL AND status IS NOT NULL
+                GROUP BY log_date, status
+            """)
+        conn.commit()
+
+        # Totais por dia, status, domínio do remetente e host de origem, para o painel (/dashboard).
+        # Mantida junto com email_daily_counts por insert_database e preenchida na criação.
+        cur.execute("SHOW TABLES LIKE 'email_daily_rollup'")
+        rollup_exists = cur.fetchone()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS email_daily_rollup (
+                log_date DATE NOT NULL,
+                status VARCHAR(50) NOT NULL,
+                sender_domain VARCHAR(255) NOT NULL,
+                origin_host VARCHAR(255) NOT NULL,
+                total INT UNSIGNED NOT NULL DEFAULT 0,
+                PRIMARY KEY (log_date, status, sender_domain, origin_host)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        if not rollup_exists:
+            logging.info("Preenchendo email_daily_rollup a partir de email_logs.")
+            cur.execute("""
+                INSERT INTO email_daily_rollup (log_date, status, sender_domain, origin_host, total)
+                SELECT log_date, status, LOWER(SUBSTRING_INDEX(IFNULL(from_email, ''), '@', -1)), IFNULL(origin_host, ''), COUNT(*)
+                FROM email_logs
+                WHERE log_date IS NOT NULL AND status IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+            """)
+        conn.commit()
 
         cur.execute("""
             CREATE TABLE IF NOT EXISTS app_users (
@@ -126,29 +989,413 @@ def setup_database(auth_mode, db_host, db_user, db_password, db_name, db_port=33
     except Error as e:
         logging.error(f"Erro ao configurar o banco de dados: {e}")
 
-def insert_database(emails, host, user, password, database, db_port=3306):
-    if not emails:
-        logging.info("Nenhum e-mail novo para inserir.")
-        return False
+def load_checkpoints(host, user, password, database, db_port=3306):
+    """Retorna dict fingerprint -> checkpoint salvo (log_file, inode, byte_offset, fingerprint_len, complete)."""
+    conn = get_conn(host, user, password, database, db_port)
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT fingerprint, fingerprint_len, log_file, inode, byte_offset, complete FROM log_checkpoints")
+        checkpoints = {row['fingerprint']: row for row in cur.fetchall()}
+        cur.close()
+        return checkpoints
+    finally:
+        conn.close()
+
+def save_checkpoints(cursor, checkpoints):
+    """Grava os checkpoints usando o cursor informado (sem commit, para compor a transação do chamador)."""
+    # Arquivos vazios não têm fingerprint que os identifique
+    checkpoints = [cp for cp in checkpoints or [] if cp['fingerprint_len'] > 0]
+    if not checkpoints:
+        return
+    replaced = [(cp['replaces'],) for cp in checkpoints if cp.get('replaces')]
+    if replaced:
+        cursor.executemany("DELETE FROM log_checkpoints WHERE fingerprint=%s", replaced)
+    cursor.executemany("""
+        INSERT INTO log_checkpoints (fingerprint, fingerprint_len, log_file, inode, byte_offset, complete)
+        VALUES (%s,%s,%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE fingerprint_len=VALUES(fingerprint_len), log_file=VALUES(log_file),
+            inode=VALUES(inode), byte_offset=VALUES(byte_offset), complete=VALUES(complete)
+    """, [
+        (cp['fingerprint'], cp['fingerprint_len'], cp['log_file'], cp['inode'], cp['byte_offset'], int(cp['complete']))
+        for cp in checkpoints
+    ])
+
+def load_pending(host, user, password, database, db_port=3306):
+    """Retorna dict message_id -> details das mensagens pendentes (incluindo 'flags' e 'first_seen')."""
+    conn = get_conn(host, user, password, database, db_port)
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT message_id, log_date, log_time, from_email, to_email, origin_host AS host,
+                   origin_ip AS ip, subject, flags, first_seen
+            FROM pending_messages
+        """)
+        pending = {row.pop('message_id'): row for row in cur.fetchall()}
+        cur.close()
+        return pending
+    finally:
+        conn.close()
+
+def save_import_state(cursor, state):
+    """
+    Grava checkpoints e pendências produzidos por parse_log usando o cursor informado
+    (sem commit, para compor a transação do chamador).
+    """
+    if not state:
+        return
+    save_checkpoints(cursor, state.get('checkpoints'))
+    if state.get('pending_deletes'):
+        cursor.executemany("DELETE FROM pending_messages WHERE message_id=%s",
+                           [(msg_id,) for msg_id in state['pending_deletes']])
+    if state.get('pending_upserts'):
+        cursor.executemany("""
+            INSERT INTO pending_messages
+            (message_id, log_date, log_time, from_email, to_email, origin_host, origin_ip, subject, flags)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE flags=VALUES(flags)
+        """, [
+            (msg_id, d['log_date'], d['log_time'], d['from_email'], d['to_email'], d['host'], d['ip'], d['subject'], d['flags'])
+            for msg_id, d in state['pending_upserts']
+        ])
+
+# Erros transitórios em que a transação é refeita: deadlock e timeout de espera por lock
+RETRYABLE_ERRORS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+TRANSACTION_RETRIES = 3
+
+INSERT_EMAIL_LOGS = """
+    INSERT IGNORE INTO email_logs 
+    (message_id, log_date, log_time, from_email, to_email, status, origin_host, origin_ip, subject) 
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+
+# Máximo de IDs por consulta de existência (mantém a query pequena, longe de max_allowed_packet)
+DEDUP_CHUNK_SIZE = 500
+
+def filter_existing(cursor, records):
+    """
+    Remove de `records` os registros cujo message_id já existe em email_logs, consultando em
+    blocos de até DEDUP_CHUNK_SIZE IDs. Cada bloco é resolvido pelo prefixo message_id do índice
+    uq_email_log, então o custo depende do tamanho do lote e não do tamanho da tabela.
+    Erros são propagados: sem a verificação, o lote não deve ser gravado.
+    """
+    ids = list({record[0] for record in records})
+    # O log_date de um ID é sempre o mesmo (vem do full_subjects.log); filtrar por ele limita a
+    # consulta às partições dos dias do lote quando email_logs é particionada
+    dates = sorted({record[1] for record in records})
+    date_placeholders = ','.join(['%s'] * len(dates))
+    existing = set()
+    for i in range(0, len(ids), DEDUP_CHUNK_SIZE):
+        chunk = ids[i:i + DEDUP_CHUNK_SIZE]
+        placeholders = ','.join(['%s'] * len(chunk))
+        cursor.execute(f"SELECT DISTINCT message_id FROM {email_logs_table()} WHERE message_id IN ({placeholders}) "
+                       f"AND log_date IN ({date_placeholders})", chunk + dates)
+        existing.update(row[0] for row in cursor.fetchall())
+    if not existing:
+        return records
+    logging.debug(f"{len(existing)} IDs já existentes no DB; ignorando.")
+    return [record for record in records if record[0] not in existing]
+
+def sender_domain(from_email):
+    """Domínio do remetente como gravado em email_daily_rollup (mesma regra do SUBSTRING_INDEX do SQL)."""
+    return (from_email or '').rsplit('@', 1)[-1].lower()
+
+# Recontagem de dias a partir de email_logs, para cada tabela de totais
+ROLLUP_RECOUNT_SQL = (
+    """
+    INSERT INTO email_daily_counts (log_date, status, total)
+    SELECT log_date, status, COUNT(*) FROM email_logs
+    WHERE log_date IN ({dates}) AND status IS NOT NULL
+    GROUP BY log_date, status
+    ON DUPLICATE KEY UPDATE total = VALUES(total)
+    """,
+    """
+    INSERT INTO email_daily_rollup (log_date, status, sender_domain, origin_host, total)
+    SELECT log_date, status, LOWER(SUBSTRING_INDEX(IFNULL(from_email, ''), '@', -1)), IFNULL(origin_host, ''), COUNT(*)
+    FROM email_logs
+    WHERE log_date IN ({dates}) AND status IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    ON DUPLICATE KEY UPDATE total = VALUES(total)
+    """,
+)
+
+def update_rollups(cursor, records, inserted):
+    """
+    Atualiza as tabelas de totais (email_daily_counts e email_daily_rollup) com os registros
+    recém-gravados, na transação do lote. Se o INSERT IGNORE descartou parte do lote (não se sabe
+    quais), recalcula os dias afetados a partir de email_logs, mantendo os totais consistentes.
+    """
+    if inserted == len(records):
+        counts = {}
+        rollup = {}
+        for record in records:
+            key = (record[1], record[5])  # log_date, status
+            counts[key] = counts.get(key, 0) + 1
+            key += (sender_domain(record[3]), record[6] or '')  # from_email, origin_host
+            rollup[key] = rollup.get(key, 0) + 1
+        cursor.executemany("""
+            INSERT INTO email_daily_counts (log_date, status, total) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+        """, [key + (total,) for key, total in counts.items()])
+        cursor.executemany("""
+            INSERT INTO email_daily_rollup (log_date, status, sender_domain, origin_host, total)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+        """, [key + (total,) for key, total in rollup.items()])
+        return
+    dates = sorted({record[1] for record in records})
+    placeholders = ','.join(['%s'] * len(dates))
+    for sql in ROLLUP_RECOUNT_SQL:
+        cursor.execute(sql.format(dates=placeholders), dates)
+
+def run_transaction(conn, work, description):
+    """
+    Executa work() e faz commit; em deadlock ou lock wait timeout desfaz e tenta de novo
+    (até TRANSACTION_RETRIES vezes). Demais erros são propagados após o rollback.
+    """
+    for attempt in range(1, TRANSACTION_RETRIES + 1):
+        try:
+            result = work()
+            conn.commit()
+            return result
+        except Error as e:
+            conn.rollback()
+            if e.errno not in RETRYABLE_ERRORS or attempt == TRANSACTION_RETRIES:
+                raise
+            logging.warning(f"{description}: {e}; tentativa {attempt}/{TRANSACTION_RETRIES}, repetindo.")
+            time.sleep(0.5 * attempt)
+
+def insert_database(emails, host, user, password, database, db_port=3306, state=None, batch_size=1000):
+    """
+    Insere os registros de `emails` (qualquer iterável, tipicamente o gerador de parse_log) em lotes
+    de `batch_size`, cada um com commit próprio, para limitar memória e tempo de lock em email_logs.
+    Registros cujo message_id já existe no DB são descartados (filter_existing).
+    Após o último lote grava o estado da importação (checkpoints dos logs e pendências). Se a
+    importação for interrompida antes disso, a próxima execução relê os mesmos bytes e os lotes já
+    gravados são descartados pelo INSERT IGNORE, sem duplicar registros.
+    Retorna os registros gravados (0 se não havia nada novo). Erros (do MySQL ou da leitura dos logs
+    por `emails`) são registrados e propagados, para que a importação termine como falha.
+    """
+    conn = None
+    cursor = None
     try:
         conn = get_conn(host, user, password, database, db_port)
         cursor = conn.cursor()
-        insert_query = """
-            INSERT IGNORE INTO email_logs 
-            (message_id, log_date, log_time, from_email, to_email, status, origin_host, origin_ip, subject) 
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        """
-        cursor.executemany(insert_query, emails)
-        conn.commit()
-        rowcount = cursor.rowcount
-        logging.info(f"{rowcount} novos logs inseridos no banco de dados.")
+        started = time.monotonic()
+        received = 0
+        rowcount = 0
+        batch = []
+
+        def write_batch():
+            fresh = filter_existing(cursor, batch)
+            if not fresh:
+                return 0
+            if COMPACT_STORAGE:
+                cursor.executemany(INSERT_COMPACT_LOGS, encode_compact(conn, cursor, fresh))
+            else:
+                cursor.executemany(INSERT_EMAIL_LOGS, fresh)
+            inserted = cursor.rowcount
+            update_rollups(cursor, fresh, inserted)
+            return inserted
+
+        for record in emails or ():
+            batch.append(record)
+            received += 1
+            if len(batch) >= batch_size:
+                batch_started = time.monotonic()
+                inserted = run_transaction(conn, write_batch, f"Lote de {len(batch)} registros")
+                if inserted:
+                    bump_generation()
+                rowcount += inserted
+                if state is not None:
+                    state['inserted'] = rowcount
+                elapsed = time.monotonic() - batch_started
+                logging.info(f"Lote gravado: {inserted}/{len(batch)} registros em {elapsed:.2f}s "
+                             f"({len(batch) / elapsed if elapsed else 0:.0f} registros/s).")
+                batch = []
+        if batch:
+            inserted = run_transaction(conn, write_batch, f"Lote de {len(batch)} registros")
+            if inserted:
+                bump_generation()
+            rowcount += inserted
+        if state:
+            state['inserted'] = rowcount
+            state['phase'] = 'estado'
+            run_transaction(conn, lambda: save_import_state(cursor, state), "Estado da importação")
+        if not received:
+            logging.info("Nenhum e-mail novo para inserir.")
+            return 0
+        elapsed = time.monotonic() - started
+        logging.info(f"{rowcount} novos logs inseridos no banco de dados ({received} processados em {elapsed:.2f}s, "
+                     f"{received / elapsed if elapsed else 0:.0f} registros/s).")
         return rowcount
     except Error as e:
         logging.error(f"Erro ao inserir no banco de dados: {e}")
-        return False
+        raise
     finally:
         try:
             cursor.close()
             conn.close()
         except:
-            pass
\ No newline at end of file
+            pass
+
+# Trava (GET_LOCK) que garante uma importação por vez entre processos e instâncias da aplicação
+IMPORT_LOCK_NAME = 'smtp_relay_import'
+
+def acquire_import_lock(host, user, password, database, db_port=3306):
+    """
+    Obtém a trava de importação no MySQL, sem esperar. Retorna a conexão que a mantém (a trava vale
+    enquanto ela estiver aberta; libere com release_import_lock) ou None se outra importação a tem.
+    """
+    conn = get_conn(host, user, password, database, db_port)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT GET_LOCK(%s, 0)", (IMPORT_LOCK_NAME,))
+        if cur.fetchone()[0] == 1:
+            return conn
+    except Error as e:
+        logging.error(f"Erro ao obter a trava de importação: {e}")
+    finally:
+        cur.close()
+    conn.close()
+    return None
+
+def release_import_lock(conn):
+    """Libera a trava de acquire_import_lock; se não der, descarta a conexão (o que também a libera)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (IMPORT_LOCK_NAME,))
+        cur.fetchone()
+        cur.close()
+        conn.close()
+    except Error as e:
+        logging.warning(f"Erro ao liberar a trava de importação ({e}); descartando a conexão.")
+        conn.discard()
+
+def request_import(conn):
+    """Pede ao worker de importação uma importação manual; pedidos ainda não atendidos se juntam."""
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE import_control SET requested_at = COALESCE(requested_at, NOW()) WHERE id = 1")
+        conn.commit()
+    finally:
+        cur.close()
+
+def take_import_request(conn):
+    """Worker: consome o pedido de importação manual pendente; retorna True se havia um."""
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE import_control SET requested_at = NULL WHERE id = 1 AND requested_at IS NOT NULL")
+        taken = cur.rowcount > 0
+        conn.commit()
+        return taken
+    finally:
+        cur.close()
+
+def save_import_status(conn, status):
+    """Worker: publica a situação da importação (texto JSON) para as páginas servidas por outros processos."""
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE import_control SET status = %s WHERE id = 1", (status,))
+        conn.commit()
+    finally:
+        cur.close()
+
+def load_import_status(conn):
+    """(situação publicada pelo worker em JSON ou None, se há pedido manual aguardando o worker)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT status, requested_at IS NOT NULL FROM import_control WHERE id = 1")
+        row = cur.fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+    finally:
+        cur.close()
+
+# Carga histórica em massa (backfill.py): os registros são gravados em CSV, carregados com
+# LOAD DATA LOCAL INFILE numa tabela de passagem sem índices e só então mesclados em email_logs
+STAGING_COLUMNS = "message_id, log_date, log_time, from_email, to_email, status, origin_host, origin_ip, subject"
+
+def get_bulk_conn(host, user, password, database, port=3306):
+    """Conexão dedicada (fora do pool) com LOAD DATA LOCAL INFILE habilitado no cliente."""
+    return mysql.connector.connect(host=host, user=user, password=password, database=database, port=port,
+                                   allow_local_infile=True, autocommit=False)
+
+def prepare_staging(cursor):
+    """Cria (se preciso) e esvazia a tabela de passagem email_logs_staging."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_logs_staging (
+            message_id VARCHAR(64) NOT NULL,
+            log_date DATE NOT NULL,
+            log_time TIME,
+            from_email VARCHAR(255),
+            to_email VARCHAR(255),
+            status VARCHAR(50),
+            origin_host VARCHAR(255),
+            origin_ip VARCHAR(45),
+            subject VARCHAR(255)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute("TRUNCATE TABLE email_logs_staging")
+
+def load_staging(cursor, csv_path):
+    """
+    Carrega um CSV (csv.QUOTE_ALL, aspas dobradas, sem escape por barra) em email_logs_staging.
+    Retorna o número de linhas carregadas.
+    """
+    cursor.execute(f"""
+        LOAD DATA LOCAL INFILE %s INTO TABLE email_logs_staging
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\n'
+        ({STAGING_COLUMNS})
+    """, (csv_path,))
+    return cursor.rowcount
+
+def merge_staging(cursor):
+    """
+    Mescla email_logs_staging em email_logs descartando IDs já existentes (mesma regra de
+    filter_existing, com log_date para limitar as partições consultadas), recalcula os totais
+    diários dos dias carregados e esvazia a tabela de passagem, sem commit (transação do chamador).
+    Retorna o número de registros inseridos.
+    """
+    if COMPACT_STORAGE:
+        cursor.execute("""
+            INSERT IGNORE INTO email_addresses (address)
+            SELECT from_email FROM email_logs_staging WHERE from_email IS NOT NULL
+            UNION
+            SELECT to_email FROM email_logs_staging WHERE to_email IS NOT NULL
+        """)
+        cursor.execute("""
+            INSERT IGNORE INTO email_hosts (host)
+            SELECT DISTINCT origin_host FROM email_logs_staging WHERE origin_host IS NOT NULL
+        """)
+        cursor.execute("""
+            INSERT IGNORE INTO email_logs_compact
+            (message_id, log_date, log_time, from_id, to_id, status, host_id, origin_ip, subject)
+            SELECT s.message_id, s.log_date, s.log_time, f.id, t.id, s.status, h.id,
+                   INET6_ATON(NULLIF(s.origin_ip, '')), s.subject
+            FROM email_logs_staging s
+            LEFT JOIN email_addresses f ON f.address = s.from_email
+            LEFT JOIN email_addresses t ON t.address = s.to_email
+            LEFT JOIN email_hosts h ON h.host = s.origin_host
+            WHERE NOT EXISTS (
+                SELECT 1 FROM email_logs_compact e WHERE e.message_id = s.message_id AND e.log_date = s.log_date
+            )
+        """)
+    else:
+        cursor.execute(f"""
+            INSERT IGNORE INTO email_logs ({STAGING_COLUMNS})
+            SELECT {STAGING_COLUMNS} FROM email_logs_staging s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM email_logs e WHERE e.message_id = s.message_id AND e.log_date = s.log_date
+            )
+        """)
+    inserted = cursor.rowcount
+    cursor.execute("SELECT DISTINCT log_date FROM email_logs_staging")
+    dates = [row[0] for row in cursor.fetchall()]
+    if inserted and dates:
+        placeholders = ','.join(['%s'] * len(dates))
+        for sql in ROLLUP_RECOUNT_SQL:
+            cursor.execute(sql.format(dates=placeholders), dates)
+    # DELETE e não TRUNCATE: TRUNCATE faria commit implícito no meio da transação
+    cursor.execute("DELETE FROM email_logs_staging")
+    return inserted
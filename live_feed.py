@@ -0,0 +1,161 @@
+"""
+Envio ao vivo das linhas recém-importadas aos relatórios abertos (server-sent events em /api/report/stream).
+
+Uma única thread (run_live_feed) espera a geração de importação mudar (report_cache.bump_generation,
+a cada lote gravado), lê de email_logs uma vez só as linhas com id acima do último visto e entrega a
+cada assinante as que casam com o filtro do seu relatório, comparadas aqui em memória. O custo no
+banco é uma consulta por lote importado, com um ou com muitos relatórios abertos; cada assinante
+ocupa só uma fila e a thread da sua conexão HTTP, nunca uma conexão do banco.
+"""
+import functools
+import logging
+import queue
+import re
+import threading
+import time
+import unicodedata
+
+from mysql.connector import Error
+
+from database import get_conn, REPORT_COLUMNS
+from report_cache import generation_tag, wait_generation
+
+LIVE_MAX_SUBSCRIBERS = 100  # acima disso o stream responde 503 e a página volta a consultar a cada minuto
+LIVE_MAX_ROWS = 1000  # linhas novas por rodada; acima disso (ex.: backfill) os assinantes recarregam a página
+LIVE_QUEUE_SIZE = 100  # rodadas pendentes por assinante; quem não acompanha recebe 'reload'
+LIVE_HEARTBEAT_SECONDS = 15
+
+_subscribers = []
+_subscribers_lock = threading.Lock()
+
+def subscribe(filters):
+    """Registra um assinante com os filtros de app.report_args; retorna o assinante, ou None se não há vaga."""
+    with _subscribers_lock:
+        if len(_subscribers) >= LIVE_MAX_SUBSCRIBERS:
+            return None
+        subscriber = {'filters': filters, 'queue': queue.Queue(LIVE_QUEUE_SIZE), 'stale': False}
+        _subscribers.append(subscriber)
+        return subscriber
+
+def unsubscribe(subscriber):
+    with _subscribers_lock:
+        if subscriber in _subscribers:
+            _subscribers.remove(subscriber)
+
+def _seconds(value):
+    """Segundos desde a meia-noite de um time (filtro) ou timedelta (coluna TIME lida do MySQL)."""
+    if hasattr(value, 'total_seconds'):
+        return int(value.total_seconds())
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def _fold(text):
+    """Texto comparável como na collation de email_logs (utf8mb4_0900_ai_ci): sem acentos nem maiúsculas."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+@functools.lru_cache(maxsize=256)
+def _like_regex(pattern):
+    """Regex equivalente ao LIKE do MySQL para `pattern` já em _fold: % e _ curingas, \\ escapa o seguinte."""
+    parts = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == '\\':
+            parts.append(re.escape(next(chars, '\\')))
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.DOTALL)
+
+def _like(value, pattern):
+    """`value LIKE pattern`; NULL (None) nunca casa, como no SQL."""
+    return value is not None and _like_regex(_fold(pattern)).fullmatch(_fold(value)) is not None
+
+def row_matches(row, filters):
+    """
+    Se `row` entra no relatório de `filters`: cada condição de database.report_filters avaliada numa
+    linha já lida, com a mesma semântica do MySQL (NULL não casa; comparação sem acentos nem
+    maiúsculas, como a collation de email_logs; LIKE com curingas). Na busca de assunto indexada o
+    FULLTEXT só adianta a busca: quem decide é o LIKE, avaliado aqui.
+    """
+    if filters['start_date'] and filters['end_date']:
+        if row['log_date'] is None or not filters['start_date'] <= row['log_date'] <= filters['end_date']:
+            return False
+    if filters['start_time'] and filters['end_time']:
+        if row['log_time'] is None or not (_seconds(filters['start_time']) <= _seconds(row['log_time'])
+                                           <= _seconds(filters['end_time'])):
+            return False
+    if filters['search_email']:
+        if filters['search_mode'] == 'indexed':
+            # Prefixos literais (report_filters escapa os curingas com _like_prefix)
+            term = _fold(filters['search_email'].strip())
+            to_email = _fold(row['to_email']) if row['to_email'] is not None else None
+            if to_email is None:
+                found = False
+            elif term.startswith('@'):
+                found = to_email.endswith(term)
+            elif '@' in term:
+                found = to_email.startswith(term)
+            else:
+                found = to_email.startswith(term) or to_email.endswith(term)
+        else:
+            found = _like(row['to_email'], f"%{filters['search_email']}%")
+        if not found:
+            return False
+    if filters['search_subject'] and not _like(row['subject'], f"%{filters['search_subject']}%"):
+        return False
+    if filters['status_filter'] == 'failed' and (row['status'] is None or _fold(row['status']) == 'sent'):
+        return False
+    return True
+
+def _publish(kind, rows=None):
+    """Entrega ('rows', linhas do filtro de cada assinante) ou ('reload', None) a todos os assinantes."""
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        matched = [row for row in rows if row_matches(row, subscriber['filters'])] if rows else None
+        if kind == 'rows' and not matched:
+            continue
+        try:
+            subscriber['queue'].put_nowait((kind, matched))
+        except queue.Full:
+            subscriber['stale'] = True
+
+def run_live_feed(host, user, password, database, db_port=3306):
+    """Thread de envio: a cada mudança da geração, lê as linhas novas uma vez e as distribui."""
+    tag = None
+    last_id = None
+    while True:
+        current = wait_generation(tag, LIVE_HEARTBEAT_SECONDS) if last_id is not None else generation_tag()
+        if current == tag:
+            continue
+        conn = None
+        try:
+            conn = get_conn(host, user, password, database, db_port)
+            cur = conn.cursor(dictionary=True)
+            # O fim de email_logs é lido antes de olhar os assinantes: quem assinar depois disso já
+            # recebe, na própria consulta inicial (since_id), tudo até aqui
+            cur.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM email_logs")
+            newest = cur.fetchone()['last_id']
+            with _subscribers_lock:
+                listening = bool(_subscribers)
+            if last_id is not None and listening and newest > last_id:
+                cur.execute(f"SELECT {REPORT_COLUMNS} FROM email_logs WHERE id > %s AND id <= %s ORDER BY id LIMIT %s",
+                            (last_id, newest, LIVE_MAX_ROWS + 1))
+                rows = cur.fetchall()
+                if len(rows) > LIVE_MAX_ROWS:
+                    logging.info(f"Mais de {LIVE_MAX_ROWS} registros novos; os relatórios ao vivo serão recarregados.")
+                    _publish('reload')
+                else:
+                    _publish('rows', rows)
+            cur.close()
+            last_id = max(last_id or 0, newest)
+            tag = current
+        except Error as e:
+            logging.error(f"Erro ao ler os registros novos para os relatórios ao vivo: {e}")
+            time.sleep(LIVE_HEARTBEAT_SECONDS)
+        finally:
+            if conn:
+                conn.close()
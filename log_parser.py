@@ -1,80 +1,440 @@
 import os
 import re
-from datetime import datetime
+import hashlib
+import gzip
+import bz2
+import io
+import multiprocessing
+from datetime import datetime, timedelta
 import logging
-from database import get_conn
+from database import load_checkpoints, load_pending
 
 EXIM_ID_RE = re.compile(r'\b([0-9A-Za-z]{6,}(?:-[0-9A-Za-z]{2,}){2})\b')
 DATE_TIME_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2})')
 COMPLETED_RE = re.compile(r'\bCompleted\b')
+# Layout usual do mainlog do Exim: data, hora e o ID na coluna 20 (ASCII, casado em bytes).
+# Um ID aqui tem exatamente as três partes de EXIM_ID_RE e é seguido de espaço, então é o mesmo
+# que EXIM_ID_RE.search encontraria na linha decodificada.
+MAIL_LINE_PREFIX_RE = re.compile(rb'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d ([0-9A-Za-z]{6,}-[0-9A-Za-z]{2,}-[0-9A-Za-z]{2,}) ')
 
-def parse_full_subjects(log_path: str) -> dict:
-    """Parseia o arquivo full_subjects.log e retorna dict de message_id -> details."""
-    messages = {}
+# Leitura paralela (workers > 1): tamanho de cada faixa de bytes entregue a um processo. Só compensa
+# abrir o pool quando há ao menos duas faixas de bytes novos num arquivo não compactado.
+SHARD_BYTES = 16 * 1024 * 1024
+# Campos de details (parse_subject_line), na ordem das tuplas devolvidas pelos processos da leitura paralela
+SUBJECT_FIELDS = ('log_date', 'log_time', 'from_email', 'to_email', 'host', 'ip', 'subject')
+
+# Flags acumuladas por ID a partir do mail.log (bitmask, para manter o estado em memória compacto)
+FLAG_DELIVERY = 1
+FLAG_REJECT = 2
+FLAG_COMPLETED = 4
+# IDs pendentes há mais tempo que isso (ex.: congelados na fila do Exim) são descartados
+PENDING_RETENTION_DAYS = 7
+
+# Quantidade de bytes do início do arquivo usada para identificá-lo entre execuções
+FINGERPRINT_BYTES = 1024
+# Sufixos gerados pelo logrotate: base.1, base.2.gz, base-20251017, base-20251017.bz2
+ROTATED_SUFFIX_RE = re.compile(r'^(?:\.(\d+)|-(\d{8}))(\.gz|\.bz2)?$')
+
+def _open_stream(log_path: str):
+    """Abre o arquivo em modo binário, descompactando .gz/.bz2 em streaming (sem gravar em disco)."""
+    if log_path.endswith('.gz'):
+        return gzip.open(log_path, 'rb')
+    if log_path.endswith('.bz2'):
+        return bz2.open(log_path, 'rb')
+    return open(log_path, 'rb')
+
+def find_checkpoint(checkpoints: dict, head: bytes):
+    """
+    Localiza o checkpoint do arquivo pelo fingerprint dos primeiros bytes (conteúdo descompactado).
+    Um checkpoint gravado quando o arquivo ainda era menor que FINGERPRINT_BYTES é reconhecido
+    pelo prefixo correspondente; prevalece o de maior fingerprint_len.
+    """
+    for fp_len in sorted({cp['fingerprint_len'] for cp in checkpoints.values()}, reverse=True):
+        if fp_len == 0 or fp_len > len(head):
+            continue
+        cp = checkpoints.get(hashlib.sha1(head[:fp_len]).hexdigest())
+        if cp:
+            return cp
+    return None
+
+def open_log(log_path: str, checkpoints: dict = None):
+    """
+    Abre o log em modo binário já posicionado no ponto de retomada.
+    Retorna (arquivo, offset inicial, checkpoint base do arquivo), ou None se o arquivo já foi
+    lido por completo em execução anterior (arquivos rotacionados são reconhecidos pelo
+    fingerprint, mesmo após renomeados ou compactados, sem reler o conteúdo).
+    Se o checkpoint não confere (arquivo novo ou truncado), a leitura recomeça do byte 0.
+    """
+    f = _open_stream(log_path)
+    try:
+        st = os.fstat(f.fileno())
+        head = f.read(FINGERPRINT_BYTES)
+        cp = find_checkpoint(checkpoints or {}, head)
+        start = 0
+        if cp:
+            if cp['complete']:
+                logging.debug(f"{log_path}: já importado por completo; ignorando.")
+                f.close()
+                return None
+            compressed = log_path.endswith(('.gz', '.bz2'))
+            if not compressed and st.st_size < cp['byte_offset']:
+                logging.warning(f"{log_path}: arquivo truncado ({st.st_size} < {cp['byte_offset']}); relendo desde o início.")
+            else:
+                start = cp['byte_offset']
+        f.seek(start)
+    except BaseException:
+        f.close()
+        raise
+    fingerprint = hashlib.sha1(head).hexdigest()
+    base = {
+        'log_file': log_path,
+        'inode': st.st_ino,
+        'byte_offset': start,
+        'fingerprint': fingerprint,
+        'fingerprint_len': len(head),
+        'complete': False,
+        # Checkpoint anterior do mesmo arquivo gravado com fingerprint mais curto, a ser substituído
+        'replaces': cp['fingerprint'] if cp and cp['fingerprint'] != fingerprint else None,
+    }
+    return f, start, base
+
+def read_complete_lines(f, start: int, active: bool = True):
+    """
+    Gera (offset, linha) a partir de `start`, apenas para linhas terminadas em '\\n'.
+    No log ativo, uma última linha incompleta (ainda sendo escrita pelo Exim) é deixada para a
+    próxima execução; em arquivos rotacionados, que não crescem mais, ela é aproveitada.
+    """
+    offset = start
+    for raw in f:
+        if not raw.endswith(b'\n') and active:
+            break
+        yield offset, raw
+        offset += len(raw)
+
+def usable_workers(workers: int):
+    """`workers` limitado às CPUs disponíveis ao processo: com menos núcleos, a leitura paralela só custa mais."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, min(workers, cpus))
+
+def _process_pool(workers: int):
+    # spawn: o importador roda em thread do Flask/agendador, e fork com threads ativas pode travar
+    return multiprocessing.get_context('spawn').Pool(workers)
+
+class SharedPool:
+    """
+    Pool de processos da leitura paralela, aberto só no primeiro arquivo que precisar dele e
+    reaproveitado pelos demais da mesma importação (iniciar processos com spawn custa segundos).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pool = None
+
+    def get(self):
+        if self.pool is None:
+            self.pool = _process_pool(self.workers)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+def _complete_end(f, size: int, active: bool):
+    """Fim da última linha completa do log ativo; em rotacionados, o próprio tamanho do arquivo."""
+    if not active:
+        return size
+    pos = size
+    while pos > 0:
+        step = min(65536, pos)
+        f.seek(pos - step)
+        i = f.read(step).rfind(b'\n')
+        if i >= 0:
+            return pos - step + i + 1
+        pos -= step
+    return 0
+
+def split_ranges(f, start: int, end: int, shard_bytes: int = SHARD_BYTES):
+    """Divide [start, end) em faixas de ~shard_bytes que começam e terminam em limites de linha."""
+    bounds = [start]
+    pos = start + shard_bytes
+    while pos < end:
+        f.seek(pos)
+        f.readline()
+        pos = f.tell()
+        if pos >= end:
+            break
+        bounds.append(pos)
+        pos += shard_bytes
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def _read_range(log_path: str, start: int, end: int):
+    with open(log_path, 'rb') as f:
+        f.seek(start)
+        return io.BytesIO(f.read(end - start))
+
+def _scan_mail_range(args):
+    """Worker: flags (msg_id -> bitmask) das linhas do mail.log na faixa [start, end)."""
+    log_path, start, end = args
+    groups = {}
+    for raw in _read_range(log_path, start, end):
+        hit = classify_mail_line(raw)
+        if hit:
+            msg_id, flag = hit
+            groups[msg_id] = groups.get(msg_id, 0) | flag
+    return groups
+
+def _parse_subjects_range(args):
+    """
+    Worker: lista ordenada de tuplas (message_id, *SUBJECT_FIELDS) das linhas do full_subjects.log
+    na faixa [start, end). Tuplas em vez dos dicts de details: metade do custo de serialização.
+    """
+    log_path, start, end = args
+    parsed = (parse_subject_line(raw.decode('utf-8', errors='replace')) for raw in _read_range(log_path, start, end))
+    return [(msg_id, *[details[field] for field in SUBJECT_FIELDS]) for msg_id, details in filter(None, parsed)]
+
+def merge_flags(target: dict, groups: dict):
+    """Combina flags de outro shard/arquivo em `target` (OR bit a bit: associativo e comutativo)."""
+    for msg_id, flags in groups.items():
+        target[msg_id] = target.get(msg_id, 0) | flags
+    return target
+
+def _parallel_ranges(f, log_path: str, start: int, active: bool, workers: int):
+    """Faixas para leitura paralela, ou None se o arquivo deve ser lido em série."""
+    if usable_workers(workers) <= 1 or log_path.endswith(('.gz', '.bz2')):
+        return None
+    end = _complete_end(f, os.fstat(f.fileno()).st_size, active)
+    if end - start < 2 * SHARD_BYTES:
+        return None
+    return split_ranges(f, start, end)
+
+def parse_subject_line(line: str):
+    """Parseia uma linha do full_subjects.log; retorna (message_id, details) ou None."""
+    line = line.strip()
+    if not line:
+        return None
+    # Divide apenas nos primeiros 6 pipes, preservando o Subject
+    fields = line.split('|', 6)
+    if len(fields) < 7:
+        return None
+    fields = [field.strip() for field in fields]
+    details = {}
+    for field in fields[:-1]:  # Exclui Subject por enquanto
+        if ':' in field:
+            key, value = field.split(':', 1)
+            key = key.strip().lower().replace('-', '_')
+            value = value.strip()
+            details[key] = value
+    # Subject é o último campo, após o último pipe
+    subject = fields[-1].split(':', 1)[-1].strip() if ':' in fields[-1] else fields[-1].strip()
+    if 'message_id' not in details:
+        return None
+    msg_id = details['message_id']
+    date_str = details.get('date', '')
+    try:
+        dt = datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %z")
+        log_date = dt.date()
+        log_time = dt.time().strftime("%H:%M:%S")
+    except ValueError:
+        logging.warning(f"Formato de data inválido para ID {msg_id}: {date_str}")
+        return None
+    from_email = details.get('from', '')
+    from_m = re.search(r'<([^>]+)>', from_email)
+    if from_m:
+        from_email = from_m.group(1)
+    to_email = details.get('to', '')
+    host = details.get('origin_host', '')
+    ip = details.get('origin_ip', '')
+    has_origin = bool(from_email) and bool(host) and bool(ip) and bool(to_email)
+    if not has_origin:
+        logging.info(f"ID {msg_id} com origem incompleta ou sem to_email no full_subjects.log; ignorando.")
+        return None
+    return msg_id, {
+        'log_date': log_date,
+        'log_time': log_time,
+        'from_email': from_email,
+        'to_email': to_email,
+        'host': host,
+        'ip': ip,
+        'subject': subject
+    }
+
+def parse_full_subjects(log_path: str, checkpoints: dict = None, active: bool = True, workers: int = 1,
+                        pool: SharedPool = None):
+    """
+    Parseia o full_subjects.log (ou um rotacionado) a partir do checkpoint e retorna (messages, checkpoint),
+    onde messages é um iterador de (message_id, details) consumido em streaming e checkpoint acompanha
+    o consumo, apontando para o fim da última linha lida. checkpoint é None se não há o que ler.
+    Com workers > 1, faixas do arquivo são parseadas em paralelo, `workers` por vez, e entregues na
+    ordem original, produzindo a mesma sequência da leitura em série. `pool` é o SharedPool da
+    importação; sem ele, um pool é aberto e fechado só para este arquivo.
+    """
+    try:
+        opened = open_log(log_path, checkpoints)
+    except FileNotFoundError:
+        logging.warning(f"Arquivo {os.path.basename(log_path)} não encontrado.")
+        return iter(()), None
+    if opened is None:
+        return iter(()), None
+    f, offset, cp = opened
+
+    def messages():
+        with f:
+            for line_offset, raw in read_complete_lines(f, offset, active):
+                cp['byte_offset'] = line_offset + len(raw)
+                parsed = parse_subject_line(raw.decode('utf-8', errors='replace'))
+                if parsed:
+                    yield parsed
+        cp['complete'] = not active
+
+    def messages_parallel(ranges, shared):
+        f.close()
+        try:
+            for i in range(0, len(ranges), shared.workers):
+                window = ranges[i:i + shared.workers]
+                results = shared.get().map(_parse_subjects_range, [(log_path, start, end) for start, end in window])
+                for (_, end), parsed in zip(window, results):
+                    cp['byte_offset'] = end
+                    for msg_id, *values in parsed:
+                        yield msg_id, dict(zip(SUBJECT_FIELDS, values))
+        finally:
+            if shared is not pool:
+                shared.close()
+        cp['complete'] = not active
+
+    ranges = _parallel_ranges(f, log_path, offset, active, workers)
+    if ranges:
+        shared = pool or SharedPool(usable_workers(workers))
+        logging.info(f"{log_path}: parseando {len(ranges)} faixas com {shared.workers} processos.")
+        return messages_parallel(ranges, shared), cp
+    f.seek(offset)
+    return messages(), cp
+
+def classify_mail_line_regex(line: str):
+    """
+    Classificação de referência de uma linha (decodificada) do mail.log, via regex.
+    Retorna (msg_id, flag) para linhas de entrega, rejeição ou Completed; None para as demais.
+    """
+    line = line.rstrip('\n').rstrip('\r')
+    if not line.strip():
+        return None
+    dtm = DATE_TIME_RE.match(line)
+    if not dtm:
+        return None
+    idm = EXIM_ID_RE.search(line)
+    if not idm:
+        return None
+    if ' ** ' in line:
+        flag = FLAG_REJECT
+    elif ' => ' in line or ' -> ' in line:
+        flag = FLAG_DELIVERY
+    elif COMPLETED_RE.search(line):
+        flag = FLAG_COMPLETED
+    else:
+        return None
+    return idm.group(1), flag
+
+def classify_mail_line(raw: bytes):
+    """
+    Classifica uma linha do mail.log direto em bytes, com o mesmo resultado de classify_mail_line_regex.
+    Linhas sem marcador de interesse são descartadas só com buscas de substring; nas demais, data e
+    ID são lidos de uma vez por MAIL_LINE_PREFIX_RE, ancorada no layout do Exim ('AAAA-MM-DD HH:MM:SS ID flag ...').
+    Linhas fora desse layout (pid, fuso horário, ID em outra coluna etc.) caem no caminho por regex.
+    """
+    if b' ** ' in raw:
+        flag = FLAG_REJECT
+    elif b' => ' in raw or b' -> ' in raw:
+        flag = FLAG_DELIVERY
+    elif b'Completed' in raw:
+        flag = FLAG_COMPLETED
+    else:
+        return None
+    m = MAIL_LINE_PREFIX_RE.match(raw)
+    if not m:
+        return classify_mail_line_regex(raw.decode('utf-8', errors='replace'))
+    end = m.end()
+    if flag == FLAG_COMPLETED and (raw[end:end + 9] != b'Completed'
+                                   or raw[end + 9:end + 10] not in (b'', b' ', b'\r', b'\n')):
+        # 'Completed' fora da posição usual: a regex decide se é uma palavra inteira
+        return classify_mail_line_regex(raw.decode('utf-8', errors='replace'))
+    return m.group(1).decode('ascii'), flag
+
+def scan_mail_log(log_path: str, checkpoints: dict = None, active: bool = True, workers: int = 1,
+                  pool: SharedPool = None):
+    """
+    Lê o mail.log (ou um rotacionado) a partir do checkpoint e retorna (groups, checkpoint), onde groups é um dict
+    msg_id -> flags (FLAG_DELIVERY | FLAG_REJECT | FLAG_COMPLETED). checkpoint é None se não há o que ler.
+    Com workers > 1, faixas do arquivo são lidas em processos separados (do SharedPool `pool`, ou de
+    um aberto só para este arquivo) e combinadas com merge_flags, com o mesmo resultado da leitura em série.
+    """
+    groups = {}
     try:
-        with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
-            for raw in f:
-                line = raw.strip()
-                if not line:
-                    continue
-                # Divide apenas nos primeiros 6 pipes, preservando o Subject
-                fields = line.split('|', 6)
-                if len(fields) < 7:
-                    continue
-                fields = [field.strip() for field in fields]
-                details = {}
-                for field in fields[:-1]:  # Exclui Subject por enquanto
-                    if ':' in field:
-                        key, value = field.split(':', 1)
-                        key = key.strip().lower().replace('-', '_')
-                        value = value.strip()
-                        details[key] = value
-                # Subject é o último campo, após o último pipe
-                subject = fields[-1].split(':', 1)[-1].strip() if ':' in fields[-1] else fields[-1].strip()
-                if 'message_id' not in details:
-                    continue
-                msg_id = details['message_id']
-                date_str = details.get('date', '')
-                try:
-                    dt = datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %z")
-                    log_date = dt.date()
-                    log_time = dt.time().strftime("%H:%M:%S")
-                except ValueError:
-                    logging.warning(f"Formato de data inválido para ID {msg_id}: {date_str}")
-                    continue
-                from_email = details.get('from', '')
-                from_m = re.search(r'<([^>]+)>', from_email)
-                if from_m:
-                    from_email = from_m.group(1)
-                to_email = details.get('to', '')
-                host = details.get('origin_host', '')
-                ip = details.get('origin_ip', '')
-                has_origin = bool(from_email) and bool(host) and bool(ip) and bool(to_email)
-                if not has_origin:
-                    logging.info(f"ID {msg_id} com origem incompleta ou sem to_email no full_subjects.log; ignorando.")
-                    continue
-                messages[msg_id] = {
-                    'log_date': log_date,
-                    'log_time': log_time,
-                    'from_email': from_email,
-                    'to_email': to_email,
-                    'host': host,
-                    'ip': ip,
-                    'subject': subject
-                }
+        opened = open_log(log_path, checkpoints)
     except FileNotFoundError:
-        logging.warning("Arquivo full_subjects.log não encontrado.")
-        return {}
-    return messages
+        return groups, None
+    if opened is None:
+        return groups, None
+    f, offset, cp = opened
+    with f:
+        ranges = _parallel_ranges(f, log_path, offset, active, workers)
+        if ranges:
+            shared = pool or SharedPool(usable_workers(workers))
+            logging.info(f"{log_path}: lendo {len(ranges)} faixas com {shared.workers} processos.")
+            try:
+                for shard_groups in shared.get().imap_unordered(_scan_mail_range,
+                                                                [(log_path, start, end) for start, end in ranges]):
+                    merge_flags(groups, shard_groups)
+            finally:
+                if shared is not pool:
+                    shared.close()
+            cp['byte_offset'] = ranges[-1][1]
+            cp['complete'] = not active
+            return groups, cp
+        f.seek(offset)
+        # Mesmo critério de read_complete_lines, mas sem o gerador intermediário: este é o laço mais quente da importação
+        for raw in f:
+            if active and not raw.endswith(b'\n'):
+                break
+            offset += len(raw)
+            hit = classify_mail_line(raw)
+            if hit:
+                msg_id, flag = hit
+                groups[msg_id] = groups.get(msg_id, 0) | flag
+    cp['byte_offset'] = offset
+    cp['complete'] = not active
+    return groups, cp
 
-def list_log_files(log_dir: str):
-    """Retorna apenas o arquivo mail.log, se existir."""
-    log_path = os.path.join(log_dir, 'mail.log')
+def list_log_files(log_dir: str, base_name: str = 'mail.log'):
+    """
+    Retorna o log `base_name` e seus rotacionados (base.1, base.2.gz, base-AAAAMMDD.bz2...),
+    do mais antigo para o mais novo; o log ativo, se existir, é sempre o último.
+    """
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return []
+    rotated = []
+    for name in names:
+        if not name.startswith(base_name) or name == base_name:
+            continue
+        m = ROTATED_SUFFIX_RE.match(name[len(base_name):])
+        if not m:
+            continue
+        number, date, _ = m.groups()
+        # base.N: quanto maior N, mais antigo; base-AAAAMMDD: ordem cronológica
+        rotated.append(((0, -int(number), '') if number else (1, 0, date), name))
+    files = [os.path.join(log_dir, name) for _, name in sorted(rotated)]
+    log_path = os.path.join(log_dir, base_name)
     if os.path.exists(log_path):
-        return [log_path]
-    return []
+        files.append(log_path)
+    return files
 
-def parse_log(log_dir, db_host, db_user, db_password, db_name, db_port=3306):
+def parse_log(log_dir, db_host, db_user, db_password, db_name, db_port=3306, state=None, workers=1):
     """
     Importa dados principais (incluindo from, to e subject) do full_subjects.log e confirma status/Completed do mail.log.
     Importa por ID apenas quando:
@@ -82,107 +442,126 @@ def parse_log(log_dir, db_host, db_user, db_password, db_name, db_port=3306):
       - Tem pelo menos uma linha de resultado de envio (=>, -> para sent; ** para rejected) no mail.log
       - Tem linha 'Completed' do mesmo ID no mail.log
     Status agregado: 'rejected' se houver qualquer reject; senão 'sent'.
-    Verifica se o message_id já existe no DB; se sim, ignora o ID.
+    IDs que já existem no DB são descartados por insert_database, lote a lote.
     NÃO modifica, grava, renomeia ou apaga os arquivos.
     Gera apenas um registro por ID.
+    É um gerador: os registros (tuplas na ordem das colunas de email_logs) são produzidos um a um,
+    para serem gravados em lotes por insert_database sem acumular a importação inteira em memória.
+    Lê apenas os bytes novos desde o último checkpoint de cada arquivo, incluindo os rotacionados
+    pelo logrotate (.gz/.bz2 lidos em streaming); rotacionados já lidos por completo são ignorados.
+    Com workers > 1, trechos grandes de bytes novos (ex.: carga inicial) são lidos em paralelo, num
+    pool de processos aberto uma vez por importação e limitado às CPUs disponíveis.
+    IDs ainda sem resultado ficam na tabela pending_messages e são cruzados apenas com as linhas
+    novas nas execuções seguintes, de modo que a memória usada depende das mensagens em trânsito
+    e não do tamanho dos logs.
+    Se `state` for informado, recebe os checkpoints ('checkpoints') e as alterações de pendências
+    ('pending_upserts', 'pending_deletes') a serem gravados por insert_database após o último lote,
+    além dos totais 'imported' e 'pending'. O estado só fica completo quando o gerador se esgota;
+    durante a leitura, 'phase', 'file' e 'messages' indicam o progresso (ex.: para /import_status).
     """
-    records = []
-    imported_ids = set()
-    pending_ids = set()
-
-    # Parseia full_subjects.log para dados principais
-    full_path = os.path.join(log_dir, 'full_subjects.log')
-    messages = parse_full_subjects(full_path)
-    if not messages:
-        logging.warning("Nenhum dado válido encontrado em full_subjects.log.")
-        return records, pending_ids, imported_ids
+    if state is None:
+        state = {}
+    state['checkpoints'] = []
+    state['pending_upserts'] = []
+    state['pending_deletes'] = []
+    state['imported'] = 0
+    state['pending'] = 0
+    state['messages'] = 0
+    state['phase'] = 'mail.log'
 
-    logging.info(f"{len(messages)} IDs encontrados em full_subjects.log.")
+    try:
+        checkpoints = load_checkpoints(db_host, db_user, db_password, db_name, db_port)
+        pending = load_pending(db_host, db_user, db_password, db_name, db_port)
+    except Exception as e:
+        # Sem checkpoint/pendências não há como garantir leitura incremental; aborta em vez de reimportar tudo
+        logging.error(f"Erro ao carregar o estado da importação: {e}")
+        raise
 
-    # Parseia mail.log para status e Completed
-    all_logs = list_log_files(log_dir)
+    # Parseia mail.log (e rotacionados) para status e Completed. É lido ANTES do full_subjects.log:
+    # como a linha do full_subjects é gravada no recebimento da mensagem, todo ID visto aqui já tem
+    # sua linha de assunto escrita quando o full_subjects.log for lido em seguida. Assim, flags de
+    # IDs que não estão nem nas pendências nem no full_subjects podem ser descartadas.
+    all_logs = list_log_files(log_dir, 'mail.log')
     if not all_logs:
         logging.warning("Arquivo mail.log não encontrado em LOG_DIR.")
-        return records, pending_ids, imported_ids
+        return
 
-    groups = {}  # msg_id -> {'has_delivery': bool, 'has_reject': bool, 'completed': bool}
+    # Um só pool de processos para todos os arquivos da importação (aberto só se algum for lido em paralelo)
+    pool = SharedPool(usable_workers(workers))
+    try:
+        groups = {}  # msg_id -> flags (bitmask) das linhas novas
+        active_mail = os.path.join(log_dir, 'mail.log')
+        for number, log_path in enumerate(all_logs, 1):
+            state['file'] = f"{os.path.basename(log_path)} ({number}/{len(all_logs)})"
+            log_groups, cp = scan_mail_log(log_path, checkpoints, active=log_path == active_mail, workers=workers,
+                                           pool=pool)
+            if cp is None:
+                continue
+            merge_flags(groups, log_groups)
+            state['checkpoints'].append(cp)
 
-    for log_path in all_logs:
-        try:
-            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
-                for raw in f:
-                    line = raw.rstrip('\n').rstrip('\r')
-                    if not line.strip():
-                        continue
-                    dtm = DATE_TIME_RE.match(line)
-                    if not dtm:
-                        continue
-                    idm = EXIM_ID_RE.search(line)
-                    if not idm:
-                        continue
-                    msg_id = idm.group(1)
-                    kind = 'other'
-                    if ' ** ' in line:
-                        kind = 'reject'
-                    elif ' => ' in line or ' -> ' in line:
-                        kind = 'delivery'
-                    elif COMPLETED_RE.search(line):
-                        kind = 'completed'
-                    if kind == 'other':
-                        continue
-                    groups.setdefault(msg_id, {'has_delivery': False, 'has_reject': False, 'completed': False})
-                    if kind == 'completed':
-                        groups[msg_id]['completed'] = True
-                    elif kind == 'delivery':
-                        groups[msg_id]['has_delivery'] = True
-                    elif kind == 'reject':
-                        groups[msg_id]['has_reject'] = True
-        except FileNotFoundError:
-            continue
+        # Parseia full_subjects.log (e rotacionados) para dados principais, em streaming: cada mensagem
+        # nova é resolvida assim que lida, e as pendências anteriores não revistas são resolvidas ao final
+        logging.info(f"{len(groups)} IDs com linhas novas no mail.log, {len(pending)} pendentes de execuções anteriores.")
+        expire_before = datetime.now() - timedelta(days=PENDING_RETENTION_DAYS)
+        total = 0
+        active_full = os.path.join(log_dir, 'full_subjects.log')
+        state['phase'] = 'full_subjects.log'
+        full_logs = list_log_files(log_dir, 'full_subjects.log')
+        for number, full_path in enumerate(full_logs, 1):
+            state['file'] = f"{os.path.basename(full_path)} ({number}/{len(full_logs)})"
+            messages, cp = parse_full_subjects(full_path, checkpoints, active=full_path == active_full,
+                                               workers=workers, pool=pool)
+            if cp is None:
+                continue
+            for msg_id, details in messages:
+                total += 1
+                state['messages'] = total
+                record = resolve_message(msg_id, details, pending.pop(msg_id, None), groups, state, expire_before)
+                if record:
+                    yield record
+            state['checkpoints'].append(cp)
+    finally:
+        pool.close()
 
-    # Verificação de existência no DB (em batch)
-    if messages:
-        try:
-            conn = get_conn(db_host, db_user, db_password, db_name, db_port)
-            cur = conn.cursor()
-            ids = list(messages.keys())
-            placeholders = ','.join(['%s'] * len(ids))
-            cur.execute(f"SELECT DISTINCT message_id FROM email_logs WHERE message_id IN ({placeholders})", ids)
-            existing_ids = set(row[0] for row in cur.fetchall())
-            cur.close()
-            conn.close()
-        except Exception as e:
-            logging.error(f"Erro ao verificar IDs existentes no DB: {e}")
-            existing_ids = set()
-    else:
-        existing_ids = set()
-
-    # Consolidação por ID com critérios
-    for msg_id, details in messages.items():
-        if msg_id in existing_ids:
-            logging.debug(f"ID {msg_id} já existe no DB; ignorando.")
-            continue
-        if msg_id not in groups or not groups[msg_id]['completed']:
-            pending_ids.add(msg_id)
-            logging.info(f"ID pendente {msg_id}: sem Completed no mail.log.")
-            continue
-        has_result = groups[msg_id]['has_delivery'] or groups[msg_id]['has_reject']
-        if not has_result:
-            pending_ids.add(msg_id)
-            logging.info(f"ID pendente {msg_id}: sem resultado de envio (delivery ou reject).")
-            continue
-        status = 'rejected' if groups[msg_id]['has_reject'] else 'sent'
-        log_date = details['log_date']
-        log_time = details['log_time']
-        from_email = details['from_email']
-        to_email = details['to_email']
-        host = details['host']
-        ip = details['ip']
-        subject = details['subject']
-        records.append((msg_id, log_date, log_time, from_email, to_email, status, host, ip, subject))
-        imported_ids.add(msg_id)
+    state['phase'] = 'pendentes'
+    state['file'] = None
+    for msg_id, details in pending.items():
+        total += 1
+        state['messages'] = total
+        record = resolve_message(msg_id, details, details, groups, state, expire_before)
+        if record:
+            yield record
 
     logging.info(
-        f"Resumo: IDs total={len(messages)}, importados={len(imported_ids)}, pendentes={len(pending_ids)}, registros={len(records)}"
+        f"Resumo: IDs total={total}, importados={state['imported']}, pendentes={state['pending']}"
     )
-    return records, pending_ids, imported_ids
\ No newline at end of file
+
+def resolve_message(msg_id, details, previous, groups, state, expire_before):
+    """
+    Cruza uma mensagem do full_subjects.log (ou pendente, `previous`) com as flags do mail.log.
+    Retorna o registro a importar, ou None se a mensagem segue pendente (ou expirou),
+    registrando em `state` as alterações de pendências.
+    """
+    flags = groups.get(msg_id, 0) | (previous['flags'] if previous else 0)
+    if not flags & FLAG_COMPLETED or not flags & (FLAG_DELIVERY | FLAG_REJECT):
+        first_seen = previous['first_seen'] if previous else None
+        if first_seen and first_seen < expire_before:
+            logging.warning(f"ID {msg_id} pendente desde {first_seen}; descartando.")
+            state['pending_deletes'].append(msg_id)
+            return None
+        state['pending'] += 1
+        if not flags & FLAG_COMPLETED:
+            logging.info(f"ID pendente {msg_id}: sem Completed no mail.log.")
+        else:
+            logging.info(f"ID pendente {msg_id}: sem resultado de envio (delivery ou reject).")
+        if not previous or previous['flags'] != flags:
+            details['flags'] = flags
+            state['pending_upserts'].append((msg_id, details))
+        return None
+    status = 'rejected' if flags & FLAG_REJECT else 'sent'
+    if previous:
+        state['pending_deletes'].append(msg_id)
+    state['imported'] += 1
+    return (msg_id, details['log_date'], details['log_time'], details['from_email'], details['to_email'],
+            status, details['host'], details['ip'], details['subject'])
@@ -0,0 +1,170 @@
+"""
+Cache de resultados das consultas de relatório, invalidado pela geração de importação.
+
+A geração é um contador incrementado (bump_generation) sempre que email_logs muda: a cada lote
+gravado por insert_database, na carga histórica e na retenção de partições. Uma entrada só vale
+para a geração em que foi gravada, então, entre duas importações, consultas idênticas (ex.: o auto
+refresh do relatório) são respondidas sem ir ao MySQL.
+
+Modos (REPORT_CACHE):
+  memory  LRU no próprio processo (padrão); a geração é a do processo, onde roda a importação
+  shared  arquivo SQLite local (REPORT_CACHE_PATH), compartilhado por processos da mesma máquina,
+          incluindo a geração, que pode ser incrementada por outro processo (ex.: backfill.py)
+  off     sem cache
+"""
+import logging
+import os
+import pickle
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MODE = 'memory'
+CACHE_SIZE = 256  # entradas no máximo; as menos usadas recentemente saem primeiro
+# /dev/shm, quando existe, mantém o arquivo compartilhado em memória
+CACHE_PATH = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'smtp_report_cache.sqlite')
+
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)  # avisado a cada bump_generation (modos memory e off)
+_generation = 0
+# Identifica esta sequência de gerações: após reiniciar o processo (ou recriar o arquivo compartilhado)
+# a contagem recomeça do zero, e a época impede que uma geração antiga seja tomada pela nova
+_epoch = random.getrandbits(48)
+_entries = OrderedDict()  # chave -> (geração, valor), a mais recente no fim
+_local = threading.local()
+
+def configure_cache(mode=CACHE_MODE, size=CACHE_SIZE, path=None):
+    """Define modo, tamanho e arquivo do cache (vazio: o padrão CACHE_PATH) antes do primeiro uso."""
+    global CACHE_MODE, CACHE_SIZE, CACHE_PATH
+    CACHE_MODE, CACHE_SIZE, CACHE_PATH = mode, size, path or CACHE_PATH
+
+def _shared():
+    """Conexão SQLite da thread atual com o arquivo compartilhado (criado na primeira vez)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != CACHE_PATH:
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('epoch', ?)", (random.getrandbits(48),))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, generation INTEGER NOT NULL, value BLOB NOT NULL, used_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_used_at ON entries (used_at)")
+        _local.conn, _local.path = conn, CACHE_PATH
+    return conn
+
+def ingest_generation():
+    """Geração atual da importação, ou None se o arquivo compartilhado não pode ser lido (sem cache nesse caso)."""
+    if CACHE_MODE == 'shared':
+        try:
+            return _shared().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+        except sqlite3.Error as e:
+            logging.warning(f"Erro ao ler a geração do cache de relatórios: {e}")
+            return None
+    return _generation
+
+def generation_tag():
+    """Época e geração atuais em texto (ex.: para ETags): muda sempre que email_logs muda."""
+    if CACHE_MODE == 'shared':
+        try:
+            meta = dict(_shared().execute("SELECT name, value FROM meta").fetchall())
+            return f"{meta['epoch']:x}.{meta['generation']}"
+        except sqlite3.Error as e:
+            logging.warning(f"Erro ao ler a geração do cache de relatórios: {e}")
+            # Sem a geração, um valor único: nenhuma requisição condicional casa com ele
+            return f"{random.getrandbits(48):x}.x"
+    return f"{_epoch:x}.{_generation}"
+
+def bump_generation():
+    """Marca que email_logs mudou: as entradas gravadas até aqui deixam de valer."""
+    global _generation
+    try:
+        if CACHE_MODE == 'shared':
+            conn = _shared()
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            conn.execute("DELETE FROM entries WHERE generation < (SELECT value FROM meta WHERE name = 'generation')")
+            return
+        with _lock:
+            _generation += 1
+            _entries.clear()
+            _changed.notify_all()
+    except sqlite3.Error as e:
+        # Sem o incremento o cache poderia servir dados antigos: desliga-o neste processo
+        logging.error(f"Erro ao atualizar a geração do cache de relatórios ({e}); cache desativado.")
+        configure_cache('off', CACHE_SIZE, CACHE_PATH)
+
+def wait_generation(tag, timeout, poll_seconds=1):
+    """
+    Espera até generation_tag() ser diferente de `tag` ou passar `timeout` segundos; retorna a tag
+    atual. No modo shared, em que outro processo pode incrementar a geração, consulta o arquivo a
+    cada `poll_seconds`.
+    """
+    deadline = time.monotonic() + timeout
+    if CACHE_MODE != 'shared':
+        with _changed:
+            _changed.wait_for(lambda: generation_tag() != tag, timeout)
+            return generation_tag()
+    current = generation_tag()
+    while current == tag and time.monotonic() < deadline:
+        time.sleep(min(poll_seconds, max(deadline - time.monotonic(), 0)))
+        current = generation_tag()
+    return current
+
+def cache_get(key, generation):
+    """
+    Valor guardado para `key` na geração `generation` (de ingest_generation, lida no início da
+    requisição), ou None. Com `generation` None a requisição segue sem cache.
+    """
+    if CACHE_MODE == 'off' or generation is None:
+        return None
+    try:
+        if CACHE_MODE == 'shared':
+            conn = _shared()
+            row = conn.execute("SELECT value FROM entries WHERE key = ? AND generation = ?",
+                               (key, generation)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+            return pickle.loads(row[0])
+        with _lock:
+            entry = _entries.get(key)
+            if not entry or entry[0] != generation:
+                return None
+            _entries.move_to_end(key)
+            return entry[1]
+    except (sqlite3.Error, pickle.PickleError) as e:
+        logging.warning(f"Erro ao ler o cache de relatórios: {e}")
+        return None
+
+def cache_put(key, value, generation):
+    """
+    Guarda `value` para `key` na geração `generation`, lida ANTES da consulta: se uma importação
+    terminar durante a consulta, a entrada já nasce vencida em vez de guardar dados antigos.
+    Com `generation` None (geração ilegível) nada é guardado.
+    """
+    if CACHE_MODE == 'off' or generation is None:
+        return
+    try:
+        if CACHE_MODE == 'shared':
+            conn = _shared()
+            conn.execute("INSERT OR REPLACE INTO entries (key, generation, value, used_at) VALUES (?, ?, ?, ?)",
+                         (key, generation, pickle.dumps(value), time.time()))
+            conn.execute("DELETE FROM entries WHERE key IN "
+                         "(SELECT key FROM entries ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (CACHE_SIZE,))
+            return
+        with _lock:
+            if generation != _generation:
+                return
+            _entries[key] = (generation, value)
+            _entries.move_to_end(key)
+            while len(_entries) > CACHE_SIZE:
+                _entries.popitem(last=False)
+    except (sqlite3.Error, pickle.PickleError) as e:
+        logging.warning(f"Erro ao gravar no cache de relatórios: {e}")
@@ -1,23 +1,258 @@
 import schedule
 import time
 import logging
+import os
+import select
+import json
+import threading
+import uuid
+import ctypes
+import ctypes.util
 from log_parser import parse_log
-from database import insert_database
+from database import (get_conn, insert_database, maintain_partitions, acquire_import_lock, release_import_lock,
+                      take_import_request, save_import_status)
 
-def update_job(log_dir, db_host, db_user, db_password, db_name, db_port=3306):
-    records, pending_ids, imported_ids = parse_log(log_dir, db_host, db_user, db_password, db_name, db_port)
-    return insert_database(records, db_host, db_user, db_password, db_name, db_port)
+# Importação em andamento (ou a última concluída); só uma roda por vez no processo, e a trava
+# acquire_import_lock garante o mesmo entre processos
+import_lock = threading.Lock()
+import_job = None
 
-def run_scheduler(schedule_type, schedule_interval_minutes, schedule_time, log_dir, db_host, db_user, db_password, db_name, db_port=3306):
+def _run_import(job, log_dir, db_host, db_user, db_password, db_name, db_port, batch_size, workers):
+    state = job['state']
     try:
+        lock_conn = acquire_import_lock(db_host, db_user, db_password, db_name, db_port)
+        if lock_conn is None:
+            logging.warning("Outra importação está em andamento (trava no banco); esta foi ignorada.")
+            state['phase'] = 'ocupada'
+            job['result'] = False
+            return
+        try:
+            records = parse_log(log_dir, db_host, db_user, db_password, db_name, db_port, state=state, workers=workers)
+            job['result'] = insert_database(records, db_host, db_user, db_password, db_name, db_port,
+                                            state=state, batch_size=batch_size)
+        finally:
+            release_import_lock(lock_conn)
+        state['phase'] = 'concluída'
+    except Exception as e:
+        logging.error(f"Erro na importação: {e}")
+        state['phase'] = 'erro'
+        job['error'] = str(e)
+        job['result'] = False
+    finally:
+        job['finished_at'] = time.time()
+        job['done'].set()
+
+def start_import(log_dir, db_host, db_user, db_password, db_name, db_port=3306, batch_size=1000, workers=1,
+                 trigger='manual'):
+    """
+    Inicia a importação numa thread e retorna (job, iniciada). Se já houver uma em andamento, não
+    inicia outra: retorna a mesma (iniciada=False), que o chamador pode acompanhar ou esperar.
+    """
+    global import_job
+    with import_lock:
+        if import_job and not import_job['done'].is_set():
+            import_job['joined'] += 1
+            return import_job, False
+        import_job = {'id': uuid.uuid4().hex, 'trigger': trigger, 'started_at': time.time(), 'finished_at': None,
+                      'state': {'phase': 'iniciando'}, 'result': None, 'error': None, 'joined': 0,
+                      'done': threading.Event()}
+        job = import_job
+    threading.Thread(target=_run_import, args=(job, log_dir, db_host, db_user, db_password, db_name, db_port,
+                                               batch_size, workers), daemon=True).start()
+    return job, True
+
+def import_status():
+    """Situação da importação em andamento ou da última concluída (None se nenhuma rodou), pronta para JSON."""
+    with import_lock:
+        job = import_job
+    if job is None:
+        return None
+    state = job['state']
+    finished = job['finished_at']
+    return {
+        'id': job['id'],
+        'trigger': job['trigger'],
+        'running': not job['done'].is_set(),
+        'phase': state.get('phase'),
+        'file': state.get('file'),
+        'messages': state.get('messages', 0),
+        'records': state.get('imported', 0),
+        'pending': state.get('pending', 0),
+        'inserted': state.get('inserted', 0),
+        'result': job['result'],
+        'error': job['error'],
+        'joined': job['joined'],
+        'started_at': job['started_at'],
+        'finished_at': finished,
+        'elapsed': round((finished or time.time()) - job['started_at'], 1),
+    }
+
+def update_job(log_dir, db_host, db_user, db_password, db_name, db_port=3306, batch_size=1000, workers=1,
+               trigger='agendada'):
+    """Importação síncrona (agendador, modo follow, carga inicial); com uma já em andamento, espera por ela."""
+    job, _ = start_import(log_dir, db_host, db_user, db_password, db_name, db_port, batch_size, workers, trigger)
+    job['done'].wait()
+    return job['result']
+
+# Worker separado (INGEST_MODE=separate): intervalo de verificação dos pedidos da web e de publicação do progresso
+IMPORT_CONTROL_POLL_SECONDS = 2
+
+def run_import_control(log_dir, db_host, db_user, db_password, db_name, db_port=3306, batch_size=1000, workers=1):
+    """
+    Laço do worker de importação: atende os pedidos do botão "Importar" (import_control.requested_at)
+    e publica import_status() em import_control sempre que muda, para as páginas dos processos da web.
+    """
+    published = None
+    while True:
+        conn = None
+        try:
+            conn = get_conn(db_host, db_user, db_password, db_name, db_port)
+            if take_import_request(conn):
+                start_import(log_dir, db_host, db_user, db_password, db_name, db_port, batch_size, workers, 'manual')
+            status = import_status()
+            # Sem importação neste processo ainda, fica o que já está publicado
+            status = json.dumps(status) if status else None
+            if status is not None and status != published:
+                save_import_status(conn, status)
+                published = status
+        except Exception as e:
+            logging.error(f"Erro ao atender os pedidos de importação: {e}")
+        finally:
+            if conn:
+                conn.close()
+        time.sleep(IMPORT_CONTROL_POLL_SECONDS)
+
+# Modo follow: arquivos acompanhados em LOG_DIR e intervalo de verificação por stat sem inotify
+FOLLOW_FILES = ('mail.log', 'full_subjects.log')
+FOLLOW_POLL_SECONDS = 1
+# Eventos do inotify (linux/inotify.h): escrita, criação e renomeação (logrotate) no diretório
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+def _inotify_open(log_dir):
+    """Abre um inotify não bloqueante observando LOG_DIR; retorna o descritor ou None se indisponível."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 falhou')
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(log_dir), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch falhou')
+        return fd
+    except (OSError, AttributeError) as e:
+        logging.warning(f"inotify indisponível ({e}); verificando os logs por stat a cada {FOLLOW_POLL_SECONDS}s.")
+        return None
+
+def _wait_changes(fd, timeout):
+    """Espera eventos do inotify por até `timeout` segundos (None = sem limite) e descarta-os; sem inotify, dorme."""
+    if fd is None:
+        time.sleep(FOLLOW_POLL_SECONDS if timeout is None else min(timeout, FOLLOW_POLL_SECONDS))
+        return
+    readable, _, _ = select.select([fd], [], [], timeout)
+    if readable:
+        # Só interessa saber que houve escrita: os bytes novos são medidos por stat
+        try:
+            while os.read(fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+def _log_sizes(log_dir):
+    """(inode, tamanho) dos logs ativos acompanhados; ausentes ficam de fora."""
+    sizes = {}
+    for name in FOLLOW_FILES:
+        try:
+            st = os.stat(os.path.join(log_dir, name))
+        except OSError:
+            continue
+        sizes[name] = (st.st_ino, st.st_size)
+    return sizes
+
+def _new_bytes(before, after):
+    """Bytes escritos entre duas medições de _log_sizes; arquivo novo ou truncado (rotação) conta inteiro."""
+    total = 0
+    for name, (inode, size) in after.items():
+        old_inode, old_size = before.get(name, (None, 0))
+        total += size - old_size if inode == old_inode and size >= old_size else size
+    return total
+
+def run_follow(log_dir, db_host, db_user, db_password, db_name, db_port=3306, batch_size=1000, workers=1,
+               max_latency=5, min_batch_bytes=65536):
+    """
+    Acompanha LOG_DIR (inotify, ou stat a cada FOLLOW_POLL_SECONDS) e importa assim que houver
+    `min_batch_bytes` novos nos logs ou, com menos que isso, `max_latency` segundos após a primeira
+    escrita ainda não importada. Rajadas de escritas viram uma importação só.
+    """
+    fd = _inotify_open(log_dir)
+    logging.info(f"Modo follow em {log_dir}: latência máxima {max_latency}s, lote mínimo {min_batch_bytes} bytes"
+                 f" ({'inotify' if fd is not None else 'stat'}).")
+    imported = _log_sizes(log_dir)
+    first_change = None
+    while True:
+        try:
+            # Sem escrita pendente, espera o próximo evento (revendo por stat a cada minuto, caso algum se perca)
+            timeout = 60 if first_change is None else max(0, first_change + max_latency - time.monotonic())
+            _wait_changes(fd, timeout)
+            current = _log_sizes(log_dir)
+            pending = _new_bytes(imported, current)
+            if not pending:
+                continue
+            if first_change is None:
+                first_change = time.monotonic()
+            if pending < min_batch_bytes and time.monotonic() - first_change < max_latency:
+                continue
+            logging.info(f"Modo follow: {pending} bytes novos nos logs; importando.")
+            # Mede antes de importar: o que for escrito durante a importação dispara a próxima
+            imported = current
+            first_change = None
+            while True:
+                job, started = start_import(log_dir, db_host, db_user, db_password, db_name, db_port, batch_size,
+                                            workers, 'agendada')
+                job['done'].wait()
+                if job['state'].get('phase') == 'ocupada':
+                    # Trava com outro processo (outra instância, worker ou backfill): tenta de novo
+                    # em vez de deixar estes bytes para a próxima escrita
+                    time.sleep(FOLLOW_POLL_SECONDS)
+                    continue
+                if started:
+                    break
+                # A importação em andamento (ex.: botão "Importar") pode ter lido os logs antes destes
+                # bytes; sem outra agora, eles esperariam a próxima escrita
+                logging.info("Modo follow: importação já em andamento concluída; importando de novo os bytes novos.")
+        except Exception as e:
+            logging.error(f"Erro na importação do modo follow: {e}")
+            time.sleep(FOLLOW_POLL_SECONDS)
+
+# Intervalo entre manutenções das partições de email_logs (criação de meses futuros e retenção)
+MAINTENANCE_INTERVAL_SECONDS = 6 * 3600
+
+def run_maintenance(db_host, db_user, db_password, db_name, db_port=3306, retention_months=0, archive=False):
+    """Laço da manutenção das partições; roda ao iniciar e depois a cada MAINTENANCE_INTERVAL_SECONDS."""
+    logging.info(f"Manutenção de partições iniciada (retenção: {retention_months or 'sem limite'} meses, "
+                 f"{'arquivando' if archive else 'removendo'} partições antigas).")
+    while True:
+        maintain_partitions(db_host, db_user, db_password, db_name, db_port, retention_months, archive)
+        time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+def run_scheduler(schedule_type, schedule_interval_minutes, schedule_time, log_dir, db_host, db_user, db_password, db_name, db_port=3306, batch_size=1000, workers=1,
+                  follow_max_latency=5, follow_min_batch_bytes=65536):
+    try:
+        if schedule_type == 'follow':
+            return run_follow(log_dir, db_host, db_user, db_password, db_name, db_port, batch_size, workers,
+                              follow_max_latency, follow_min_batch_bytes)
         if schedule_type == 'minutes':
             schedule.every(schedule_interval_minutes).minutes.do(
-                update_job, log_dir=log_dir, db_host=db_host, db_user=db_user, db_password=db_password, db_name=db_name, db_port=db_port
+                update_job, log_dir=log_dir, db_host=db_host, db_user=db_user, db_password=db_password, db_name=db_name, db_port=db_port, batch_size=batch_size, workers=workers
             )
             logging.info(f"Scheduler configurado: a cada {schedule_interval_minutes} minutos.")
         else:
             schedule.every().day.at(schedule_time).do(
-                update_job, log_dir=log_dir, db_host=db_host, db_user=db_user, db_password=db_password, db_name=db_name, db_port=db_port
+                update_job, log_dir=log_dir, db_host=db_host, db_user=db_user, db_password=db_password, db_name=db_name, db_port=db_port, batch_size=batch_size, workers=workers
             )
             logging.info(f"Scheduler configurado: diariamente às {schedule_time}.")
         
@@ -0,0 +1,43 @@
+import database
+
+
+class FakeCursor:
+    """Simula as tabelas de dicionário (email_addresses/email_hosts) para lookup_ids."""
+
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+
+    def executemany(self, sql, rows):
+        for (value,) in rows:
+            self.table.setdefault(value, len(self.table) + 1)
+
+    def execute(self, sql, params):
+        self.result = [(value, self.table[value]) for value in params if value in self.table]
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return (self.result[0][1],)
+
+
+class FakeConn:
+    def commit(self):
+        pass
+
+
+def test_lookup_ids_keeps_cached_values_when_cache_overflows(monkeypatch):
+    monkeypatch.setattr(database, 'LOOKUP_CACHE_SIZE', 4)
+    monkeypatch.setitem(database._lookup_cache, 'email_hosts', {})
+    cursor = FakeCursor({})
+    conn = FakeConn()
+
+    database.lookup_ids(conn, cursor, 'email_hosts', 'host', ['a', 'b', 'c'])
+    # 'a' e 'b' já estão em cache; 'd' e 'e' fazem o cache passar do limite e ser esvaziado
+    batch = ['a', 'b', 'd', 'e', None]
+    cache = database.lookup_ids(conn, cursor, 'email_hosts', 'host', batch)
+
+    for value in ('a', 'b', 'd', 'e'):
+        assert cache[value] == cursor.table[value]
+    assert 'c' not in cache
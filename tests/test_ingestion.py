@@ -0,0 +1,263 @@
+import copy
+import gzip
+import os
+import shutil
+from datetime import datetime
+
+import pytest
+
+import log_parser
+
+
+def msg_id(n):
+    return f"1v{n:04d}-000000-AB"
+
+
+def subject_line(n):
+    return (f"Message-ID: {msg_id(n)} | Date: Fri, 17 Oct 2025 10:{n // 60 % 60:02d}:{n % 60:02d} -0300 | "
+            f"From: Remetente <sender{n}@origin.example> | To: user{n}@example.com | "
+            f"Origin-Host: app.origin.example | Origin-IP: 10.0.0.{n % 250 + 1} | Subject: Boletim {n} | parte 2\n")
+
+
+def mail_lines(n, completed=True):
+    """Linhas do mail.log de `n`: entrega (ou rejeição, a cada 5) e, se `completed`, o Completed."""
+    arrow = '**' if n % 5 == 0 else '=>'
+    lines = [f"2025-10-17 10:00:00 {msg_id(n)} {arrow} user{n}@example.com R=dnslookup T=remote_smtp\n"]
+    if completed:
+        lines.append(f"2025-10-17 10:00:01 {msg_id(n)} Completed\n")
+    return lines
+
+
+class FakeStore:
+    """log_checkpoints, pending_messages e email_logs como insert_database/save_import_state os gravam."""
+
+    def __init__(self):
+        self.checkpoints = {}
+        self.pending = {}
+        self.rows = {}
+
+    def insert(self, records):
+        # filter_existing descarta IDs já gravados; INSERT IGNORE, chaves repetidas
+        existing = {key[0] for key in self.rows}
+        for record in records:
+            if record[0] not in existing:
+                self.rows.setdefault((record[0], record[4], record[5]), record)
+
+    def save_state(self, state):
+        for cp in state['checkpoints']:
+            if cp['fingerprint_len'] == 0:
+                continue
+            if cp.get('replaces'):
+                self.checkpoints.pop(cp['replaces'], None)
+            self.checkpoints[cp['fingerprint']] = {key: cp[key] for key in (
+                'fingerprint', 'fingerprint_len', 'log_file', 'inode', 'byte_offset', 'complete')}
+        for pending_id in state['pending_deletes']:
+            self.pending.pop(pending_id, None)
+        for pending_id, details in state['pending_upserts']:
+            if pending_id in self.pending:
+                self.pending[pending_id]['flags'] = details['flags']
+            else:
+                self.pending[pending_id] = {**details, 'first_seen': datetime.now()}
+
+    def run(self, log_dir, monkeypatch, save_state=True):
+        """Uma importação: retorna os registros gerados por parse_log; sem `save_state`, simula uma
+        queda depois dos lotes gravados e antes do estado."""
+        monkeypatch.setattr(log_parser, 'load_checkpoints', lambda *args: copy.deepcopy(self.checkpoints))
+        monkeypatch.setattr(log_parser, 'load_pending', lambda *args: copy.deepcopy(self.pending))
+        state = {}
+        records = list(log_parser.parse_log(str(log_dir), 'host', 'user', 'password', 'db', state=state))
+        self.insert(records)
+        if save_state:
+            self.save_state(state)
+        return records
+
+
+def write(path, text, mode='w'):
+    with open(path, mode, encoding='utf-8') as f:
+        f.write(text)
+
+
+def one_shot(tmp_path, monkeypatch, full_subjects, mail_log):
+    """Resultado de uma importação única dos conteúdos completos, num diretório próprio."""
+    log_dir = tmp_path / 'one_shot'
+    log_dir.mkdir()
+    write(log_dir / 'full_subjects.log', full_subjects)
+    write(log_dir / 'mail.log', mail_log)
+    store = FakeStore()
+    store.run(log_dir, monkeypatch)
+    return store
+
+
+def build_steps(steps, per_step):
+    """
+    Conteúdo de full_subjects.log e mail.log liberado em `steps` etapas: cada mensagem tem a linha
+    de assunto e o resultado na sua etapa; a cada 3 mensagens o Completed só chega na etapa seguinte
+    (pendente entre execuções).
+    """
+    subjects, mails = [], []
+    for step in range(steps):
+        subjects.append(''.join(subject_line(n) for n in range(step * per_step, (step + 1) * per_step)))
+        lines = []
+        for n in range(step * per_step, (step + 1) * per_step):
+            lines += mail_lines(n, completed=n % 3 != 0)
+        lines += [f"2025-10-17 10:00:02 {msg_id(n)} Completed\n"
+                  for n in range((step - 1) * per_step, step * per_step) if n >= 0 and n % 3 == 0]
+        mails.append(''.join(lines))
+    return subjects, mails
+
+
+def checkpoint_view(store, log_dir):
+    return {(os.path.basename(cp['log_file']), cp['byte_offset'], cp['complete'], cp['fingerprint'])
+            for cp in store.checkpoints.values() if os.path.dirname(cp['log_file']) == str(log_dir)}
+
+
+def test_appends_across_runs_match_one_shot(tmp_path, monkeypatch):
+    subjects, mails = build_steps(steps=6, per_step=7)
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    store = FakeStore()
+    full_text, mail_text = '', ''
+    for step in range(len(subjects)):
+        full_text += subjects[step]
+        mail_text += mails[step]
+        # O Exim está no meio de uma linha de cada arquivo: ela fica para a próxima execução
+        tail_full = subjects[step + 1][:25] if step + 1 < len(subjects) else ''
+        tail_mail = mails[step + 1][:30] if step + 1 < len(mails) else ''
+        write(log_dir / 'full_subjects.log', full_text + tail_full)
+        write(log_dir / 'mail.log', mail_text + tail_mail)
+        store.run(log_dir, monkeypatch)
+
+    expected = one_shot(tmp_path, monkeypatch, full_text, mail_text)
+    assert store.rows == expected.rows
+    assert set(store.pending) == set(expected.pending)
+    # Os checkpoints apontam para o fim dos arquivos, como na importação única
+    shot_dir = tmp_path / 'one_shot'
+    assert ({(name, offset, complete) for name, offset, complete, _ in checkpoint_view(store, log_dir)}
+            == {(name, offset, complete) for name, offset, complete, _ in checkpoint_view(expected, shot_dir)})
+    assert {cp['byte_offset'] for cp in store.checkpoints.values()} == {len(full_text.encode()),
+                                                                         len(mail_text.encode())}
+
+
+def test_partial_last_line_waits_for_newline(tmp_path, monkeypatch):
+    log_dir = tmp_path
+    write(log_dir / 'full_subjects.log', subject_line(1))
+    complete_mail = ''.join(mail_lines(1))
+    write(log_dir / 'mail.log', complete_mail[:-1])
+    store = FakeStore()
+
+    assert store.run(log_dir, monkeypatch) == []
+    assert set(store.pending) == {msg_id(1)}
+    mail_cp = next(cp for cp in store.checkpoints.values() if cp['log_file'].endswith('mail.log'))
+    assert mail_cp['byte_offset'] == len(mail_lines(1)[0])
+
+    write(log_dir / 'mail.log', complete_mail)
+    records = store.run(log_dir, monkeypatch)
+    assert [record[0] for record in records] == [msg_id(1)]
+    assert store.pending == {}
+
+
+def test_interrupted_run_is_imported_exactly_once(tmp_path, monkeypatch):
+    subjects, mails = build_steps(steps=2, per_step=10)
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    write(log_dir / 'full_subjects.log', subjects[0])
+    write(log_dir / 'mail.log', mails[0])
+    store = FakeStore()
+    store.run(log_dir, monkeypatch)
+
+    write(log_dir / 'full_subjects.log', subjects[1], 'a')
+    write(log_dir / 'mail.log', mails[1], 'a')
+    # Lotes gravados, estado não: a próxima execução relê os mesmos bytes
+    interrupted = store.run(log_dir, monkeypatch, save_state=False)
+    assert interrupted
+    retried = store.run(log_dir, monkeypatch)
+    assert [record[0] for record in retried] == [record[0] for record in interrupted]
+
+    expected = one_shot(tmp_path, monkeypatch, ''.join(subjects), ''.join(mails))
+    assert store.rows == expected.rows
+    assert len(store.rows) == len({key[0] for key in store.rows})
+    assert set(store.pending) == set(expected.pending)
+    # Nada novo: nenhuma mensagem é gerada de novo
+    assert store.run(log_dir, monkeypatch) == []
+
+
+@pytest.mark.parametrize('replace', ['truncate', 'new_inode'])
+def test_truncated_or_replaced_log_restarts_from_zero(tmp_path, monkeypatch, replace):
+    log_dir = tmp_path
+    write(log_dir / 'full_subjects.log', ''.join(subject_line(n) for n in range(20)))
+    write(log_dir / 'mail.log', ''.join(line for n in range(20) for line in mail_lines(n)))
+    store = FakeStore()
+    store.run(log_dir, monkeypatch)
+    inodes = {name: os.stat(log_dir / name).st_ino for name in ('full_subjects.log', 'mail.log')}
+
+    if replace == 'truncate':
+        # copytruncate seguido de novas linhas: o início (fingerprint) confere, mas o arquivo ficou
+        # menor que o checkpoint
+        full = ''.join(subject_line(n) for n in range(20)[:12]) + subject_line(100)
+        mail = ''.join(line for n in range(12) for line in mail_lines(n)) + ''.join(mail_lines(100))
+        for name, text in (('full_subjects.log', full), ('mail.log', mail)):
+            with open(log_dir / name, 'r+', encoding='utf-8') as f:
+                f.truncate(0)
+                f.write(text)
+    else:
+        # Arquivo novo (outro inode e outro conteúdo): o fingerprint não confere
+        for name, text in (('full_subjects.log', subject_line(100)), ('mail.log', ''.join(mail_lines(100)))):
+            write(log_dir / f"{name}.new", text)
+            os.replace(log_dir / f"{name}.new", log_dir / name)
+        assert os.stat(log_dir / 'mail.log').st_ino != inodes['mail.log']
+
+    records = store.run(log_dir, monkeypatch)
+    assert msg_id(100) in [record[0] for record in records]
+    assert (msg_id(100), 'user100@example.com', 'rejected') in store.rows
+    assert len(store.rows) == 21
+    # O checkpoint do conteúdo atual aponta para o fim do arquivo
+    offsets = {(os.path.basename(cp['log_file']), cp['byte_offset']) for cp in store.checkpoints.values()}
+    for name in ('full_subjects.log', 'mail.log'):
+        assert (name, os.path.getsize(log_dir / name)) in offsets
+
+
+def test_rotation_to_numbered_and_compressed_files(tmp_path, monkeypatch):
+    subjects, mails = build_steps(steps=3, per_step=8)
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+    store = FakeStore()
+    write(log_dir / 'full_subjects.log', subjects[0])
+    write(log_dir / 'mail.log', mails[0])
+    store.run(log_dir, monkeypatch)
+
+    # Linhas escritas depois da última leitura e antes da rotação ficam só no .1
+    write(log_dir / 'full_subjects.log', subjects[1], 'a')
+    write(log_dir / 'mail.log', mails[1], 'a')
+    for name in ('full_subjects.log', 'mail.log'):
+        os.rename(log_dir / name, log_dir / f"{name}.1")
+    write(log_dir / 'full_subjects.log', subjects[2])
+    write(log_dir / 'mail.log', mails[2])
+    store.run(log_dir, monkeypatch)
+
+    # Próxima rotação: o .1 vira .2.gz (reconhecido pelo fingerprint) e o ativo vira .1
+    for name in ('full_subjects.log', 'mail.log'):
+        with open(log_dir / f"{name}.1", 'rb') as src, gzip.open(log_dir / f"{name}.2.gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(log_dir / f"{name}.1")
+        os.rename(log_dir / name, log_dir / f"{name}.1")
+        write(log_dir / name, '')
+    assert store.run(log_dir, monkeypatch) == []
+
+    expected = one_shot(tmp_path, monkeypatch, ''.join(subjects), ''.join(mails))
+    assert store.rows == expected.rows
+    assert set(store.pending) == set(expected.pending)
+
+
+def test_pending_ids_are_carried_across_runs(tmp_path, monkeypatch):
+    log_dir = tmp_path
+    write(log_dir / 'full_subjects.log', subject_line(7))
+    write(log_dir / 'mail.log', mail_lines(7, completed=False)[0])
+    store = FakeStore()
+
+    assert store.run(log_dir, monkeypatch) == []
+    assert set(store.pending) == {msg_id(7)}
+    # Só o Completed chega depois; o full_subjects.log não tem linha nova
+    write(log_dir / 'mail.log', f"2025-10-17 10:05:00 {msg_id(7)} Completed\n", 'a')
+    records = store.run(log_dir, monkeypatch)
+    assert [(record[0], record[5]) for record in records] == [(msg_id(7), 'sent')]
+    assert store.pending == {}
@@ -0,0 +1,99 @@
+import sqlite3
+import unicodedata
+from datetime import date, time, timedelta
+
+import pytest
+
+import database
+from live_feed import row_matches
+
+ROWS = [
+    # id, log_date, log_time, to_email, subject, status
+    (1, date(2026, 10, 1), timedelta(hours=9), 'jose@empresa.com.br', 'Relatório mensal', 'sent'),
+    (2, date(2026, 10, 1), timedelta(hours=19), 'JOSÉ@Empresa.com.br', 'RELATORIO Mensal', 'rejected'),
+    (3, date(2026, 10, 2), timedelta(hours=12), 'maria_silva@gmail.com', 'Desconto de 50% hoje', None),
+    (4, date(2026, 10, 3), timedelta(hours=8), 'mariaXsilva@gmail.com', None, 'rejected'),
+    (5, date(2026, 9, 30), timedelta(hours=12), 'ana@gmail.com.br', 'Ação pendente', 'sent'),
+    (6, date(2026, 10, 2), timedelta(hours=23, minutes=59), None, 'Sem destinatário', 'rejected'),
+    (7, None, None, 'joao@empresa.com', 'Fatura', 'deferred'),
+]
+
+FILTERS = [
+    {},
+    {'start_date': date(2026, 10, 1), 'end_date': date(2026, 10, 2)},
+    {'start_time': time(8, 0), 'end_time': time(12, 0)},
+    {'status_filter': 'failed'},
+    {'search_email': 'jose'},
+    {'search_email': 'JOSÉ@empresa'},
+    {'search_email': '@empresa.com.br'},
+    {'search_email': 'gmail.com'},
+    {'search_email': 'maria_silva'},
+    {'search_email': 'maria_silva', 'search_mode': 'substring'},
+    {'search_email': 'SILVA@', 'search_mode': 'substring'},
+    {'search_email': 'mpresa', 'search_mode': 'substring'},
+    {'search_subject': 'relatorio'},
+    {'search_subject': '50%'},
+    {'search_subject': 'acao', 'search_mode': 'substring'},
+    {'search_subject': 'fatura', 'status_filter': 'failed', 'start_date': date(2026, 1, 1),
+     'end_date': date(2026, 12, 31)},
+]
+
+def _fold(text):
+    # Aproximação da collation utf8mb4_0900_ai_ci, independente da de live_feed
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn').lower()
+
+def _mysql_like(pattern, value):
+    """LIKE do MySQL (escape padrão '\\', sem acentos nem maiúsculas), por programação dinâmica."""
+    if pattern is None or value is None:
+        return None
+    pattern, value = _fold(pattern), _fold(value)
+    tokens = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern):
+            tokens.append(('lit', pattern[i + 1]))
+            i += 2
+            continue
+        tokens.append(('any',) if pattern[i] == '%' else ('one',) if pattern[i] == '_' else ('lit', pattern[i]))
+        i += 1
+    matches = [True] + [False] * len(value)
+    for token in tokens:
+        if token[0] == 'any':
+            for j in range(1, len(value) + 1):
+                matches[j] = matches[j] or matches[j - 1]
+        else:
+            matches = [False] + [matches[j - 1] and (token[0] == 'one' or value[j - 1] == token[1])
+                                 for j in range(1, len(value) + 1)]
+    return matches[-1]
+
+@pytest.fixture
+def sql():
+    conn = sqlite3.connect(':memory:')
+    conn.create_collation('ai_ci', lambda a, b: (_fold(a) > _fold(b)) - (_fold(a) < _fold(b)))
+    conn.create_function('like', 2, _mysql_like)
+    conn.execute("""CREATE TABLE email_logs (id INTEGER, log_date TEXT, log_time TEXT, to_email TEXT COLLATE ai_ci,
+                    to_email_rev TEXT COLLATE ai_ci, subject TEXT COLLATE ai_ci, status TEXT COLLATE ai_ci)""")
+    for row_id, log_date, log_time, to_email, subject, status in ROWS:
+        conn.execute("INSERT INTO email_logs VALUES (?,?,?,?,?,?,?)",
+                     (row_id, log_date and log_date.isoformat(), log_time and f"{log_time.seconds // 3600:02d}:"
+                      f"{log_time.seconds // 60 % 60:02d}:{log_time.seconds % 60:02d}", to_email,
+                      to_email and to_email[::-1], subject, status))
+    return conn
+
+def _sql_param(value):
+    return value.isoformat() if isinstance(value, (date, time)) else value
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_row_matches_agrees_with_report_filters(sql, filters, monkeypatch):
+    # Sem FULLTEXT o assunto é só o LIKE, que é o que decide também com o índice
+    monkeypatch.setattr(database, 'SUBJECT_FULLTEXT', False)
+    filters = {'start_date': None, 'end_date': None, 'start_time': None, 'end_time': None, 'search_email': None,
+               'search_subject': None, 'status_filter': 'all', 'search_mode': 'indexed', **filters}
+    where, params = database.report_filters(filters['start_date'], filters['end_date'], filters['start_time'],
+                                            filters['end_time'], filters['search_email'], filters['search_subject'],
+                                            filters['status_filter'], filters['search_mode'])
+    expected = {row_id for row_id, in sql.execute("SELECT id FROM email_logs" + where.replace('%s', '?'),
+                                                  [_sql_param(p) for p in params])}
+    columns = ('id', 'log_date', 'log_time', 'to_email', 'subject', 'status')
+    matched = {row[0] for row in ROWS if row_matches(dict(zip(columns, row)), filters)}
+    assert matched == expected
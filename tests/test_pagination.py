@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+import database
+
+PER_PAGE = 4
+
+# Muitas linhas com a mesma data e a mesma hora: o desempate é pelo id. Ids fora de ordem
+# em relação a data/hora, para que a ordem não coincida com a de inserção.
+ROWS = [
+    # id, log_date, log_time, status
+    (row_id, f"2026-10-{1 + row_id * 7 % 3:02d}", f"{8 + row_id * 5 % 2:02d}:00:00",
+     'rejected' if row_id % 4 == 0 else 'sent')
+    for row_id in range(1, 24)
+]
+
+@pytest.fixture
+def sql():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE email_logs (id INTEGER, log_date TEXT, log_time TEXT, status TEXT)")
+    conn.executemany("INSERT INTO email_logs VALUES (?,?,?,?)", ROWS)
+    return conn
+
+def read_page(sql, where, params, sort_by, sort_order, page, cursor=None, direction='next'):
+    """Leitura e indicadores de página como em report_page (app.py), sem cache nem contagem."""
+    if not database.REPORT_CURSOR_RE.match(cursor or ''):
+        page = 1
+    seek_where, seek_params, order_by, reverse = database.report_seek(where, params, sort_by, sort_order,
+                                                                      cursor, direction)
+    logs = [dict(row) for row in sql.execute(("SELECT id, log_date, log_time FROM email_logs" + seek_where
+                                              + order_by + " LIMIT %s").replace('%s', '?'),
+                                             seek_params + [PER_PAGE + 1])]
+    has_more = len(logs) > PER_PAGE
+    logs = logs[:PER_PAGE]
+    if reverse:
+        logs = logs[::-1]
+    if not logs or (reverse and not has_more):
+        page = 1
+    has_next = has_more if not reverse else True
+    has_prev = page > 1 and (has_more if reverse else True)
+    return {
+        'ids': [row['id'] for row in logs],
+        'page': page,
+        'next_cursor': database.report_cursor(logs[-1], sort_by) if logs and has_next else None,
+        'prev_cursor': database.report_cursor(logs[0], sort_by) if logs and has_prev else None,
+    }
+
+@pytest.mark.parametrize('status', [None, 'rejected'])
+@pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+@pytest.mark.parametrize('sort_by', ['date', 'time'])
+def test_pages_walk_forward_and_back(sql, sort_by, sort_order, status):
+    where, params = (" WHERE status = %s", [status]) if status else ("", [])
+    column = 2 if sort_by == 'time' else 1
+    rows = [row for row in ROWS if not status or row[3] == status]
+    expected = [row[0] for row in sorted(rows, key=lambda row: (row[column], row[0]), reverse=sort_order == 'desc')]
+
+    # Para frente, da primeira à última página
+    pages = [read_page(sql, where, params, sort_by, sort_order, 1)]
+    assert pages[0]['prev_cursor'] is None
+    # Limite de páginas: um cursor que não avança falha o teste em vez de repetir páginas para sempre
+    while pages[-1]['next_cursor'] and len(pages) <= len(rows):
+        pages.append(read_page(sql, where, params, sort_by, sort_order, pages[-1]['page'] + 1,
+                               pages[-1]['next_cursor'], 'next'))
+    forward = [row_id for page in pages for row_id in page['ids']]
+    assert forward == expected
+    assert len(pages) == (len(rows) + PER_PAGE - 1) // PER_PAGE
+    assert [page['page'] for page in pages] == list(range(1, len(pages) + 1))
+
+    # De volta, da última à primeira: as mesmas páginas, cada linha uma vez
+    back = [pages[-1]]
+    while back[-1]['prev_cursor'] and len(back) <= len(rows):
+        back.append(read_page(sql, where, params, sort_by, sort_order, back[-1]['page'] - 1,
+                              back[-1]['prev_cursor'], 'prev'))
+        assert back[-1]['next_cursor'] is not None
+    assert [page['ids'] for page in back] == [page['ids'] for page in pages[::-1]]
+    assert back[-1]['page'] == 1
+    assert back[-1]['prev_cursor'] is None
+
+def test_invalid_cursor_reads_first_page(sql):
+    first = read_page(sql, "", [], 'date', 'desc', 1)
+    assert read_page(sql, "", [], 'date', 'desc', 5, "2026-10-01_3' OR 1=1", 'prev') == first
@@ -0,0 +1,48 @@
+"""
+Worker de importação para INGEST_MODE=separate: o único processo que lê os logs e grava em email_logs.
+
+Uso, num container próprio (mesma imagem e variáveis de ambiente do app.py, com os logs montados):
+    python worker.py
+
+Prepara o banco (setup_database), roda a manutenção das partições, a importação inicial e o
+agendador (SCHEDULE_TYPE), atende os pedidos do botão "Importar" feitos pela web e publica o
+progresso em import_control. Cada importação concluída incrementa a geração no cache compartilhado
+(REPORT_CACHE=shared), que é como os processos da web (wsgi.py) invalidam o cache e enviam as
+linhas novas aos relatórios ao vivo. Como é um processo à parte, seus limites de CPU e memória
+(e DB_POOL_SIZE, IMPORT_WORKERS) são definidos sem afetar a web.
+"""
+import logging
+import threading
+
+from config import validate_environment_variables
+from database import wait_for_db, configure_pool, setup_database
+from report_cache import configure_cache
+from scheduler import start_import, run_import_control, run_maintenance, run_scheduler
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    env = validate_environment_variables()
+    if env['INGEST_MODE'] != 'separate':
+        # Com embedded o app.py já importa: um worker a mais só disputaria a trava de importação
+        logging.error("worker.py exige INGEST_MODE=separate (com embedded a importação roda no app.py).")
+        raise SystemExit(1)
+    configure_pool(env['DB_POOL_SIZE'], env['DB_POOL_TIMEOUT'], env['DB_POOL_RECYCLE'])
+    configure_cache(env['REPORT_CACHE'], env['REPORT_CACHE_SIZE'], env['REPORT_CACHE_PATH'])
+    db = (env['DB_HOST'], env['DB_USER'], env['DB_PASSWORD'], env['DB_NAME'], env['DB_PORT'])
+
+    wait_for_db(env['DB_HOST'], env['DB_USER'], env['DB_PASSWORD'], env['DB_PORT'])
+    setup_database(env['AUTH_MODE'], *db, env['DB_PARTITIONING'], env['STORAGE_MODE'])
+    if env['DB_PARTITIONING']:
+        threading.Thread(target=run_maintenance, args=(*db, env['RETENTION_MONTHS'], env['RETENTION_MODE'] == 'archive'),
+                         daemon=True).start()
+    threading.Thread(target=run_import_control,
+                     args=(env['LOG_DIR'], *db, env['IMPORT_BATCH_SIZE'], env['IMPORT_WORKERS']), daemon=True).start()
+    start_import(env['LOG_DIR'], *db, env['IMPORT_BATCH_SIZE'], env['IMPORT_WORKERS'], trigger='inicial')
+    logging.info(f"Worker de importação iniciado (SCHEDULE_TYPE={env['SCHEDULE_TYPE']}).")
+    # O agendador roda nesta thread até o processo terminar
+    run_scheduler(env['SCHEDULE_TYPE'], env.get('SCHEDULE_INTERVAL_MINUTES'), env.get('SCHEDULE_TIME'), env['LOG_DIR'],
+                  *db, env['IMPORT_BATCH_SIZE'], env['IMPORT_WORKERS'],
+                  env.get('FOLLOW_MAX_LATENCY_SECONDS', 5), env.get('FOLLOW_MIN_BATCH_BYTES', 65536))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Entrada WSGI só da web, sem importação, para servidores com vários processos (INGEST_MODE=separate).
+
+Uso, com a importação no worker.py:
+    gunicorn --workers 4 --worker-class gthread --threads 32 --bind 0.0.0.0:5000 wsgi:app
+
+Cada processo da web tem sua própria thread de live_feed, que acompanha a geração de importação no
+cache compartilhado (REPORT_CACHE=shared) e envia as linhas novas aos relatórios ao vivo abertos
+nele. Ao iniciar, cada processo lê o esquema de email_logs criado pelo worker.py (detect_schema),
+aguardando a tabela existir. Use workers com threads (gthread): cada relatório ao vivo mantém uma
+thread ocupada. Não use --preload, pois a thread de live_feed não sobrevive ao fork dos workers.
+"""
+import logging
+import threading
+
+from app import app, INGEST_MODE, DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT
+from database import detect_schema
+from live_feed import run_live_feed
+
+if INGEST_MODE != 'separate':
+    # Sem o app.py (__main__) ninguém importaria os logs
+    logging.error("wsgi.py exige INGEST_MODE=separate e o worker.py rodando; com embedded, use python app.py.")
+    raise SystemExit(1)
+
+# setup_database roda só no worker.py; aqui só se lê o esquema (armazenamento compacto, FULLTEXT do assunto)
+detect_schema(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT)
+threading.Thread(target=run_live_feed, args=(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT), daemon=True).start()